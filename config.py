@@ -1,12 +1,54 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
-from typing import Optional
+from typing import List, Optional
 
 class Settings(BaseSettings):
     model: str = "gpt-4.1-mini"
     whisper_model: str = "base"
+    # tiered transcription: re-decode only whisper_model's low-confidence segments with this larger model
+    whisper_refine_model: Optional[str] = None
     log_level: str = "INFO"
+    transcription_cache_max_mb: Optional[int] = 5000
+    transcript_format: str = "store"
+    vad_enabled: bool = True
+    # decode recordings through ffmpeg 30 s at a time, so memory stays flat however long they run
+    stream_decode: bool = False
+    # fingerprint new recordings so re-uploads and re-encodes reuse the first copy's transcript and notes
+    dedup_enabled: bool = True
+    # drop fillers and Whisper's repetition loops from transcripts before the first LLM pass
+    compact_transcripts: bool = True
+    # estimated LLM tokens (both passes, in and out) one run may spend; recordings past it wait for the next run
+    run_token_budget: Optional[int] = None
+    chunk_max_tokens: int = 12000
+    chunk_overlap_tokens: int = 400
+    chunk_concurrency: int = 4
+    # enhance each subtopic in its own concurrent request instead of one long response
+    enhance_fan_out: bool = False
+    enhance_fan_out_concurrency: int = 8
+    # single-file runs stream both LLM passes and print subtopics as they arrive (same as --stream)
+    stream_output: bool = False
+    llm_cache_enabled: bool = True
+    llm_cache_max_mb: Optional[int] = 500
     openai_api_key: Optional[str] = Field(None, env="OPENAI_API_KEY")
+    openai_base_url: Optional[str] = None
+    llm_max_concurrency: int = 8
+    llm_requests_per_minute: int = 500
+    llm_tokens_per_minute: int = 200000
+    llm_max_retries: int = 6
+    assignments_tracker_id: Optional[str] = None
+    # the google_calendar integration's calendar; one named "Lecture Assignments" is created when unset
+    assignments_calendar_id: Optional[str] = None
+    # where finished notes are published, e.g. INTEGRATIONS='["google"]'; see src/integrations/base_integration.py
+    integrations: List[str] = ["google"]
+    metrics_dir: str = "data/metrics"
+    metrics_textfile: Optional[str] = None
+    # `main.py search`: "hashing" needs no model; any other value names a sentence-transformers model
+    search_index_enabled: bool = True
+    search_embedder: str = "hashing"
+    # `main.py serve`: HTTP address, or a Unix socket path that replaces it
+    serve_host: str = "127.0.0.1"
+    serve_port: int = 8765
+    serve_socket: Optional[str] = None
 
     class Config:
         env_file = ".env"
@@ -1,46 +1,40 @@
 import sys
+import json
+import time
 import argparse
 import logging
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, List, Optional
 
+# Only light imports here: config, pydantic, whisper, openai and the Google clients load
+# inside the commands that need them, so --help and argument errors return immediately
+from src.utils.logger import setup_logging, metrics, profiled
+from src.utils.file_utils import AUDIO_EXTENSIONS
 
+if TYPE_CHECKING:
+    from src.core.lecture_processor import LectureProcessor
+    from src.models.lecture_models import DocNotes
 
-from src.core.lecture_processor import LectureProcessor
-from src.models.lecture_models import DocNotes
-from config import Settings
 
+def print_subtopic(number: int, subtopic) -> None:
+    print(f"\n  {number}. {subtopic.title}")
+    print(f"     {subtopic.description}")
+    if subtopic.examples:
+        print(f"     Examples: {', '.join(subtopic.examples)}")
 
-settings = Settings()
-
-
-def setup_logging():
-    #Configure logging for the application
-    logging.basicConfig(
-        level=getattr(logging, settings.log_level.upper()),
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler('agentic_ai.log')
-        ]
-    )
-    return logging.getLogger(__name__)
-
-def display_notes(notes: DocNotes):
-    #Display the processed notes in a formatted way
+def display_notes(notes: "DocNotes", show_subtopics: bool = True):
+    #Display the processed notes in a formatted way; --stream runs have already shown the subtopics
     print("\n" + "="*60)
     print("LECTURE ANALYSIS RESULTS")
     print("="*60)
     
     print(f"\nMain Topic: {notes.main_topic}")
     
-    if notes.sub_topics:
+    if notes.sub_topics and show_subtopics:
         print(f"\n📋 Subtopics ({len(notes.sub_topics)}):")
         for i, subtopic in enumerate(notes.sub_topics, 1):
-            print(f"\n  {i}. {subtopic.title}")
-            print(f"     {subtopic.description}")
-            if subtopic.examples:
-                print(f"     Examples: {', '.join(subtopic.examples)}")
+            print_subtopic(i, subtopic)
     
     if notes.assignments:
         print(f"\nAssignments ({len(notes.assignments)}):")
@@ -57,11 +51,123 @@ def display_notes(notes: DocNotes):
     
     print("\n" + "="*60)
 
-def process_single_file(file_path: str, logger) -> bool:
+class ConsoleStreamPrinter:
+    #NotesListener for --stream: prints draft subtopics as the first pass writes them, then each
+    #enhanced subtopic in order as soon as it and every one before it are done
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._enhanced = {}
+        self.enhanced_printed = 0
+
+    def on_main_topic(self, main_topic: str) -> None:
+        with self._lock:
+            print(f"\nMain Topic: {main_topic}", flush=True)
+            print("\n📝 Draft subtopics:", flush=True)
+
+    def on_subtopic(self, stage: str, index: int, subtopic) -> None:
+        with self._lock:
+            if stage == "extract":
+                print(f"  {index + 1}. {subtopic.title}", flush=True)
+                return
+            if self.enhanced_printed == 0 and not self._enhanced:
+                print("\n📋 Subtopics:", flush=True)
+            self._enhanced[index] = subtopic
+            while self.enhanced_printed in self._enhanced:
+                print_subtopic(self.enhanced_printed + 1, self._enhanced.pop(self.enhanced_printed))
+                self.enhanced_printed += 1
+            sys.stdout.flush()
+
+def report_result(notes: Optional["DocNotes"], logger, streamed: Optional[ConsoleStreamPrinter] = None) -> bool:
+    #Display the outcome of one lecture and return whether it succeeded
+    if notes:
+        display_notes(notes, show_subtopics=not streamed or streamed.enhanced_printed != len(notes.sub_topics))
+        logger.info("Successfully processed lecture!")
+        return True
+    else:
+        logger.error("Failed to process lecture")
+        return False
+
+def find_audio_files(directory: Path) -> List[Path]:
+    return sorted(f for f in directory.iterdir() if f.is_file() and f.suffix.lower() in AUDIO_EXTENSIONS)
+
+
+def show_plan(input_path: Path, processor: "LectureProcessor") -> None:
+    #Print the stages each recording would run, without running them
+    from src.core.manifest import format_plan
+
+    recordings = [input_path] if input_path.is_file() else find_audio_files(input_path)
+    if not recordings:
+        print(f"No audio files found in: {input_path}")
+        return
+    pending = 0
+    for recording in recordings:
+        plan = processor.plan(str(recording))
+        pending += any(reason for _, reason in plan)
+        print(format_plan(str(recording), plan))
+    print(f"\n{pending}/{len(recordings)} recordings have stages to run")
+
+
+def show_token_plan(input_path: Path, processor: "LectureProcessor") -> None:
+    #Print estimated tokens, cost and latency of both LLM passes per recording and for the directory,
+    #without sending anything
+    from src.core.planner import TokenPlanner, format_file_plan, format_directory_plan
+
+    recordings = [input_path] if input_path.is_file() else find_audio_files(input_path)
+    if not recordings:
+        print(f"No audio files found in: {input_path}")
+        return
+    planner = TokenPlanner(processor)
+    plans = []
+    for recording in recordings:
+        plans.append(planner.plan_file(str(recording)))
+        print(format_file_plan(plans[-1]))
+    if input_path.is_dir():
+        print("\n" + format_directory_plan(str(input_path), plans))
+
+
+def apply_token_budget(recordings: List[Path], processor: "LectureProcessor", budget: int, logger) -> List[Path]:
+    #The recordings whose estimated tokens fit in budget, in order; the rest stay stale for a later run
+    from src.core.planner import TokenPlanner
+
+    planner = TokenPlanner(processor)
+    kept = []
+    spent = 0
+    for recording in recordings:
+        plan = planner.plan_file(str(recording))
+        if plan.unplannable:
+            logger.warning(f"Deferring {recording.name}: cannot estimate its tokens ({plan.unplannable})")
+            continue
+        tokens = plan.total_tokens
+        if spent + tokens > budget:
+            logger.warning(f"Deferring {recording.name}: ~{tokens:,} tokens, {budget - spent:,} left in the run budget")
+            continue
+        spent += tokens
+        kept.append(recording)
+    logger.info(f"Token budget: ~{spent:,} of {budget:,} tokens planned for {len(kept)}/{len(recordings)} recordings")
+    return kept
+
+
+def write_run_metrics(logger) -> None:
+    #JSON-lines run report plus a Prometheus textfile for node_exporter's textfile collector
+    from config import settings
+
+    metrics_dir = Path(settings.metrics_dir)
+    report_path = metrics.write_report(metrics_dir / f"run-{metrics.run_id}.jsonl")
+    metrics.write_prometheus(settings.metrics_textfile or metrics_dir / "lecture_processor.prom")
+    summary = metrics.summary()
+    logger.info(f"Run report written to {report_path}: {summary['wall_seconds']:.1f}s wall, "
+                f"RTF {summary['real_time_factor']}, "
+                f"{summary['openai_input_tokens']} tokens in / {summary['openai_output_tokens']} out, "
+                f"{summary['openai_retries']} retries, {summary['google_calls']} Google calls")
+
+def process_single_file(file_path: str, logger, processor: Optional["LectureProcessor"] = None,
+                        flush_publishing: bool = True, stream: bool = False) -> bool:
     #Process a single audio file
     try:
-        # Initialize the processor
-        processor = LectureProcessor()
+        # Initialize the processor unless a warm one is shared by the caller
+        if processor is None:
+            from src.core.lecture_processor import LectureProcessor
+            processor = LectureProcessor()
         
         # Check if file exists
         if not Path(file_path).exists():
@@ -70,58 +176,546 @@ def process_single_file(file_path: str, logger) -> bool:
         
         logger.info(f"Processing: {file_path}")
         
-        # Process the lecture
-        notes = processor.process_lecture(file_path)
-        
-        if notes:
-            display_notes(notes)
-            logger.info("Successfully processed lecture!")
-            return True
-        else:
-            logger.error("Failed to process lecture")
-            return False
+        # Process the lecture, printing notes as they are written when streaming
+        printer = ConsoleStreamPrinter() if stream else None
+        notes = processor.process_lecture(file_path, flush_publishing=flush_publishing, listener=printer)
+        return report_result(notes, logger, printer)
             
     except Exception as e:
         logger.error(f"Error processing file {file_path}: {e}")
         return False
 
-def process_directory(directory_path: str, logger) -> None:
-    #Process all audio files in a directory
+def process_directory(directory_path: str, logger, processor: Optional["LectureProcessor"] = None,
+                      pipeline: bool = False, llm_workers: int = 4, publish_workers: int = 2,
+                      transcribe_workers: int = 1, batch: bool = False, batch_poll_interval: float = 60.0,
+                      token_budget: Optional[int] = None) -> int:
+    #Process all audio files in a directory; returns how many succeeded
     directory = Path(directory_path)
     
     if not directory.exists():
         logger.error(f"Directory not found: {directory_path}")
-        return
-    
-    # Common audio file extensions
-    audio_extensions = {'.mp3', '.wav', '.m4a', '.flac', '.ogg', '.mp4'}
+        return 0
     
-    audio_files = [
-        f for f in directory.iterdir() 
-        if f.is_file() and f.suffix.lower() in audio_extensions
-    ]
+    audio_files = find_audio_files(directory)
     
     if not audio_files:
         logger.warning(f"No audio files found in: {directory_path}")
-        return
+        return 0
     
     logger.info(f"Found {len(audio_files)} audio files to process")
     
+    # One processor (and its resource pool) serves every file in the directory
+    if processor is None:
+        from src.core.lecture_processor import LectureProcessor
+        processor = LectureProcessor()
+    
+    if token_budget is not None:
+        audio_files = apply_token_budget(audio_files, processor, token_budget, logger)
+        if not audio_files:
+            return 0
+    
+    if transcribe_workers > 1:
+        # Transcribe everything up front across processes; later stages find the JSON on disk
+        processor.transcribe_many([str(f) for f in audio_files], workers=transcribe_workers)
+    
     successful = 0
-    for audio_file in audio_files:
-        print(f"\n{'='*40}")
-        print(f"Processing: {audio_file.name}")
-        print(f"{'='*40}")
-        
-        if process_single_file(str(audio_file), logger):
-            successful += 1
-        
-        print("\n" + "-"*40)
+    if batch:
+        # Throughput mode: both LLM passes go through the Batch API; rerun the same command to resume
+        from src.core.batch_runner import BatchRunner
+        finals = BatchRunner(processor, poll_interval=batch_poll_interval).run(directory, audio_files)
+        for audio_file, final_notes in zip(audio_files, finals):
+            print(f"\n{'='*40}")
+            print(f"Processing: {audio_file.name}")
+            print(f"{'='*40}")
+            
+            if report_result(final_notes, logger):
+                successful += 1
+            
+            print("\n" + "-"*40)
+    elif pipeline:
+        # Overlap transcription, LLM calls and publishing; results still arrive in file order
+        from src.core.pipeline import LecturePipeline
+        lecture_pipeline = LecturePipeline(processor, llm_workers=llm_workers, publish_workers=publish_workers)
+        for job in lecture_pipeline.run(audio_files):
+            print(f"\n{'='*40}")
+            print(f"Processing: {job.recording_path.name}")
+            print(f"{'='*40}")
+            
+            if report_result(job.final_notes if job.succeeded else None, logger):
+                successful += 1
+            
+            print("\n" + "-"*40)
+    else:
+        for audio_file in audio_files:
+            print(f"\n{'='*40}")
+            print(f"Processing: {audio_file.name}")
+            print(f"{'='*40}")
+            
+            if process_single_file(str(audio_file), logger, processor, flush_publishing=False):
+                successful += 1
+            
+            print("\n" + "-"*40)
+    
+    # Assignment rows from every lecture go to the tracker in one bulk write
+    try:
+        processor.flush_publishing()
+    except Exception as e:
+        logger.error(f"Error writing assignments to the tracker: {e}")
     
     print(f"\n✅ Successfully processed {successful}/{len(audio_files)} files")
+    logger.info(processor.pool.report())
+    return successful
+
+def cache_command(argv) -> None:
+    #Inspect, prune or convert the transcription cache: python main.py cache {stats,list,prune,convert}
+    from config import settings
+    from src.core.transcription_cache import TranscriptionCache
+
+    parser = argparse.ArgumentParser(prog="main.py cache", description="Manage the transcription cache")
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    subparsers.add_parser('stats', help='Show cache size and hit counts')
+    subparsers.add_parser('list', help='List cached transcriptions, most recently used first')
+    prune_parser = subparsers.add_parser('prune', help='Evict least recently used transcriptions')
+    prune_parser.add_argument('--max-size-mb', type=float, default=settings.transcription_cache_max_mb,
+                              help=f'Keep at most this many MB (default: {settings.transcription_cache_max_mb})')
+    prune_parser.add_argument('--older-than-days', type=float, default=None,
+                              help='Also drop entries unused for this many days')
+    subparsers.add_parser('convert', help='Rewrite JSON transcriptions in the compact binary store format')
+    args = parser.parse_args(argv)
+    
+    cache = TranscriptionCache(Path(__file__).resolve().parent / "data" / "transcriptions")
+    if args.action == 'stats':
+        stats = cache.stats()
+        print(f"Entries: {stats['entries']}")
+        print(f"Size: {stats['total_bytes'] / 1e6:.1f} MB")
+        print(f"Hits: {stats['hits']}")
+    elif args.action == 'list':
+        entries = sorted(cache.entries().items(), key=lambda item: item[1]['last_access'], reverse=True)
+        for key, entry in entries:
+            print(f"{key[:12]}  {entry['size'] / 1e6:8.1f} MB  {entry['whisper_model']:<8} {entry['source']}")
+    elif args.action == 'convert':
+        print(f"Converted {cache.convert_to_store()} transcriptions")
+    else:
+        max_bytes = int(args.max_size_mb * 1e6) if args.max_size_mb is not None else None
+        removed = cache.prune(max_bytes=max_bytes, older_than_days=args.older_than_days)
+        print(f"Removed {len(removed)} cached transcriptions")
+
+def bench_command(argv) -> None:
+    #Offline benchmarks against fake OpenAI/Google servers: python main.py bench {run,compare,startup,memory}
+    from src.testing.benchmark import (BenchmarkConfig, run_benchmark, save_result, load_result,
+                                       compare_results, format_comparison, measure_startup,
+                                       import_profile, format_import_profile, STARTUP_BUDGET_SECONDS,
+                                       measure_transcription_memory, format_memory_results)
+    
+    parser = argparse.ArgumentParser(prog="main.py bench", description="Run or compare offline benchmarks")
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    run_parser = subparsers.add_parser('run', help='Process synthetic recordings and save the results as JSON')
+    defaults = BenchmarkConfig()
+    run_parser.add_argument('--name', default=defaults.name, help='Name stored with the results')
+    run_parser.add_argument('--recordings', type=int, default=defaults.recordings)
+    run_parser.add_argument('--minutes', type=float, nargs='+', default=defaults.minutes,
+                            help='Recording lengths in minutes, cycled over the recordings')
+    run_parser.add_argument('--mode', choices=['sequential', 'pipeline', 'batch'], default=defaults.mode)
+    run_parser.add_argument('--whisper-rtf', type=float, default=defaults.whisper_rtf,
+                            help='Seconds the fake Whisper spends per second of audio')
+    run_parser.add_argument('--no-vad', action='store_true')
+    run_parser.add_argument('--stream-decode', action='store_true',
+                            help='Decode and transcribe recordings 30 seconds at a time')
+    run_parser.add_argument('--refine-model', default=defaults.refine_whisper_model,
+                            help='Tiered transcription: re-decode low-confidence segments with this model')
+    run_parser.add_argument('--refine-rtf', type=float, default=defaults.refine_rtf,
+                            help='Seconds the fake refine model spends per second of audio')
+    run_parser.add_argument('--low-confidence-rate', type=float, default=defaults.low_confidence_rate,
+                            help='Share of fake Whisper segments with a low avg_logprob')
+    run_parser.add_argument('--duplicates', type=int, default=defaults.duplicates,
+                            help='How many of the recordings are re-encoded copies of the others')
+    run_parser.add_argument('--no-dedup', action='store_true', help='Turn audio fingerprint dedup off')
+    run_parser.add_argument('--openai-latency', type=float, default=defaults.openai_latency)
+    run_parser.add_argument('--openai-error-rate', type=float, default=defaults.openai_error_rate)
+    run_parser.add_argument('--openai-seconds-per-token', type=float, default=defaults.openai_seconds_per_token,
+                            help='Fake decode time per output token (e.g. 0.01 for ~100 tokens/s)')
+    run_parser.add_argument('--notes-items', type=int, default=defaults.notes_items,
+                            help='Subtopics, questions, definitions... per list in fake LLM outputs')
+    run_parser.add_argument('--notes-words', type=int, default=defaults.notes_words,
+                            help='Words per string in fake LLM outputs')
+    run_parser.add_argument('--fan-out', action='store_true', help='Enhance each subtopic in its own request')
+    run_parser.add_argument('--google-latency', type=float, default=defaults.google_latency)
+    run_parser.add_argument('--google-error-rate', type=float, default=defaults.google_error_rate)
+    run_parser.add_argument('--llm-workers', type=int, default=defaults.llm_workers)
+    run_parser.add_argument('--publish-workers', type=int, default=defaults.publish_workers)
+    run_parser.add_argument('--warm', action='store_true', help='Measure a rerun with every cache populated')
+    run_parser.add_argument('--seed', type=int, default=defaults.seed)
+    run_parser.add_argument('--no-startup', action='store_true', help='Skip the startup time measurement')
+    run_parser.add_argument('--output', help='Results file (default: data/benchmarks/<name>-<time>.json)')
+    run_parser.add_argument('--baseline', help='Compare against this results file after the run')
+    run_parser.add_argument('--threshold', type=float, default=0.10,
+                            help='Relative slowdown that counts as a regression (default: 0.10)')
+    startup_parser = subparsers.add_parser('startup', help='Time CLI startup and list the slowest imports')
+    startup_parser.add_argument('--repeats', type=int, default=5)
+    startup_parser.add_argument('--top', type=int, default=15, help='Imports to list (default: 15)')
+    startup_parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_SECONDS,
+                                help=f'Fail if --help takes longer than this many seconds '
+                                     f'(default: {STARTUP_BUDGET_SECONDS})')
+    memory_parser = subparsers.add_parser('memory', help='Peak RSS of transcribing long recordings, '
+                                                         'decoded whole and streamed')
+    memory_parser.add_argument('--minutes', type=float, nargs='+', default=[60.0, 240.0],
+                               help='Recording lengths in minutes (default: 60 240)')
+    memory_parser.add_argument('--no-vad', action='store_true')
+    memory_parser.add_argument('--seed', type=int, default=0)
+    compare_parser = subparsers.add_parser('compare', help='Flag regressions between two results files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help='Relative slowdown that counts as a regression (default: 0.10)')
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    if args.action == 'startup':
+        startup = measure_startup(args.repeats)
+        print(json.dumps(startup, indent=2))
+        print(format_import_profile(import_profile(["main.py", "--help"]), args.top))
+        if startup["help_seconds"] > args.budget:
+            print(f"\n--help took {startup['help_seconds']:.3f}s, over the {args.budget:.3f}s budget")
+            sys.exit(1)
+        return
+    if args.action == 'memory':
+        rows = measure_transcription_memory(args.minutes, vad=not args.no_vad, seed=args.seed)
+        print(json.dumps(rows, indent=2))
+        print(format_memory_results(rows))
+        return
+    if args.action == 'run':
+        config = BenchmarkConfig(
+            name=args.name, recordings=args.recordings, minutes=args.minutes, mode=args.mode,
+            whisper_rtf=args.whisper_rtf, vad=not args.no_vad, stream_decode=args.stream_decode,
+            refine_whisper_model=args.refine_model,
+            refine_rtf=args.refine_rtf, low_confidence_rate=args.low_confidence_rate,
+            duplicates=args.duplicates, dedup=not args.no_dedup,
+            openai_latency=args.openai_latency, openai_error_rate=args.openai_error_rate,
+            openai_seconds_per_token=args.openai_seconds_per_token, notes_items=args.notes_items,
+            notes_words=args.notes_words, enhance_fan_out=args.fan_out,
+            google_latency=args.google_latency, google_error_rate=args.google_error_rate,
+            llm_workers=args.llm_workers, publish_workers=args.publish_workers, warm=args.warm, seed=args.seed,
+        )
+        current = run_benchmark(config, startup=not args.no_startup)
+        output = args.output or Path(__file__).resolve().parent / "data" / "benchmarks" / \
+            f"{args.name}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        print(json.dumps(current["results"], indent=2))
+        print(f"\nResults saved to {save_result(current, output)}")
+        if not args.baseline:
+            return
+        baseline = load_result(args.baseline)
+    else:
+        baseline, current = load_result(args.baseline), load_result(args.current)
+    rows, regressed = compare_results(baseline, current, args.threshold)
+    print(format_comparison(rows, args.threshold))
+    if regressed:
+        sys.exit(1)
+
+def search_command(argv) -> None:
+    #Find which lecture covered something: python main.py search "gradient descent"
+    parser = argparse.ArgumentParser(prog="main.py search",
+                                     description="Search transcripts and notes of processed lectures")
+    parser.add_argument('query', nargs='+')
+    parser.add_argument('--limit', type=int, default=10, help='Results per kind (default: 10)')
+    parser.add_argument('--kind', choices=['all', 'transcript', 'notes'], default='all')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    parser.add_argument('--no-update', action='store_true', help='Skip indexing new or changed recordings first')
+    parser.add_argument('--rebuild', action='store_true', help='Drop the index and rebuild it from the manifests')
+    args = parser.parse_args(argv)
+    
+    from config import settings
+    from src.core.search_index import SearchIndex, format_offset, recording_link
+    
+    data_dir = Path(__file__).resolve().parent / "data"
+    index = SearchIndex(data_dir / "search" / "index.sqlite3", embedder=settings.search_embedder)
+    if args.rebuild:
+        index.clear()
+    if not args.no_update:
+        start = time.perf_counter()
+        counts = index.update(data_dir / "manifests")
+        if counts["indexed"] or counts["removed"]:
+            print(f"Indexed {counts['indexed']} recordings, removed {counts['removed']} "
+                  f"({time.perf_counter() - start:.2f}s)", file=sys.stderr)
+    
+    query = " ".join(args.query)
+    start = time.perf_counter()
+    results = []
+    if args.kind in ('all', 'transcript'):
+        results += index.search_transcripts(query, args.limit)
+    if args.kind in ('all', 'notes'):
+        results += index.search_notes(query, args.limit)
+    elapsed = time.perf_counter() - start
+    for result in results:
+        result["link"] = recording_link(result["recording"], result["start"])
+    
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        for result in results:
+            offset = format_offset(result["start"]) if result["start"] is not None else "--:--:--"
+            label = result["kind"] if result["kind"] == "transcript" else f"{result['kind']}: {result['title']}"
+            print(f"{Path(result['recording']).stem}  {offset}  {label}  ({result['score']:.3g})")
+            print(f"    {result['text'][:200]}")
+            print(f"    {result['link']}")
+    print(f"{len(results)} results in {elapsed * 1000:.1f} ms", file=sys.stderr)
+
+def build_processor(settings, args) -> "LectureProcessor":
+    #One resource pool and processor for the run, from settings overridden by the CLI flags
+    from src.core.lecture_processor import LectureProcessor
+    from src.core.resources import ResourcePool
+    
+    # Load models and clients once for the whole run; each loads on first use
+    pool = ResourcePool(
+        model_name=args.model,
+        whisper_model=args.whisper_model,
+        llm_cache_max_bytes=settings.llm_cache_max_mb * 1_000_000 if settings.llm_cache_max_mb else None,
+        llm_cache_enabled=settings.llm_cache_enabled and not args.no_llm_cache,
+        tracker_id=settings.assignments_tracker_id,
+        calendar_id=settings.assignments_calendar_id,
+        integrations=settings.integrations,
+        llm_client_options={
+            'base_url': settings.openai_base_url,
+            'max_concurrency': args.llm_concurrency,
+            'requests_per_minute': settings.llm_requests_per_minute,
+            'tokens_per_minute': settings.llm_tokens_per_minute,
+            'max_retries': settings.llm_max_retries,
+        },
+    )
+    cache_max_bytes = settings.transcription_cache_max_mb * 1_000_000 if settings.transcription_cache_max_mb else None
+    return LectureProcessor(model_name=args.model, whisper_model=args.whisper_model, pool=pool,
+                            transcription_cache_max_bytes=cache_max_bytes,
+                            chunk_max_tokens=settings.chunk_max_tokens,
+                            chunk_overlap_tokens=settings.chunk_overlap_tokens,
+                            chunk_concurrency=settings.chunk_concurrency,
+                            vad=settings.vad_enabled and not args.no_vad,
+                            transcript_format=settings.transcript_format,
+                            search_index=settings.search_index_enabled,
+                            search_embedder=settings.search_embedder,
+                            enhance_fan_out=settings.enhance_fan_out or args.fan_out,
+                            enhance_fan_out_concurrency=settings.enhance_fan_out_concurrency,
+                            refine_whisper_model=args.refine_model,
+                            dedup=settings.dedup_enabled and not args.no_dedup,
+                            stream_decode=settings.stream_decode or args.stream_decode,
+                            compact_transcripts=settings.compact_transcripts and not args.no_compact)
+
+def add_processor_arguments(parser: argparse.ArgumentParser) -> None:
+    #Flags that change how the processor is built, shared by the default command and serve
+    parser.add_argument(
+        '--model',
+        default=None,
+        help='OpenAI model to use (default: the MODEL setting)'
+    )
+    
+    parser.add_argument(
+        '--whisper-model',
+        default=None,
+        help='Whisper model to use (default: the WHISPER_MODEL setting)'
+    )
+    
+    parser.add_argument(
+        '--refine-model',
+        default=None,
+        help='Re-transcribe only low-confidence segments with this larger Whisper model, e.g. medium '
+             '(default: the WHISPER_REFINE_MODEL setting)'
+    )
+    
+    parser.add_argument(
+        '--no-llm-cache',
+        action='store_true',
+        help='Always call OpenAI instead of reusing cached responses'
+    )
+    
+    parser.add_argument(
+        '--llm-concurrency',
+        type=int,
+        default=None,
+        help='Maximum in-flight OpenAI requests across the run (default: the LLM_MAX_CONCURRENCY setting)'
+    )
+    
+    parser.add_argument(
+        '--no-vad',
+        action='store_true',
+        help='Transcribe the whole recording instead of only the detected speech'
+    )
+    
+    parser.add_argument(
+        '--stream-decode',
+        action='store_true',
+        help='Decode and transcribe recordings 30 seconds at a time, so memory does not grow with their '
+             'length (also the STREAM_DECODE setting)'
+    )
+    
+    parser.add_argument(
+        '--fan-out',
+        action='store_true',
+        help='Enhance each subtopic in its own concurrent request (also the ENHANCE_FAN_OUT setting)'
+    )
+    
+    parser.add_argument(
+        '--no-dedup',
+        action='store_true',
+        help='Transcribe every recording, even ones whose audio fingerprint matches an earlier lecture'
+    )
+    
+    parser.add_argument(
+        '--no-compact',
+        action='store_true',
+        help='Send the transcript to the first pass as Whisper wrote it, fillers and repetitions included'
+    )
+
+def resolve_processor_arguments(settings, args, logger) -> None:
+    # Report models that differ from the configured defaults
+    if args.model and args.model != settings.model:
+        logger.info(f"Using OpenAI model: {args.model}")
+    args.model = args.model or settings.model
+    
+    if args.whisper_model and args.whisper_model != settings.whisper_model:
+        logger.info(f"Using Whisper model: {args.whisper_model}")
+    args.whisper_model = args.whisper_model or settings.whisper_model
+    
+    args.refine_model = args.refine_model or settings.whisper_refine_model
+    if args.refine_model:
+        logger.info(f"Escalating low-confidence segments to Whisper model: {args.refine_model}")
+    
+    if args.llm_concurrency is None:
+        args.llm_concurrency = settings.llm_max_concurrency
+
+def add_daemon_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--url', default=None,
+                        help='Daemon address (default: http://SERVE_HOST:SERVE_PORT)')
+    parser.add_argument('--socket', default=None, help='Talk to the daemon over this Unix socket instead')
+
+def daemon_request(args, method: str, path: str, body=None):
+    #Call the serve daemon named by --url/--socket, exiting with a readable error if it is not running
+    from config import settings
+    from src.core.daemon import request
+    
+    socket_path = args.socket or (settings.serve_socket if not args.url else None)
+    url = args.url or f"http://{settings.serve_host}:{settings.serve_port}"
+    try:
+        return request(method, path, body, url=url, socket_path=socket_path)
+    except OSError as e:
+        print(f"Cannot reach the daemon at {socket_path or url}: {e}")
+        sys.exit(1)
+
+def serve_command(argv) -> None:
+    #Long-running worker: python main.py serve [--port 8765 | --socket /tmp/lectures.sock]
+    parser = argparse.ArgumentParser(prog="main.py serve",
+                                     description="Keep models loaded and process jobs submitted over HTTP")
+    parser.add_argument('--host', default=None, help='Address to listen on (default: the SERVE_HOST setting)')
+    parser.add_argument('--port', type=int, default=None, help='Port to listen on (default: the SERVE_PORT setting)')
+    parser.add_argument('--socket', default=None, help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--llm-workers', type=int, default=4, help='Concurrent jobs in the LLM stage (default: 4)')
+    parser.add_argument('--publish-workers', type=int, default=2,
+                        help='Concurrent jobs in the publish stage (default: 2)')
+    parser.add_argument('--flush-interval', type=float, default=30.0,
+                        help='Longest wait in seconds before queued tracker rows are written (default: 30)')
+    parser.add_argument('--no-warm-up', action='store_true', help='Load models on the first job instead of at startup')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose output')
+    add_processor_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    from config import settings
+    from src.core.daemon import WorkerDaemon, make_server
+    from src.core.job_queue import JobQueue
+    
+    logger = setup_logging(settings.log_level, verbose=args.verbose)
+    resolve_processor_arguments(settings, args, logger)
+    processor = build_processor(settings, args)
+    # a daemon runs for weeks; keep only recent spans while counters and timings keep accumulating
+    metrics.max_events = 10000
+    metrics.reset()
+    
+    daemon = WorkerDaemon(processor, JobQueue(processor.data_dir / "jobs.sqlite3"),
+                          llm_workers=args.llm_workers, publish_workers=args.publish_workers,
+                          flush_interval=args.flush_interval)
+    if not args.no_warm_up:
+        daemon.warm_up()
+    socket_path = args.socket or settings.serve_socket
+    server = make_server(daemon, args.host or settings.serve_host, args.port or settings.serve_port, socket_path)
+    daemon.start()
+    logger.info(f"Serving on {socket_path or 'http://%s:%d' % server.server_address[:2]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down; waiting for jobs in flight")
+    finally:
+        server.server_close()
+        daemon.stop()
+        daemon.queue.close()
+        write_run_metrics(logger)
+
+def submit_command(argv) -> None:
+    #Queue recordings on a running daemon: python main.py submit lecture.mp3 [--wait]
+    parser = argparse.ArgumentParser(prog="main.py submit", description="Queue recordings on a running daemon")
+    parser.add_argument('paths', nargs='+', help='Audio files or directories of audio files')
+    parser.add_argument('--wait', action='store_true', help='Wait for the jobs to finish and print their results')
+    add_daemon_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    recordings = []
+    for path in map(Path, args.paths):
+        recordings.extend(find_audio_files(path) if path.is_dir() else [path])
+    job_ids = []
+    for recording in recordings:
+        status, body = daemon_request(args, "POST", "/jobs", {"path": str(recording.resolve())})
+        if status != 202:
+            print(f"{recording}: {body.get('error')}")
+            continue
+        job_ids.append(body["id"])
+        print(f"{body['id']}  queued  {recording}")
+    if not args.wait:
+        sys.exit(0 if len(job_ids) == len(recordings) else 1)
+    
+    failed = len(recordings) - len(job_ids)
+    for job_id in job_ids:
+        while True:
+            _, job = daemon_request(args, "GET", f"/jobs/{job_id}")
+            if job["status"] in ("succeeded", "failed"):
+                break
+            time.sleep(1.0)
+        if job["status"] == "failed":
+            failed += 1
+            print(f"{job_id}  failed  {job['error']}")
+            continue
+        _, result = daemon_request(args, "GET", f"/jobs/{job_id}/result")
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    sys.exit(1 if failed else 0)
+
+def jobs_command(argv) -> None:
+    #Inspect a running daemon's queue: python main.py jobs [job_id] [--status queued]
+    parser = argparse.ArgumentParser(prog="main.py jobs", description="List or show daemon jobs")
+    parser.add_argument('job_id', nargs='?', help='Show one job in full')
+    parser.add_argument('--status', choices=['queued', 'running', 'succeeded', 'failed'])
+    parser.add_argument('--limit', type=int, default=50)
+    add_daemon_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    if args.job_id:
+        status, job = daemon_request(args, "GET", f"/jobs/{args.job_id}")
+        print(json.dumps(job, indent=2))
+        sys.exit(0 if status == 200 else 1)
+    query = f"?limit={args.limit}" + (f"&status={args.status}" if args.status else "")
+    _, body = daemon_request(args, "GET", f"/jobs{query}")
+    for job in body["jobs"]:
+        stage = f"{job['stage']} {job['progress']:.0%}" if job["status"] == "running" and job["stage"] else ""
+        print(f"{job['id']}  {job['status']:<9} {stage:<16} {job['recording']}")
+
+COMMANDS = {
+    'cache': cache_command,
+    'bench': bench_command,
+    'serve': serve_command,
+    'submit': submit_command,
+    'jobs': jobs_command,
+    'search': search_command,
+}
 
 def main():
     #Main entry point
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+    
     parser = argparse.ArgumentParser(
         description="Process lecture recordings into structured notes",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -130,7 +724,18 @@ Examples:
   python main.py recording.mp3                    # Process single file
   python main.py recordings/                      # Process all files in directory
   python main.py recording.mp3 --verbose          # Enable verbose output
+  python main.py recording.mp3 --stream           # Print subtopics as they are written
+  python main.py recordings/ --refine-model medium  # Fast base pass, medium only where base is unsure
   python main.py recordings/ --model llama2       # Use different AI model
+  python main.py recordings/ --pipeline           # Overlap transcription with LLM/publish work
+  python main.py recordings/ --batch              # Overnight run via the Batch API (rerun to resume)
+  python main.py recordings/ --plan               # Estimated tokens, cost and latency before sending anything
+  python main.py recordings/ --token-budget 500000  # Defer recordings that would go over the budget
+  python main.py cache stats                      # Inspect the transcription cache
+  python main.py cache prune --max-size-mb 2000   # Evict least recently used transcriptions
+  python main.py serve                            # Keep models loaded and take jobs over HTTP
+  python main.py submit recording.mp3 --wait      # Queue a recording on the running daemon
+  python main.py search "eigenvalues"             # Find which lecture covered a topic
   """
     )
     
@@ -139,17 +744,7 @@ Examples:
         help='Path to audio file or directory containing audio files'
     )
     
-    parser.add_argument(
-        '--model',
-        default=settings.model,
-        help=f'OpenAI model to use (default: {settings.model})'
-    )
-    
-    parser.add_argument(
-        '--whisper-model',
-        default=settings.whisper_model,
-        help=f'Whisper model to use (default: {settings.whisper_model})'
-    )
+    add_processor_arguments(parser)
     
     parser.add_argument(
         '--verbose', '-v',
@@ -164,39 +759,121 @@ Examples:
         help='Output format (default: console)'
     )
     
+    parser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help='Overlap transcription, LLM and publishing stages when processing a directory'
+    )
+    
+    parser.add_argument(
+        '--llm-workers',
+        type=int,
+        default=4,
+        help='Concurrent lectures in the LLM stage of --pipeline (default: 4)'
+    )
+    
+    parser.add_argument(
+        '--publish-workers',
+        type=int,
+        default=2,
+        help='Concurrent lectures in the Google publish stage of --pipeline (default: 2)'
+    )
+    
+    parser.add_argument(
+        '--transcribe-workers',
+        type=int,
+        default=1,
+        help='Worker processes for transcribing a directory, each with its own Whisper model (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help='Run both LLM passes for a directory through the OpenAI Batch API (resumable)'
+    )
+    
+    parser.add_argument(
+        '--batch-poll-interval',
+        type=float,
+        default=60.0,
+        help='Seconds between Batch API status checks (default: 60)'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Also write a cProfile dump of the run next to the run report'
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Single file: stream the LLM responses and print subtopics as they are written'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='List the stages each recording would run, then exit'
+    )
+    parser.add_argument(
+        '--plan',
+        action='store_true',
+        help='Print estimated tokens, cost and latency of both LLM passes per file and directory, then exit'
+    )
+    parser.add_argument(
+        '--token-budget',
+        type=int,
+        default=None,
+        help='Estimated LLM tokens this run may spend; recordings past it are deferred to a later run '
+             '(default: the RUN_TOKEN_BUDGET setting)'
+    )
+    
     args = parser.parse_args()
     
+    # Determine if input is file or directory before loading any settings
+    input_path = Path(args.input_path)
+    
+    if not input_path.is_file() and not input_path.is_dir():
+        setup_logging(verbose=args.verbose).error(f"Invalid path: {args.input_path}")
+        sys.exit(1)
+    
+    from config import settings
+    
     # Set up logging
-    if args.verbose:
-        logging.getLogger().setLevel(logging.DEBUG)
+    logger = setup_logging(settings.log_level, verbose=args.verbose)
+    resolve_processor_arguments(settings, args, logger)
+    processor = build_processor(settings, args)
     
-    logger = setup_logging()
+    if args.dry_run:
+        show_plan(input_path, processor)
+        return
     
-    # Create processor with specified models
-    processor_kwargs = {}
-    if args.model != settings.model:
-        processor_kwargs['model_name'] = args.model
-        logger.info(f"Using OpenAI model: {args.model}")
+    if args.plan:
+        show_token_plan(input_path, processor)
+        return
     
-    if args.whisper_model != settings.whisper_model:
-        processor_kwargs['whisper_model'] = args.whisper_model
-        logger.info(f"Using Whisper model: {args.whisper_model}")
+    token_budget = args.token_budget if args.token_budget is not None else settings.run_token_budget
     
-    # Determine if input is file or directory
-    input_path = Path(args.input_path)
+    profile_path = Path(settings.metrics_dir) / f"run-{metrics.run_id}.prof" if args.profile else None
+    success = True
+    try:
+        with profiled(profile_path):
+            if input_path.is_file():
+                # Process single file, unless it alone is over the token budget
+                if token_budget is not None and not apply_token_budget([input_path], processor, token_budget, logger):
+                    success = False
+                else:
+                    success = process_single_file(args.input_path, logger, processor,
+                                                  stream=args.stream or settings.stream_output)
+            else:
+                # Process directory
+                process_directory(args.input_path, logger, processor, pipeline=args.pipeline,
+                                  llm_workers=args.llm_workers, publish_workers=args.publish_workers,
+                                  transcribe_workers=args.transcribe_workers, batch=args.batch,
+                                  batch_poll_interval=args.batch_poll_interval, token_budget=token_budget)
+    finally:
+        write_run_metrics(logger)
     
     if input_path.is_file():
-        # Process single file
-        success = process_single_file(args.input_path, logger)
         sys.exit(0 if success else 1)
-        
-    elif input_path.is_dir():
-        # Process directory
-        process_directory(args.input_path, logger)
-        
-    else:
-        logger.error(f"Invalid path: {args.input_path}")
-        sys.exit(1)
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,291 @@
+import os
+import io
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Type
+
+from openai import OpenAI
+from pydantic import BaseModel
+
+from src.models.lecture_models import DocNotes, EnhancedResult, EnhancedDocNotes
+from src.core.chunking import merge_notes
+from src.utils.file_utils import hash_text
+from src.utils.logger import metrics
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def output_text(body: Dict) -> str:
+    #Concatenated output_text of a Responses API body
+    return "".join(
+        content.get("text", "")
+        for item in body.get("output", []) if item.get("type") == "message"
+        for content in item.get("content", []) if content.get("type") == "output_text"
+    )
+
+
+def strict_json_schema(text_format: Type[BaseModel]) -> Dict:
+    #text_format's JSON schema in the form Structured Outputs' strict mode takes: every object closed
+    #and every property required (Optional ones stay nullable), without null defaults or $ref siblings
+    schema = text_format.model_json_schema()
+    definitions = schema.get("$defs", {})
+
+    def visit(node):
+        if isinstance(node, list):
+            for item in node:
+                visit(item)
+            return
+        if not isinstance(node, dict):
+            return
+        if "$ref" in node and len(node) > 1:
+            # strict mode ignores keywords next to $ref, so the definition is inlined under them
+            reference = node.pop("$ref")
+            node.update({**definitions[reference.split("/")[-1]], **node})
+        if node.get("type") == "object" and "properties" in node:
+            node["additionalProperties"] = False
+            node["required"] = list(node["properties"])
+        if "default" in node and node["default"] is None:
+            del node["default"]
+        for value in node.values():
+            visit(value)
+
+    visit(schema)
+    return schema
+
+
+def text_format_param(text_format: Type[BaseModel]) -> Dict:
+    #The Responses API text.format for a structured output of text_format
+    return {"type": "json_schema", "name": text_format.__name__, "schema": strict_json_schema(text_format),
+            "strict": True}
+
+
+class BatchRunner:
+    #Runs a directory through the OpenAI Batch API: transcribe everything, one batch for the
+    #first pass, one for the enhancement pass, then publish. Progress lives in a JSON state
+    #file so an interrupted run picks up where it left off.
+    def __init__(self, processor, poll_interval: float = 60.0):
+        self.processor = processor
+        self.note_processor = processor.note_processor
+        self.llm_cache = processor.pool.llm_cache
+        self.poll_interval = poll_interval
+        options = processor.pool.llm_client_options
+        self.client = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=options.get("base_url") or os.getenv("OPENAI_BASE_URL"),
+        )
+        self.state_dir = processor.data_dir / "batch_runs"
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.state_path: Optional[Path] = None
+        self.state: Dict = {}
+
+    def _load_state(self, directory: Path) -> None:
+        self.state_path = self.state_dir / f"{hash_text(str(directory.resolve()))[:16]}.json"
+        if self.state_path.exists():
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+            if not self.state.get("completed"):
+                logger.info(f"Resuming batch run from {self.state_path}")
+                return
+        self.state = {"directory": str(directory.resolve()), "passes": {}, "published": {}, "completed": False}
+        self._save_state()
+
+    def _save_state(self) -> None:
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _submit(self, name: str, requests: Dict[str, List[Dict]], model: str,
+                text_format: Type[BaseModel]) -> str:
+        text_param = {"format": text_format_param(text_format)}
+        lines = [
+            json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/responses",
+                "body": {"model": model, "input": prompt_messages, "text": text_param},
+            }, ensure_ascii=False)
+            for custom_id, prompt_messages in requests.items()
+        ]
+        upload = self.client.files.create(
+            file=(f"{name}.jsonl", io.BytesIO("\n".join(lines).encode("utf-8"))),
+            purpose="batch",
+        )
+        batch = self.client.batches.create(
+            input_file_id=upload.id,
+            endpoint="/v1/responses",
+            completion_window="24h",
+            metadata={"pass": name},
+        )
+        logger.info(f"Submitted {name} batch {batch.id} with {len(lines)} requests")
+        return batch.id
+
+    def _wait(self, batch_id: str):
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status in TERMINAL_STATUSES:
+                return batch
+            counts = batch.request_counts
+            logger.info(f"Batch {batch_id} {batch.status}"
+                        + (f": {counts.completed}/{counts.total} done" if counts else ""))
+            time.sleep(self.poll_interval)
+
+    def _run_pass(self, name: str, requests: Dict[str, List[Dict]], model: str,
+                  text_format: Type[BaseModel]) -> Dict[str, Optional[BaseModel]]:
+        #Resolve every request from the LLM cache, earlier state, or a batch job. State and batch lines
+        #are keyed by the LLM cache key (model, schema and prompt), so a resumed run never takes the
+        #result of a prompt that has since changed; requests is keyed by whatever the caller names them.
+        pass_state = self.state["passes"].setdefault(name, {"batch_id": None, "submitted": [], "results": {}})
+        if pass_state["batch_id"] and not pass_state.get("submitted"):
+            # submitted before results were keyed by prompt; its lines cannot be matched to requests
+            pass_state["batch_id"] = None
+        results = pass_state["results"]
+        keys = {custom_id: self.llm_cache.key_for(prompt_messages, model, text_format)
+                for custom_id, prompt_messages in requests.items()}
+        prompts = {keys[custom_id]: prompt_messages for custom_id, prompt_messages in requests.items()}
+        for key in prompts:
+            if not results.get(key) and self.llm_cache.enabled:
+                cached = self.llm_cache.get(key, text_format)
+                if cached is not None:
+                    results[key] = cached.model_dump()
+
+        tried = set()
+        while True:
+            if not pass_state["batch_id"]:
+                pending = {key: prompt for key, prompt in prompts.items() if not results.get(key) and key not in tried}
+                if not pending:
+                    break
+                pass_state["batch_id"] = self._submit(name, pending, model, text_format)
+                pass_state["submitted"] = list(pending)
+                self._save_state()
+            submitted = set(pass_state["submitted"])
+            batch = self._wait(pass_state["batch_id"])
+            if batch.status != "completed":
+                logger.error(f"{name} batch {batch.id} ended as {batch.status}")
+            if batch.output_file_id:
+                for line in self.client.files.content(batch.output_file_id).text.splitlines():
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    key = record["custom_id"]
+                    response = record.get("response") or {}
+                    if key not in submitted or response.get("status_code") != 200:
+                        continue
+                    usage = response["body"].get("usage") or {}
+                    metrics.incr("openai_input_tokens", usage.get("input_tokens", 0), model=model, mode="batch")
+                    metrics.incr("openai_output_tokens", usage.get("output_tokens", 0), model=model, mode="batch")
+                    try:
+                        parsed = text_format.model_validate_json(output_text(response["body"]))
+                    except Exception as e:
+                        logger.error(f"Unparseable {name} result for {key}: {e}")
+                        continue
+                    results[key] = parsed.model_dump()
+                    if self.llm_cache.enabled:
+                        self.llm_cache.put(key, parsed)
+            # anything still missing failed inside the batch; a rerun resubmits just those
+            for key in submitted:
+                results.setdefault(key, None)
+            # a batch resumed from an earlier run may predate some of this run's prompts; those go next
+            tried |= submitted
+            pass_state["batch_id"] = None
+            pass_state["submitted"] = []
+            self._save_state()
+
+        return {
+            custom_id: text_format.model_validate(results[key]) if results.get(key) else None
+            for custom_id, key in keys.items()
+        }
+
+    def run(self, directory: Path, audio_files: List[Path]) -> List[Optional[EnhancedDocNotes]]:
+        #Process audio_files end to end; returns final notes (or None) in input order
+        self._load_state(directory)
+        finals: List[Optional[EnhancedDocNotes]] = [None] * len(audio_files)
+
+        # stage manifests are recorded as in a sequential run, so later runs and --plan see this one's output
+        manifests = [self.processor.manifests.for_recording(str(audio_file)) for audio_file in audio_files]
+
+        # Transcribe everything first; the transcription cache makes this free on resume
+        transcripts: Dict[int, Dict] = {}
+        for index, audio_file in enumerate(audio_files):
+            transcription_path = self.processor.transcribe_stage(str(audio_file), manifests[index])
+            data = self.processor.load_transcription(transcription_path) if transcription_path else None
+            if data is not None:
+                transcripts[index] = data
+
+        # First pass: one request per lecture, or per chunk for long lectures
+        extraction_prompts = {
+            index: self.processor.build_extraction_prompts(data['text'], data.get('segments'))
+            for index, data in transcripts.items()
+        }
+        extract_requests = {
+            f"{audio_files[index].name}:{part}": prompt_messages
+            for index, prompts in extraction_prompts.items()
+            for part, prompt_messages in enumerate(prompts)
+        }
+        extracted = self._run_pass("extract", extract_requests, self.processor.model_name, DocNotes)
+
+        first_pass: Dict[int, DocNotes] = {}
+        for index, prompts in extraction_prompts.items():
+            chunk_notes = [extracted[f"{audio_files[index].name}:{part}"] for part in range(len(prompts))]
+            if all(chunk_notes):
+                notes = chunk_notes[0] if len(chunk_notes) == 1 else merge_notes(chunk_notes)
+                first_pass[index] = notes
+                saved_notes_path = self.processor.save_notes(notes, self.processor.notes_name(str(audio_files[index])))
+                if saved_notes_path:
+                    recording_path = str(audio_files[index])
+                    manifests[index].record(
+                        "extract",
+                        self.processor.stage_input("extract", recording_path, manifests[index].output_hash("transcribe")),
+                        hash_text(notes.model_dump_json()), path=saved_notes_path)
+
+        # Second pass: enhancement
+        enhance_requests = {
+            audio_files[index].name: self.note_processor.build_prompt_messages(notes)
+            for index, notes in first_pass.items()
+        }
+        enhanced = self._run_pass("enhance", enhance_requests, self.note_processor.model_name, EnhancedResult)
+        for index, notes in first_pass.items():
+            result = enhanced[audio_files[index].name]
+            if result:
+                finals[index] = EnhancedDocNotes.from_results(notes.main_topic, notes.assignments, result)
+                recording_path = str(audio_files[index])
+                saved_path = self.note_processor.save_notes(finals[index], self.processor.notes_name(recording_path))
+                # batches always enhance in one request, which is not what a fan-out manifest entry means
+                if saved_path and not self.note_processor.fan_out:
+                    manifests[index].record(
+                        "enhance",
+                        self.processor.stage_input("enhance", recording_path, hash_text(notes.model_dump_json())),
+                        hash_text(finals[index].model_dump_json()), path=saved_path)
+                    self.processor.update_search_index(manifests[index])
+
+        # Publish, remembering what is done so a resumed run does not publish twice
+        published = []
+        for index, final_notes in enumerate(finals):
+            name = audio_files[index].name
+            if final_notes is None or self.state["published"].get(name):
+                continue
+            try:
+                self.processor.publish_stage(str(audio_files[index]), manifests[index], final_notes, flush=False)
+                published.append(name)
+            except Exception as e:
+                logger.error(f"Error publishing {name}: {e}")
+                finals[index] = None
+        flushed = True
+        try:
+            self.processor.flush_publishing()
+        except Exception as e:
+            # every result is saved by now; leaving these unpublished makes a rerun publish them again
+            logger.error(f"Error writing assignments to the tracker: {e}")
+            flushed = False
+        if flushed:
+            for name in published:
+                self.state["published"][name] = True
+        self._save_state()
+
+        self.state["completed"] = flushed and all(final_notes is not None for final_notes in finals)
+        self._save_state()
+        return finals
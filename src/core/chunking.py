@@ -0,0 +1,103 @@
+import re
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from src.models.lecture_models import SubTopic, Assignment, DocNotes
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str):
+    #Tokenizer for model_name, falling back to the current OpenAI default for unknown names
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model_name: str) -> int:
+    return len(get_encoding(model_name).encode(text, disallowed_special=()))
+
+
+def text_to_segments(text: str) -> List[Dict]:
+    #Sentence-level pseudo segments for transcripts saved without Whisper segments
+    return [{'text': sentence} for sentence in re.split(r'(?<=[.!?])\s+', text) if sentence]
+
+
+def chunk_segments(segments: List[Dict], model_name: str, max_tokens: int,
+                   overlap_tokens: int = 0) -> List[str]:
+    #Group Whisper segments into chunks of at most max_tokens, never splitting a segment,
+    #and start each chunk with the last ~overlap_tokens of the previous one for context
+    counts = [count_tokens(segment['text'], model_name) for segment in segments]
+    chunks = []
+    start = 0
+    while start < len(segments):
+        end = start
+        total = 0
+        # always take at least one segment so an oversized segment still makes progress
+        while end < len(segments) and (end == start or total + counts[end] <= max_tokens):
+            total += counts[end]
+            end += 1
+        chunks.append(''.join(segment['text'] for segment in segments[start:end]).strip())
+        if end >= len(segments):
+            break
+        next_start = end
+        carried = 0
+        while next_start - 1 > start and carried + counts[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            carried += counts[next_start]
+        start = next_start
+    return chunks
+
+
+def _normalize(value: Optional[str]) -> str:
+    return re.sub(r'[^a-z0-9]+', ' ', (value or '').lower()).strip()
+
+
+def _merge_lists(first: Optional[List[str]], second: Optional[List[str]]) -> Optional[List[str]]:
+    if not first and not second:
+        return first if first is not None else second
+    merged = list(first or [])
+    seen = {_normalize(item) for item in merged}
+    for item in second or []:
+        if _normalize(item) not in seen:
+            seen.add(_normalize(item))
+            merged.append(item)
+    return merged
+
+
+def merge_notes(chunk_notes: List[DocNotes]) -> DocNotes:
+    #Reduce per-chunk notes into one DocNotes, deduplicating subtopics, assignments and takeaways
+    sub_topics: Dict[str, SubTopic] = {}
+    assignments: Dict[tuple, Assignment] = {}
+    key_takeaways: Optional[List[str]] = None
+    for notes in chunk_notes:
+        for subtopic in notes.sub_topics:
+            key = _normalize(subtopic.title)
+            if key in sub_topics:
+                existing = sub_topics[key]
+                # keep the fuller description, pool the examples
+                description = max(existing.description, subtopic.description, key=len)
+                sub_topics[key] = existing.model_copy(update={
+                    'description': description,
+                    'examples': _merge_lists(existing.examples, subtopic.examples),
+                })
+            else:
+                sub_topics[key] = subtopic
+        for assignment in notes.assignments:
+            key = (_normalize(assignment.title), assignment.due_date)
+            if key not in assignments or len(assignment.description or '') > len(assignments[key].description or ''):
+                assignments[key] = assignment
+        key_takeaways = _merge_lists(key_takeaways, notes.key_takeaways)
+
+    # the opening chunk usually states the lecture topic
+    return DocNotes(
+        main_topic=chunk_notes[0].main_topic,
+        sub_topics=list(sub_topics.values()),
+        assignments=list(assignments.values()),
+        key_takeaways=key_takeaways,
+    )
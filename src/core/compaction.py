@@ -0,0 +1,155 @@
+import re
+import zlib
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+
+from src.core.chunking import text_to_segments
+
+# bump when the rules below change, so first-pass notes extracted from older compactions are redone
+COMPACTION_VERSION = 3
+# Whisper's own hallucination threshold: a segment whose text gzips this well is mostly a loop
+COMPRESSION_RATIO_THRESHOLD = 2.4
+# longest phrase, in words, that is checked for back-to-back repeats
+MAX_REPEAT_WORDS = 8
+# a phrase said this many times in a row is collapsed to one; lecturers repeat themselves on purpose,
+# so ordinary segments need a long run, while a looping segment collapses at the second copy
+MIN_REPEATS = 5
+MIN_REPEATS_IN_LOOP = 2
+# phrases made only of numbers, single letters and these are content ("1, 1, 1", "x times x times x")
+# and are never collapsed
+MATH_WORDS = frozenset({
+    "zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "hundred", "thousand",
+    "plus", "minus", "times", "over", "divided", "by", "equals", "squared", "cubed", "root", "power", "of",
+    "dot", "cross", "prime", "sub", "inverse", "transpose", "log", "sin", "cos", "tan", "mod",
+    "alpha", "beta", "gamma", "delta", "epsilon", "theta", "lambda", "mu", "pi", "sigma", "phi", "omega",
+})
+_NUMBER = re.compile(r"^[-+]?\d+(?:[.,/]\d+)*%?$")
+
+FILLER_WORDS = frozenset({"um", "umm", "uh", "uhh", "uhm", "erm", "er", "ah", "hmm", "mm", "mhm", "uh-huh"})
+# multi-word fillers only where commas set them off, since "I mean" and "like" are also ordinary words
+_FILLER_PHRASE = re.compile(r"(?i)(^\s*|[.!?]\s+)(?:you know|i mean),\s+")
+# mid-sentence the commas go with the filler: "the proof, you know, is short" -> "the proof is short"
+_INNER_FILLER_PHRASE = re.compile(r"(?i),\s+(?:you know|i mean),")
+# "like," only as a sentence opener: mid-sentence ", like," often means "such as"
+_LEADING_LIKE = re.compile(r"(?i)(^\s*|[.!?]\s+)like,\s+")
+_SENTENCE_END = ".!?"
+
+
+@dataclass
+class CompactionStats:
+    original_chars: int = 0
+    compacted_chars: int = 0
+    fillers: int = 0
+    repeats: int = 0
+    dropped_segments: int = 0
+
+    @property
+    def saved_fraction(self) -> float:
+        return 1.0 - self.compacted_chars / self.original_chars if self.original_chars else 0.0
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), "saved_fraction": round(self.saved_fraction, 4)}
+
+
+def compression_ratio(text: str) -> float:
+    #Computed the way Whisper does, for transcripts saved without it
+    data = text.encode("utf-8")
+    return len(data) / len(zlib.compress(data)) if data else 0.0
+
+
+def _word_key(word: str) -> str:
+    return word.lower().strip(",.!?;:\"'()…-")
+
+
+def _drop_fillers(text: str, stats: CompactionStats) -> List[str]:
+    text, phrases = _FILLER_PHRASE.subn(r"\1", text)
+    text, inner = _INNER_FILLER_PHRASE.subn("", text)
+    text, likes = _LEADING_LIKE.subn(r"\1", text)
+    stats.fillers += phrases + inner + likes
+    words: List[str] = []
+    for word in text.split():
+        if _word_key(word) not in FILLER_WORDS:
+            words.append(word)
+            continue
+        stats.fillers += 1
+        if not words:
+            continue
+        # "... the end, um." keeps its full stop
+        if word[-1] in _SENTENCE_END:
+            words[-1] = words[-1].rstrip(",;:") + ("" if words[-1][-1] in _SENTENCE_END else word[-1])
+        # "is, uh, zero" loses the commas that set the filler off
+        elif word[-1] == "," and words[-1][-1] == ",":
+            words[-1] = words[-1][:-1]
+    return words
+
+
+def _is_math(key: str) -> bool:
+    return len(key) <= 1 or key in MATH_WORDS or bool(_NUMBER.match(key))
+
+
+def _repeat_at(keys: List[str], i: int, min_repeats: int) -> Tuple[int, int]:
+    #(phrase length, times in a row) of the shortest phrase starting at i said at least min_repeats times
+    for n in range(1, MAX_REPEAT_WORDS + 1):
+        phrase = keys[i:i + n]
+        if len(phrase) < n:
+            break
+        repeats = 1
+        while keys[i + repeats * n:i + (repeats + 1) * n] == phrase:
+            repeats += 1
+        if repeats >= min_repeats and any(phrase) and not all(_is_math(key) for key in phrase):
+            return n, repeats
+    return 0, 0
+
+
+def _collapse_repeats(words: List[str], min_repeats: int, stats: CompactionStats) -> List[str]:
+    #Keep one copy of any phrase of up to MAX_REPEAT_WORDS words said min_repeats or more times in a row
+    keys = [_word_key(word) for word in words]
+    kept: List[str] = []
+    i = 0
+    while i < len(words):
+        n, repeats = _repeat_at(keys, i, min_repeats)
+        if not n:
+            kept.append(words[i])
+            i += 1
+            continue
+        # the first copy, ended with whatever punctuation closed the loop
+        last_word = words[i + repeats * n - 1]
+        closing = last_word[len(last_word.rstrip(_SENTENCE_END + ",;:")):]
+        kept.extend(words[i:i + n - 1])
+        kept.append(words[i + n - 1].rstrip(_SENTENCE_END + ",;:") + closing)
+        stats.repeats += repeats - 1
+        i += repeats * n
+    return kept
+
+
+def compact_segments(segments: List[Dict], stats: Optional[CompactionStats] = None) -> List[Dict]:
+    #Segments with fillers removed, repeated phrases collapsed (harder in segments whose
+    #compression_ratio marks them as a loop), whitespace normalized, and empty segments or exact
+    #repeats of the previous one dropped. Timestamps are kept, so the result chunks like the original.
+    stats = stats if stats is not None else CompactionStats()
+    compacted: List[Dict] = []
+    previous_key = None
+    for segment in segments:
+        text = segment["text"]
+        stats.original_chars += len(text)
+        ratio = segment.get("compression_ratio") or compression_ratio(text)
+        min_repeats = MIN_REPEATS_IN_LOOP if ratio > COMPRESSION_RATIO_THRESHOLD else MIN_REPEATS
+        words = _collapse_repeats(_drop_fillers(text, stats), min_repeats, stats)
+        key = " ".join(_word_key(word) for word in words)
+        if not words or key == previous_key:
+            # Whisper stuck on one line emits it as segment after segment
+            stats.dropped_segments += 1
+            continue
+        previous_key = key
+        compacted_text = " " + " ".join(words)
+        stats.compacted_chars += len(compacted_text)
+        compacted.append({**segment, "text": compacted_text})
+    return compacted
+
+
+def compact_transcript(text: str, segments: Optional[List[Dict]] = None) -> Tuple[str, List[Dict], CompactionStats]:
+    #Compacted text and segments for the extraction prompt; transcripts saved without Whisper
+    #segments are compacted sentence by sentence
+    stats = CompactionStats()
+    compacted = compact_segments(segments if segments else text_to_segments(text), stats)
+    return "".join(segment["text"] for segment in compacted).strip(), compacted, stats
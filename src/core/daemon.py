@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import socket
+import logging
+import threading
+import http.client
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from src.core.job_queue import JobQueue, JOB_STATUSES
+from src.core.pipeline import LecturePipeline, PipelineJob
+from src.utils.logger import metrics
+from src.utils.file_utils import AUDIO_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+# fraction of a job done when each pipeline stage starts
+STAGE_PROGRESS = {"transcribe": 0.0, "llm": 0.4, "publish": 0.9}
+
+
+class WorkerDaemon:
+    #Keeps one LectureProcessor (Whisper model, OpenAI and Google clients) warm and feeds jobs
+    #claimed from a JobQueue through the same staged pipeline as `main.py dir/ --pipeline`
+    def __init__(self, processor, job_queue: JobQueue, transcribe_workers: int = 1, llm_workers: int = 4,
+                 publish_workers: int = 2, flush_interval: float = 30.0, poll_interval: float = 1.0):
+        self.processor = processor
+        self.queue = job_queue
+        self.pipeline = LecturePipeline(processor, transcribe_workers=transcribe_workers, llm_workers=llm_workers,
+                                        publish_workers=publish_workers, on_stage=self._on_stage)
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.in_flight = 0
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+
+    def warm_up(self) -> None:
+        #Load the Whisper model and OpenAI client before the first job rather than during it
+        start = time.perf_counter()
+        self.processor.transcriber
+        self.processor.client
+        logger.info(f"Models and clients loaded in {time.perf_counter() - start:.1f}s")
+
+    def submit(self, recording_path: str) -> Dict:
+        #Queue a recording; raises ValueError for paths the daemon cannot process
+        path = Path(recording_path).expanduser().resolve()
+        if not path.is_file():
+            raise ValueError(f"File not found: {recording_path}")
+        if path.suffix.lower() not in AUDIO_EXTENSIONS:
+            raise ValueError(f"Not an audio file: {recording_path}")
+        job = self.queue.submit(str(path))
+        metrics.incr("jobs_submitted")
+        self._wakeup.set()
+        return job
+
+    def _claimed_jobs(self) -> Iterator[PipelineJob]:
+        #Pipeline input: blocks until a job is queued, ends once stop() is called
+        index = 0
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            job = self.queue.claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                continue
+            with self._lock:
+                self.in_flight += 1
+            yield PipelineJob(index=index, recording_path=Path(job["recording"]), job_id=job["id"])
+            index += 1
+
+    def _on_stage(self, job: PipelineJob, stage: str) -> None:
+        self.queue.set_stage(job.job_id, stage, STAGE_PROGRESS.get(stage, 0.0))
+
+    def _finish(self, job: PipelineJob) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        if not job.succeeded:
+            self.queue.fail(job.job_id, job.error or "unknown error")
+            metrics.incr("jobs_finished", status="failed")
+            return
+        outputs = {stage: job.manifest.get(stage)["path"] for stage in ("transcribe", "extract", "enhance")
+                   if job.manifest.get(stage)}
+        self.queue.finish(job.job_id, outputs)
+        metrics.incr("jobs_finished", status="succeeded")
+        logger.info(f"Job {job.job_id} done: {job.recording_path.name}")
+
+    def _maybe_flush(self, force: bool = False) -> None:
+        #Batch tracker writes like a directory run does: once the queue drains, or every flush_interval
+        idle = self.in_flight == 0 and self.queue.counts()["queued"] == 0
+        if not (force or idle or time.monotonic() - self._last_flush >= self.flush_interval):
+            return
+        self._last_flush = time.monotonic()
+        try:
+            self.processor.flush_publishing()
+        except Exception as e:
+            logger.error(f"Error writing assignments to the tracker: {e}")
+
+    def _run(self) -> None:
+        for job in self.pipeline.stream(self._claimed_jobs()):
+            self._finish(job)
+            self._maybe_flush()
+        self._maybe_flush(force=True)
+
+    def start(self) -> "WorkerDaemon":
+        self.queue.requeue_interrupted()
+        self._thread = threading.Thread(target=self._run, name="daemon-jobs", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        #Stop claiming jobs and let the ones in flight finish; jobs cut off here are requeued on next start
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def health(self) -> Dict:
+        return {"status": "ok", "jobs": self.queue.counts(), "in_flight": self.in_flight,
+                "pool": self.processor.pool.report()}
+
+
+def _read_json(path: Optional[str]) -> Optional[Dict]:
+    if not path or not Path(path).exists():
+        return None
+    return json.loads(Path(path).read_text(encoding='utf-8'))
+
+
+def make_handler(daemon: WorkerDaemon):
+    class Handler(BaseHTTPRequestHandler):
+        #POST /jobs {"path": ...}; GET /jobs[?status=&limit=], /jobs/<id>, /jobs/<id>/notes,
+        #/jobs/<id>/result, /health and /metrics
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _send(self, status: int, body, content_type: str = "application/json") -> None:
+            payload = body.encode("utf-8") if isinstance(body, str) else json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            if urlparse(self.path).path.rstrip("/") != "/jobs":
+                return self._send(404, {"error": f"Unknown route {self.path}"})
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                job = daemon.submit(body["path"])
+            except (ValueError, KeyError, TypeError) as e:
+                return self._send(400, {"error": str(e) if not isinstance(e, KeyError) else "Missing 'path'"})
+            self._send(202, job)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split("/") if part]
+            if parts == ["health"]:
+                return self._send(200, daemon.health())
+            if parts == ["metrics"]:
+                return self._send(200, metrics.prometheus_text(), "text/plain; version=0.0.4")
+            if parts == ["jobs"]:
+                query = parse_qs(url.query)
+                status = query.get("status", [None])[0]
+                if status and status not in JOB_STATUSES:
+                    return self._send(400, {"error": f"Unknown status {status!r}"})
+                limit = query.get("limit", ["100"])[0]
+                try:
+                    if int(limit) < 1:
+                        raise ValueError
+                except ValueError:
+                    return self._send(400, {"error": f"'limit' must be a positive integer, got {limit!r}"})
+                return self._send(200, {"jobs": daemon.queue.list(status, int(limit))})
+            if len(parts) in (2, 3) and parts[0] == "jobs":
+                job = daemon.queue.get(parts[1])
+                if job is None:
+                    return self._send(404, {"error": f"Unknown job {parts[1]}"})
+                if len(parts) == 2:
+                    return self._send(200, job)
+                # the same DocNotes / EnhancedDocNotes JSON a CLI run saves
+                stage = {"notes": "extract", "result": "enhance"}.get(parts[2])
+                if stage is None:
+                    return self._send(404, {"error": f"Unknown route {self.path}"})
+                notes = _read_json(job["outputs"].get(stage))
+                if notes is None:
+                    return self._send(409, {"error": f"Job {job['id']} is {job['status']}", "job": job})
+                return self._send(200, notes)
+            self._send(404, {"error": f"Unknown route {self.path}"})
+
+    return Handler
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def make_server(daemon: WorkerDaemon, host: str = "127.0.0.1", port: int = 8765,
+                socket_path: Optional[str] = None) -> socketserver.BaseServer:
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        return UnixHTTPServer(socket_path, make_handler(daemon))
+    return ThreadingHTTPServer((host, port), make_handler(daemon))
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float = 10.0):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request(method: str, path: str, body: Optional[Dict] = None, url: str = "http://127.0.0.1:8765",
+            socket_path: Optional[str] = None) -> Tuple[int, Dict]:
+    #Call a running daemon; used by `main.py submit` and `main.py jobs`
+    if socket_path:
+        conn = _UnixConnection(socket_path)
+    else:
+        parsed = urlparse(url)
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=10.0)
+    try:
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        conn.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b"{}")
+    finally:
+        conn.close()
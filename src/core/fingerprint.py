@@ -0,0 +1,305 @@
+import time
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Union
+
+import numpy as np
+
+from src.utils.logger import metrics
+
+logger = logging.getLogger(__name__)
+
+# Whisper's decode rate; fingerprints are computed at half of it
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = 1024
+HOP_SAMPLES = 512
+# frames processed per FFT block, to bound memory on long recordings
+BLOCK_FRAMES = 4096
+# peaks are band maxima that are also the largest within +-PEAK_FRAMES frames of their band
+BANDS = (4, 16, 32, 64, 96, 128, 192, 256, 384, 513)
+PEAK_FRAMES = 5
+# each peak is paired with the next FAN_OUT peaks no more than MAX_DT frames later
+FAN_OUT = 4
+MAX_DT = 63
+# hash layout: anchor frequency << 15 | target frequency << 6 | dt. Frequencies are half-bins, 0-256,
+# so they take 9 bits each and dt (at most MAX_DT) the low 6
+FREQ_SHIFT, TARGET_SHIFT = 15, 6
+# stored in the index's user_version; bump when hashes change, so old ones are dropped rather than never matching
+FINGERPRINT_VERSION = 2
+# only hashes whose mixed value is 0 modulo this are kept; the same ones survive in every copy
+KEEP_MODULUS = 4
+# a match needs this share of the shorter fingerprint's hashes at one consistent time offset.
+# On synthetic lectures unrelated recordings score ~0.001; added noise, 8-bit requantisation, a
+# lowpass or a 0.05% speed drift still score 0.06 or more.
+MIN_SCORE = 0.05
+# and durations this close: a trimmed or extended recording is a different transcript
+DURATION_TOLERANCE = 0.02
+MIN_DURATION_TOLERANCE_SECONDS = 2.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY,
+    audio_hash TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    duration REAL NOT NULL,
+    hashes INTEGER NOT NULL,
+    duplicate_of TEXT,
+    score REAL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    hash INTEGER NOT NULL,
+    recording INTEGER NOT NULL,
+    offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hashes_hash ON hashes (hash);
+"""
+
+
+@dataclass
+class Fingerprint:
+    hashes: np.ndarray
+    # frame index of each hash's anchor peak
+    offsets: np.ndarray
+    duration: float
+
+
+def _band_peaks(audio: np.ndarray):
+    #Strongest bin and its log magnitude per band and frame, on 8 kHz audio
+    if len(audio) < FRAME_SAMPLES:
+        return np.zeros((0, len(BANDS) - 1), dtype=np.int32), np.zeros((0, len(BANDS) - 1), dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(audio, FRAME_SAMPLES)[::HOP_SAMPLES]
+    window = np.hanning(FRAME_SAMPLES).astype(np.float32)
+    bins, magnitudes = [], []
+    for start in range(0, len(frames), BLOCK_FRAMES):
+        spectrum = np.abs(np.fft.rfft(frames[start:start + BLOCK_FRAMES] * window, axis=1)).astype(np.float32)
+        block_bins = np.empty((len(spectrum), len(BANDS) - 1), dtype=np.int32)
+        for band, (low, high) in enumerate(zip(BANDS[:-1], BANDS[1:])):
+            block_bins[:, band] = low + np.argmax(spectrum[:, low:high], axis=1)
+        bins.append(block_bins)
+        magnitudes.append(np.log(np.take_along_axis(spectrum, block_bins, axis=1) + 1e-6))
+    return np.concatenate(bins), np.concatenate(magnitudes)
+
+
+class FingerprintBuilder:
+    #compute_fingerprint over audio that arrives in blocks, such as stream_decode.stream_audio's.
+    #Only the per-frame band peaks are kept (about 4 MB an hour), and the result is the same as
+    #fingerprinting the whole recording at once.
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.samples = 0
+        # an odd sample left over from downsampling, and 8 kHz samples not yet in a whole frame
+        self._odd = np.zeros(0, dtype=np.float32)
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._bins, self._magnitudes = [], []
+
+    def add(self, audio: np.ndarray) -> None:
+        self.samples += len(audio)
+        audio = np.concatenate([self._odd, audio.astype(np.float32, copy=False)])
+        even = len(audio) - len(audio) % 2
+        self._odd = audio[even:]
+        audio = np.concatenate([self._tail, audio[:even].reshape(-1, 2).mean(axis=1, dtype=np.float32)])
+        if len(audio) < FRAME_SAMPLES:
+            self._tail = audio
+            return
+        frames = (len(audio) - FRAME_SAMPLES) // HOP_SAMPLES + 1
+        bins, magnitudes = _band_peaks(audio[:(frames - 1) * HOP_SAMPLES + FRAME_SAMPLES])
+        self._bins.append(bins)
+        self._magnitudes.append(magnitudes)
+        self._tail = audio[frames * HOP_SAMPLES:]
+
+    def finish(self) -> Fingerprint:
+        duration = self.samples / self.sample_rate
+        if not self._bins:
+            return _landmarks(*_band_peaks(self._tail), duration)
+        return _landmarks(np.concatenate(self._bins), np.concatenate(self._magnitudes), duration)
+
+
+def compute_fingerprint(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> Fingerprint:
+    #Landmark hashes of a recording: pairs of spectral peaks as (frequency, frequency, time gap),
+    #which survive re-encoding, resampling and gain changes
+    builder = FingerprintBuilder(sample_rate)
+    builder.add(audio)
+    return builder.finish()
+
+
+def _pack_hashes(anchor: np.ndarray, target: np.ndarray, dt: np.ndarray) -> np.ndarray:
+    return (anchor << FREQ_SHIFT) | (target << TARGET_SHIFT) | dt
+
+
+def _landmarks(bins: np.ndarray, magnitudes: np.ndarray, duration: float) -> Fingerprint:
+    if len(bins) < 2 * PEAK_FRAMES + 1:
+        return Fingerprint(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), duration)
+
+    # a peak is the loudest in its band within +-PEAK_FRAMES frames and louder than the band's quiet floor
+    padded = np.pad(magnitudes, ((PEAK_FRAMES, PEAK_FRAMES), (0, 0)), constant_values=-np.inf)
+    local_max = np.lib.stride_tricks.sliding_window_view(padded, 2 * PEAK_FRAMES + 1, axis=0).max(axis=2)
+    floor = np.percentile(magnitudes, 30, axis=0)
+    frame_index, band = np.nonzero((magnitudes == local_max) & (magnitudes > floor))
+    order = np.argsort(frame_index, kind="stable")
+    times = frame_index[order].astype(np.int64)
+    # half-bin resolution absorbs small pitch and resampling shifts
+    freqs = (bins[frame_index, band][order] // 2).astype(np.int64)
+
+    hashes, offsets = [], []
+    for k in range(1, FAN_OUT + 1):
+        dt = times[k:] - times[:-k]
+        valid = (dt > 0) & (dt <= MAX_DT)
+        hashes.append(_pack_hashes(freqs[:-k][valid], freqs[k:][valid], dt[valid]))
+        offsets.append(times[:-k][valid])
+    hashes, offsets = np.concatenate(hashes), np.concatenate(offsets)
+    mixed = (hashes * 0x9E3779B1) & 0xFFFFFFFF
+    keep = (mixed >> 24) % KEEP_MODULUS == 0
+    return Fingerprint(hashes[keep], offsets[keep].astype(np.int32), duration)
+
+
+def match_score(query: Fingerprint, hashes: np.ndarray, offsets: np.ndarray, stored_count: int) -> float:
+    #Share of the shorter fingerprint's hashes that line up at one time offset between the two
+    if not len(query.hashes) or not len(hashes):
+        return 0.0
+    order = np.argsort(query.hashes, kind="stable")
+    query_hashes, query_offsets = query.hashes[order], query.offsets[order]
+    left = np.searchsorted(query_hashes, hashes, side="left")
+    counts = np.searchsorted(query_hashes, hashes, side="right") - left
+    rows = np.repeat(np.arange(len(hashes)), counts)
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    deltas = offsets[rows].astype(np.int64) - query_offsets[left[rows] + within]
+    if not len(deltas):
+        return 0.0
+    # two binnings, so a true offset on a bin edge is not split between neighbours
+    deltas -= deltas.min()
+    votes = max(np.bincount(deltas // 2).max(), np.bincount((deltas + 1) // 2).max())
+    return float(votes) / min(len(query.hashes), stored_count)
+
+
+class FingerprintIndex:
+    #Persistent SQLite index of audio fingerprints for spotting the same lecture under another file:
+    #a re-upload, or the .m4a of a .mp4 screen capture. Only originals keep their hashes; a duplicate
+    #is stored as a pointer to the original it matched, so later runs resolve it without decoding.
+    def __init__(self, db_path: Union[str, Path], min_score: float = MIN_SCORE):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != FINGERPRINT_VERSION:
+                # an index of older hashes would never match new ones; recordings are fingerprinted
+                # again the next time they are transcribed
+                dropped = self._conn.execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+                self._conn.executescript(f"""
+                    BEGIN;
+                    DELETE FROM hashes;
+                    DELETE FROM recordings;
+                    PRAGMA user_version = {FINGERPRINT_VERSION};
+                    COMMIT;
+                """)
+                if dropped:
+                    logger.info(f"Dropped {dropped} fingerprints made by an older version")
+
+    def get(self, audio_hash: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM recordings WHERE audio_hash = ?", (audio_hash,)).fetchone()
+        return dict(row) if row else None
+
+    def original_of(self, audio_hash: str) -> Optional[Dict]:
+        #The original recording audio_hash was found to duplicate, if it is a known duplicate
+        record = self.get(audio_hash)
+        if not record or not record["duplicate_of"]:
+            return None
+        original = self.get(record["duplicate_of"])
+        return {**original, "score": record["score"]} if original else None
+
+    def match(self, fingerprint: Fingerprint) -> Optional[Dict]:
+        #Best-scoring indexed original of a similar duration, if it scores at least min_score
+        if not len(fingerprint.hashes):
+            return None
+        tolerance = max(MIN_DURATION_TOLERANCE_SECONDS, fingerprint.duration * DURATION_TOLERANCE)
+        with self._lock:
+            candidates = {row["id"]: dict(row) for row in self._conn.execute(
+                "SELECT * FROM recordings WHERE duplicate_of IS NULL AND hashes > 0 AND duration BETWEEN ? AND ?",
+                (fingerprint.duration - tolerance, fingerprint.duration + tolerance))}
+            if not candidates:
+                return None
+            unique = np.unique(fingerprint.hashes).tolist()
+            rows = []
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                rows += self._conn.execute(
+                    f"SELECT hash, recording, offset FROM hashes WHERE hash IN ({','.join('?' * len(batch))})",
+                    batch).fetchall()
+        if not rows:
+            return None
+        found = np.array(rows, dtype=np.int64).reshape(-1, 3)
+        best = None
+        for recording_id in np.unique(found[:, 1]).tolist():
+            if recording_id not in candidates:
+                continue
+            mine = found[found[:, 1] == recording_id]
+            score = match_score(fingerprint, mine[:, 0], mine[:, 2], candidates[recording_id]["hashes"])
+            if score >= self.min_score and (best is None or score > best["score"]):
+                best = {**candidates[recording_id], "score": score}
+        return best
+
+    def add(self, audio_hash: str, recording_path: str, fingerprint: Fingerprint,
+            duplicate_of: Optional[Dict] = None) -> None:
+        #Record a recording: its hashes if it is an original, otherwise which original it duplicates
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM hashes WHERE recording IN "
+                                   "(SELECT id FROM recordings WHERE audio_hash = ?)", (audio_hash,))
+                cursor = self._conn.execute(
+                    "INSERT OR REPLACE INTO recordings (audio_hash, path, duration, hashes, duplicate_of, score, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (audio_hash, str(Path(recording_path).resolve()), fingerprint.duration,
+                     0 if duplicate_of else len(fingerprint.hashes),
+                     duplicate_of["audio_hash"] if duplicate_of else None,
+                     duplicate_of["score"] if duplicate_of else None, time.time()))
+                if not duplicate_of:
+                    self._conn.executemany(
+                        "INSERT INTO hashes (hash, recording, offset) VALUES (?, ?, ?)",
+                        zip(fingerprint.hashes.tolist(), [cursor.lastrowid] * len(fingerprint.hashes),
+                            fingerprint.offsets.tolist()))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            recordings, duplicates = self._conn.execute(
+                "SELECT COUNT(*), COUNT(duplicate_of) FROM recordings").fetchone()
+            hashes = self._conn.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+        return {"recordings": recordings, "duplicates": duplicates, "hashes": hashes}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def fingerprint_audio(audio: np.ndarray) -> Fingerprint:
+    #compute_fingerprint with its cost recorded, so runs show what deduplication adds
+    with metrics.span("fingerprint") as span:
+        fingerprint = compute_fingerprint(audio)
+        span.set(audio_seconds=round(fingerprint.duration, 3), hashes=len(fingerprint.hashes))
+    return fingerprint
+
+
+def fingerprint_stream(blocks: Iterable[np.ndarray]) -> Fingerprint:
+    #fingerprint_audio over a recording decoded block by block
+    with metrics.span("fingerprint", stream=True) as span:
+        builder = FingerprintBuilder()
+        for block in blocks:
+            builder.add(block)
+        fingerprint = builder.finish()
+        span.set(audio_seconds=round(fingerprint.duration, 3), hashes=len(fingerprint.hashes))
+    return fingerprint
@@ -0,0 +1,130 @@
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    recording TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    outputs TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created);
+"""
+
+
+class JobQueue:
+    #Durable FIFO of recordings for the serve daemon, kept in SQLite so queued and interrupted jobs
+    #survive restarts. One connection is shared by every thread behind a lock; WAL with
+    #synchronous=NORMAL keeps a submit to well under a millisecond of fsync-free work.
+    def __init__(self, db_path: Union[str, Path]):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def _row(self, row: Optional[sqlite3.Row]) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["outputs"] = json.loads(job["outputs"]) if job["outputs"] else {}
+        return job
+
+    def submit(self, recording_path: str) -> Dict:
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, recording, status, created) VALUES (?, ?, 'queued', ?)",
+                (job_id, recording_path, time.time()),
+            )
+            return self._row(self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._row(self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        #Most recent first
+        with self._lock:
+            if status:
+                rows = self._conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created DESC LIMIT ?",
+                                          (status, limit)).fetchall()
+            else:
+                rows = self._conn.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def claim(self) -> Optional[Dict]:
+        #Mark the oldest queued job running and return it, or None when nothing is queued
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1").fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', stage = NULL, progress = 0, error = NULL, "
+                    "attempts = attempts + 1, started = ? WHERE id = ?", (time.time(), row["id"]))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._row(self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def set_stage(self, job_id: str, stage: str, progress: float) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET stage = ?, progress = ? WHERE id = ?", (stage, progress, job_id))
+
+    def finish(self, job_id: str, outputs: Dict[str, str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'succeeded', stage = NULL, progress = 1, outputs = ?, finished = ? "
+                "WHERE id = ?", (json.dumps(outputs), time.time(), job_id))
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished = ? WHERE id = ?",
+                               (error, time.time(), job_id))
+
+    def requeue_interrupted(self) -> int:
+        #Put jobs left running by a crashed or killed daemon back in the queue; their manifests
+        #let the rerun skip whatever stages had already finished
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', stage = NULL, progress = 0 WHERE status = 'running'")
+        if cursor.rowcount:
+            logger.info(f"Requeued {cursor.rowcount} interrupted jobs")
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
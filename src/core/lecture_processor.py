@@ -1,34 +1,105 @@
-from pydantic import BaseModel, Field
-from openai import OpenAI
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 import json
-import whisper
-import os
+import threading
 from dotenv import load_dotenv
 import logging
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from src.prompts.prompts import messages
-from src.models.lecture_models import SubTopic, Assignment, DocNotes
-from src.integrations.google_docs import GoogleDocsClient
-from src.integrations.google_sheets import GoogleSheetsClient
-from src.core.note_processor import NoteProcessor
+from src.models.lecture_models import DocNotes, SubTopic, EnhancedDocNotes
+from src.core.note_processor import NoteProcessor, FanOutSession
+from src.core.resources import ResourcePool
+from src.core.transcription_cache import TranscriptionCache
+from src.core.chunking import count_tokens, chunk_segments, text_to_segments, merge_notes
+from src.core.compaction import COMPACTION_VERSION, compact_transcript
+from src.core.transcript_store import open_transcription
+from src.core.search_index import SearchIndex
+from src.core.fingerprint import Fingerprint, FingerprintIndex, fingerprint_audio, fingerprint_stream
+from src.core.manifest import STAGES, ManifestStore, RecordingManifest
+from src.core.streaming import NotesListener, StructuredStream
+from src.utils.file_utils import hash_text
+from src.utils.logger import metrics
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class LectureProcessor:
-    def __init__(self, model_name: str = "gpt-4.1-mini", whisper_model: str = "base"):
+    def __init__(self, model_name: str = "gpt-4.1-mini", whisper_model: str = "base",
+                 pool: Optional[ResourcePool] = None, language: str = "en",
+                 transcription_cache_max_bytes: Optional[int] = None,
+                 chunk_max_tokens: int = 12000, chunk_overlap_tokens: int = 400, chunk_concurrency: int = 4,
+                 vad: bool = True, transcript_format: str = "store", search_index: bool = True,
+                 search_embedder: str = "hashing", enhance_fan_out: bool = False,
+                 enhance_fan_out_concurrency: int = 8, refine_whisper_model: Optional[str] = None,
+                 dedup: bool = True, stream_decode: bool = False, compact_transcripts: bool = True):
         load_dotenv()
-        self.transcriber = whisper.load_model(whisper_model)
+        # share models and clients across recordings when a pool is passed in
+        self.pool = pool or ResourcePool(model_name=model_name, whisper_model=whisper_model)
+        self.whisper_model = whisper_model
+        # tiered transcription: only whisper_model's low-confidence segments are re-decoded with this one
+        self.refine_whisper_model = refine_whisper_model
+        self.language = language
+        # skip silence before Whisper; timestamps are mapped back to the original recording
+        self.vad = vad
+        # decode recordings through ffmpeg block by block, so memory no longer grows with their length
+        self.stream_decode = stream_decode
         self.base_dir = Path(__file__).resolve().parents[2]
         self.model_name = model_name
-        self.transcriptions_dir = self.base_dir/ "data" / "transcriptions"
-        self.notes_dir = self.base_dir/ "data" / "notes"
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # transcripts longer than chunk_max_tokens are extracted chunk by chunk
+        self.chunk_max_tokens = chunk_max_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
+        self.chunk_concurrency = chunk_concurrency
+        # strip fillers and Whisper's repetition loops from the transcript before the first pass sees it
+        self.compact_transcripts = compact_transcripts
+        self.data_dir = self.pool.data_dir
+        self.transcriptions_dir = self.data_dir / "transcriptions"
+        self.notes_dir = self.data_dir / "notes"
+        self.note_processor = NoteProcessor(model_name=self.pool.enhance_model_name, pool=self.pool,
+                                            fan_out=enhance_fan_out, fan_out_concurrency=enhance_fan_out_concurrency)
         
         self.transcriptions_dir.mkdir(parents=True, exist_ok=True)
         self.notes_dir.mkdir(parents=True, exist_ok=True)
+        self.transcription_cache = TranscriptionCache(self.transcriptions_dir, max_bytes=transcription_cache_max_bytes,
+                                                      storage_format=transcript_format)
+        # per-recording stage hashes, so reruns only redo stages whose inputs changed
+        self.manifests = ManifestStore(self.data_dir / "manifests")
+        # publish records wait for the assignment flush, so a crash before it republishes
+        self._pending_publish: List[Tuple[RecordingManifest, str, str, Dict]] = []
+        self._publish_lock = threading.Lock()
+        # audio fingerprints, so the same lecture under another file reuses the first one's transcript and notes
+        self.fingerprints = FingerprintIndex(self.data_dir / "fingerprints" / "index.sqlite3") if dedup else None
+        # transcripts and enhanced notes are indexed for `main.py search` as each recording finishes
+        self.search_index = SearchIndex(self.data_dir / "search" / "index.sqlite3",
+                                        embedder=search_embedder) if search_index else None
+
+    @property
+    def client(self):
+        # the OpenAI client (and the openai package) is only loaded once a stage calls the API
+        return self.pool.get_llm_client()
+
+    @property
+    def transcriber(self):
+        # loaded on first use, so runs whose transcripts already exist never load Whisper
+        return self.pool.get_whisper(self.whisper_model)
+
+    def notes_name(self, recording_path: str) -> str:
+        # notes files carry the manifest key, so same-named recordings in different folders (or
+        # lecture.mp4 next to lecture.m4a) do not overwrite each other's notes
+        return f"{Path(recording_path).stem}-{ManifestStore.key_for(recording_path)}"
+
+    def publish_key(self, recording_path: str) -> str:
+        # what integrations key a recording's docs and events by: its resolved path, as the manifests do
+        return str(Path(recording_path).resolve())
+
+    def transcription_key(self, recording_path: str) -> str:
+        # same audio under a different name or folder shares a key; a different model or language does not
+        return self.transcription_cache.key_for(recording_path, self.transcription_variant, self.language)
+
+    @property
+    def transcription_variant(self) -> str:
+        variant = f"{self.whisper_model}>{self.refine_whisper_model}" if self.refine_whisper_model \
+            else self.whisper_model
+        return f"{variant}+vad" if self.vad else variant
 
     #Transcribes audio file to text and save as JSON
     def transcribe(self, recording_path: str) -> str:
@@ -37,42 +108,229 @@ class LectureProcessor:
             if not rp.exists():
                 logger.error(f"Recording {recording_path} does not exist.")
                 return None
-            recording_name = rp.stem
-            trans_path = self.transcriptions_dir / f"{recording_name}.json"
-            if trans_path.exists():
-                return str(trans_path)
+            key = self.transcription_key(recording_path)
+            cached_path = self.transcription_cache.get(key)
+            if cached_path:
+                logger.info(f"Using cached transcription: {cached_path}")
+                return cached_path
             
-            result = self.transcriber.transcribe(recording_path, language='en', verbose=None)
+            # imported here so runs that never transcribe skip whisper, torch and numba
+            import whisper
+            from src.core.vad import SAMPLE_RATE, transcribe_with_vad
 
-            # Save transcription to JSON file
-            with open(trans_path, 'w', encoding='utf-8') as f:
-                json.dump(result, f, ensure_ascii=False, indent=2)
+            # decoded once for both the fingerprint and Whisper
+            audio = None
+            if not self.stream_decode and self.fingerprints is not None and self.fingerprints.get(self.transcription_cache.audio_hash(recording_path)) is None:
+                with metrics.span("decode"):
+                    audio = whisper.load_audio(recording_path)
+            duplicate_path = self.duplicate_transcription(recording_path, audio)
+            if duplicate_path:
+                return duplicate_path
+
+            # the models this recording is transcribed with, counted as reused once per recording
+            for size in filter(None, (self.whisper_model, self.refine_whisper_model)):
+                self.pool.get_whisper(size, recording=recording_path)
+
+            checkpoint_path = None
+            if self.stream_decode:
+                from src.core.stream_decode import checkpoint_path_for, transcribe_streaming
+
+                checkpoint_path = checkpoint_path_for(self.transcription_cache.path_for(key))
+                result = transcribe_streaming(
+                    self.transcriber, recording_path, self.language, vad=self.vad, checkpoint_path=checkpoint_path,
+                    refine_model=self.pool.get_whisper(self.refine_whisper_model) if self.refine_whisper_model else None,
+                    refine_model_name=self.refine_whisper_model)
+            elif self.refine_whisper_model:
+                from src.core.tiered_transcription import transcribe_tiered
+
+                result = transcribe_tiered(self.transcriber, self.pool.get_whisper(self.refine_whisper_model),
+                                           self.refine_whisper_model, recording_path, self.language, vad=self.vad,
+                                           audio=audio)
+            elif self.vad:
+                result = transcribe_with_vad(self.transcriber, recording_path, self.language, audio=audio)
+            else:
+                if audio is None:
+                    with metrics.span("decode"):
+                        audio = whisper.load_audio(recording_path)
+                audio_seconds = len(audio) / SAMPLE_RATE
+                metrics.incr("audio_seconds", audio_seconds)
+                with metrics.span("whisper", vad=False) as span:
+                    result = self.transcriber.transcribe(audio, language=self.language, verbose=None)
+                    span.set(audio_seconds=audio_seconds,
+                             rtf=span.elapsed / audio_seconds if audio_seconds else None)
+
+            # Save transcription to the cache
+            trans_path = self.transcription_cache.put(key, result, recording_path, self.transcription_variant, self.language)
+            if checkpoint_path:
+                checkpoint_path.unlink(missing_ok=True)
             logger.info(f"Transcription saved to: {trans_path}")
-            return str(trans_path)
+            return trans_path
         except Exception as e:
             logger.error(f"Error transcribing {recording_path}: {e}")
             return None
 
-    #Extracts structured notes from transcription text using OpenAI API
-    def extract_structured_notes(self, transcription_text: str) -> Optional[DocNotes]:
-        
+    def _fingerprint_file(self, recording_path: str, audio=None) -> Optional[Fingerprint]:
+        #Fingerprint of a recording not yet in the index (None for known ones, or on failure)
+        if self.fingerprints.get(self.transcription_cache.audio_hash(recording_path)):
+            return None
+        try:
+            if audio is None and self.stream_decode:
+                from src.core.stream_decode import stream_audio
+
+                return fingerprint_stream(stream_audio(recording_path))
+            if audio is None:
+                import whisper
+
+                with metrics.span("decode"):
+                    audio = whisper.load_audio(recording_path)
+            return fingerprint_audio(audio)
+        except Exception as e:
+            logger.error(f"Error fingerprinting {recording_path}: {e}")
+            return None
+
+    def _register_fingerprint(self, recording_path: str, fingerprint: Optional[Fingerprint]) -> Optional[Dict]:
+        #Index a new fingerprint and return the original it matched; known recordings are looked up instead
+        audio_hash = self.transcription_cache.audio_hash(recording_path)
+        if fingerprint is None:
+            return self.fingerprints.original_of(audio_hash)
+        original = self.fingerprints.match(fingerprint)
+        self.fingerprints.add(audio_hash, recording_path, fingerprint, duplicate_of=original)
+        if original:
+            logger.info(f"{Path(recording_path).name} is the same lecture as {Path(original['path']).name} "
+                        f"(fingerprint score {original['score']:.2f})")
+        return original
+
+    def find_duplicate(self, recording_path: str, audio=None) -> Optional[Dict]:
+        #The indexed original that recording_path is a copy of, fingerprinting it first if it is new.
+        #New recordings are indexed either way; audio is the decoded recording, when already at hand.
+        if self.fingerprints is None:
+            return None
+        return self._register_fingerprint(recording_path, self._fingerprint_file(recording_path, audio))
+
+    def duplicate_transcription(self, recording_path: str, audio=None) -> Optional[str]:
+        #The cached transcription of the lecture recording_path duplicates, if there is one
+        original = self.find_duplicate(recording_path, audio)
+        if not original:
+            return None
+        path = self.transcription_cache.get(
+            self.transcription_cache.key_for_hash(original["audio_hash"], self.transcription_variant, self.language))
+        if path:
+            metrics.incr("duplicates_reused", stage="transcribe")
+            logger.info(f"Reusing the transcription of {Path(original['path']).name}: {path}")
+        return path
+
+    def duplicate_stage(self, stage: str, recording_path: str, input_hash: str) -> Optional[Dict]:
+        #The manifest record of stage for the lecture recording_path duplicates, if it ran on the same input
+        if self.fingerprints is None:
+            return None
+        original = self.fingerprints.original_of(self.transcription_cache.audio_hash(recording_path))
+        if not original:
+            return None
+        original_manifest = self.manifests.for_recording(original["path"])
+        if original_manifest.staleness(stage, input_hash) is not None:
+            return None
+        metrics.incr("duplicates_reused", stage=stage)
+        logger.info(f"Reusing the {stage} output of {Path(original['path']).name}")
+        return original_manifest.get(stage)
+
+    def transcribe_many(self, recording_paths: List[str], workers: int) -> None:
+        #Transcribe cache misses across worker processes so later stages find them in the cache.
+        #Copies of a lecture already transcribed, or earlier in this batch, are left to reuse it.
+        misses = {}
+        for recording_path in recording_paths:
+            key = self.transcription_key(recording_path)
+            if not self.transcription_cache.get(key):
+                misses[recording_path] = key
+        if self.fingerprints is not None and misses:
+            # fingerprinting is mostly ffmpeg decode and FFTs, both of which release the GIL
+            with ThreadPoolExecutor(max_workers=min(4, len(misses))) as executor:
+                fingerprints = dict(zip(misses, executor.map(self._fingerprint_file, misses)))
+            pending = {str(Path(recording_path).resolve()) for recording_path in misses}
+            for recording_path in list(misses):
+                original = self._register_fingerprint(recording_path, fingerprints[recording_path])
+                if original and (original["path"] in pending or self.duplicate_transcription(recording_path)):
+                    pending.discard(str(Path(recording_path).resolve()))
+                    del misses[recording_path]
+        if not misses:
+            return
+        from src.core.transcribe_pool import TranscriptionPool
+
+        results = TranscriptionPool(self.whisper_model, workers=workers, language=self.language,
+                                    vad=self.vad, refine_model=self.refine_whisper_model,
+                                    stream_decode=self.stream_decode).transcribe_all(
+            [(recording_path, self.transcription_cache.path_for(key)) for recording_path, key in misses.items()]
+        )
+        for recording_path, trans_path in results.items():
+            if trans_path:
+                self.transcription_cache.add(misses[recording_path], recording_path, self.transcription_variant,
+                                             self.language)
+
+    def _prompt_messages(self, transcription_text: str, part: str = "") -> List[Dict]:
         system_msg = messages[0]['content'] if messages and 'content' in messages[0] else \
                 "You are a careful note-taking assistant."
-        prompt_messages = [
+        return [
                 {'role': 'system', 'content': system_msg},
                 {'role': 'user',
-                 'content': f"Please analyze this lecture transcription and extract structured notes:\n\n{transcription_text}"}
+                 'content': f"Please analyze this lecture transcription{part} and extract structured notes:\n\n{transcription_text}"}
             ]
-        
+
+    def prompt_transcript(self, transcription_text: str,
+                          segments: Optional[List[Dict]] = None) -> Tuple[str, Optional[List[Dict]]]:
+        #The transcript text and segments as the first pass sends them
+        if not self.compact_transcripts:
+            return transcription_text, segments
+        compacted_text, compacted_segments, stats = compact_transcript(transcription_text, segments)
+        logger.debug(f"Compacted transcript by {stats.saved_fraction:.0%}: {stats.fillers} fillers, "
+                     f"{stats.repeats} repeats, {stats.dropped_segments} segments dropped")
+        return compacted_text, compacted_segments
+
+    def build_extraction_prompts(self, transcription_text: str, segments: Optional[List[Dict]] = None,
+                                 compacted: bool = False) -> List[List[Dict]]:
+        #One prompt for a short transcript, or one per token-bounded chunk of a long one;
+        #compacted says prompt_transcript has already been applied
+        if not compacted:
+            transcription_text, segments = self.prompt_transcript(transcription_text, segments)
+        if count_tokens(transcription_text, self.model_name) <= self.chunk_max_tokens:
+            return [self._prompt_messages(transcription_text)]
+        chunks = chunk_segments(segments or text_to_segments(transcription_text), self.model_name,
+                                self.chunk_max_tokens, self.chunk_overlap_tokens)
+        return [self._prompt_messages(chunk, f" (part {i} of {len(chunks)})") for i, chunk in enumerate(chunks, 1)]
+
+    #Extracts structured notes from transcription text using OpenAI API
+    #With a listener the response is streamed and the main topic and each subtopic are handed to it as
+    #soon as they are complete; the returned notes are the same validated DocNotes either way
+    def extract_structured_notes(self, transcription_text: str, segments: Optional[List[Dict]] = None,
+                                 listener: Optional[NotesListener] = None) -> Optional[DocNotes]:
         logger.info("Extracting structured notes from transcription...")
 
-        response = self.client.responses.parse(
-                input=prompt_messages,
-                model=self.model_name,
-                text_format=DocNotes,
+        prompts = self.build_extraction_prompts(transcription_text, segments)
+        stream = None
+        if listener is not None:
+            stream = StructuredStream(
+                "sub_topics", SubTopic,
+                on_item=lambda index, subtopic: listener.on_subtopic("extract", index, subtopic),
+                on_field=lambda name, value: listener.on_main_topic(value) if name == "main_topic" else None,
             )
-        
-        notes: DocNotes = response.output_parsed
+        if len(prompts) == 1:
+            notes: DocNotes = self.pool.llm_cache.parse(
+                self.pool.get_llm_client, prompts[0], self.model_name, DocNotes,
+                **({"on_delta": stream.feed, "on_restart": stream.restart} if stream else {}))
+            if stream:
+                stream.finish(notes)
+            logger.info("Structured notes extracted successfully.")
+            return notes
+
+        # Long lecture: extract each chunk concurrently, then merge
+        logger.info(f"Transcription split into {len(prompts)} chunks for extraction")
+        with ThreadPoolExecutor(max_workers=min(self.chunk_concurrency, len(prompts))) as executor:
+            chunk_notes = list(executor.map(
+                lambda prompt_messages: self.pool.llm_cache.parse(self.pool.get_llm_client, prompt_messages, self.model_name, DocNotes),
+                prompts,
+            ))
+        notes = merge_notes(chunk_notes)
+        # chunk results are only final once merged, so they are not streamed
+        if stream:
+            stream.finish(notes)
         logger.info("Structured notes extracted successfully.")
         return notes
     
@@ -90,89 +348,275 @@ class LectureProcessor:
             logger.error(f"Error saving notes: {e}")
             return None
 
-    def process_lecture(self, recording_path: str) -> Optional[DocNotes]:
+    def load_transcription(self, transcription_path: str) -> Optional[Dict]:
+        #Load a saved transcription (text plus Whisper segments); stores are read lazily
         try:
-            # Transcribe audio
-            logger.info(f"Starting processing of: {recording_path}")
-            transcription_path = self.transcribe(recording_path)
-            if not transcription_path:
-                return None
-            
-            # Load transcription text
+            transcription_data = open_transcription(transcription_path)
+            logger.info("Transcription loaded successfully")
+            return transcription_data
+        except Exception as e:
+            logger.error(f"Error loading transcription: {e}")
+            return None
+
+    def load_transcription_text(self, transcription_path: str) -> Optional[str]:
+        #Load the plain transcript text from a saved transcription
+        transcription_data = self.load_transcription(transcription_path)
+        return transcription_data['text'] if transcription_data else None
+
+    def enhance_notes(self, notes: DocNotes, recording_name: str, listener: Optional[NotesListener] = None,
+                      session: Optional[FanOutSession] = None) -> Tuple[Optional[EnhancedDocNotes], int]:
+        #Second pass for enhanced notes, saved to data/detailed_notes; also returns how many
+        #fan-out requests failed and fell back to first-pass content
+        final_notes, failed = self.note_processor.enhance(notes, listener, session)
+
+        saved_final_notes_path = self.note_processor.save_notes(final_notes, recording_name) if final_notes else None
+        if saved_final_notes_path:
+            logger.info(f"Processing complete! Enhanced notes saved to: {saved_final_notes_path}")
+        return final_notes, failed
+
+    def publish_notes(self, final_notes: EnhancedDocNotes, recording_name: Optional[str] = None,
+                      flush: bool = True) -> Dict[str, str]:
+        #Publish the enhanced notes to every configured integration (by default a Google Doc plus
+        #the shared assignments tracker) and return the IDs they report.
+        #Directory runs pass flush=False and call flush_publishing() once at the end.
+        outputs: Dict[str, str] = {}
+        recording_name = recording_name or final_notes.main_topic
+        for integration in self.pool.get_integrations(recording=recording_name):
+            outputs.update(integration.publish(final_notes, recording_name))
+        if flush:
+            self.flush_publishing()
+        return outputs
+
+    def prepare_publishing(self, recording_name: str, main_topic: str) -> None:
+        #Let integrations set up what does not depend on the finished notes (e.g. create the doc)
+        #while the notes are still being written
+        for integration in self.pool.get_integrations():
             try:
-                with open(transcription_path, 'r', encoding='utf-8') as f:
-                    transcription_data = json.load(f)
-                transcription_text = transcription_data['text']
-                logger.info("Transcription loaded successfully")
+                integration.prepare(recording_name, main_topic)
             except Exception as e:
-                logger.error(f"Error loading transcription: {e}")
+                logger.warning(f"Preparing {integration.name} for {recording_name} failed: {e}")
+
+    def flush_publishing(self) -> None:
+        #Write anything the integrations queued (assignment rows, ...) in bulk, then mark their recordings as published
+        try:
+            for integration in self.pool.loaded_integrations():
+                integration.flush()
+        except Exception:
+            # leave those recordings stale so the next run queues their rows again
+            with self._publish_lock:
+                self._pending_publish = []
+            raise
+        with self._publish_lock:
+            pending, self._pending_publish = self._pending_publish, []
+        for manifest, input_hash, output_hash, outputs in pending:
+            manifest.record("publish", input_hash, output_hash, **outputs)
+
+    def extraction_fingerprint(self) -> str:
+        #Changes whenever the first-pass model, prompt, schema, chunking or transcript compaction does
+        return hash_text(self.model_name, json.dumps(messages, sort_keys=True),
+                         json.dumps(DocNotes.model_json_schema(), sort_keys=True),
+                         str(self.chunk_max_tokens), str(self.chunk_overlap_tokens),
+                         *([f"compact-v{COMPACTION_VERSION}"] if self.compact_transcripts else []))
+
+    def stage_input(self, stage: str, recording_path: str, upstream_hash: Optional[str]) -> str:
+        #Input hash of stage: the previous stage's output hash plus everything else the stage depends on
+        if stage == "transcribe":
+            return self.transcription_key(recording_path)
+        if stage == "extract":
+            return hash_text(upstream_hash, self.extraction_fingerprint())
+        if stage == "enhance":
+            return hash_text(upstream_hash, self.note_processor.fingerprint())
+        # the calendar ID only counts once set, so adding it left existing publish records valid
+        return hash_text(upstream_hash, Path(recording_path).stem, self.pool.tracker_id or "",
+                         ",".join(self.pool.integration_names),
+                         *([self.pool.calendar_id] if self.pool.calendar_id else []))
+
+    def plan(self, recording_path: str) -> List[Tuple[str, Optional[str]]]:
+        #(stage, reason it would run or None) for each stage, without running anything.
+        #Stages after a stale one are listed as depending on it, since an identical output would still skip them.
+        manifest = self.manifests.for_recording(recording_path)
+        plan = []
+        upstream_hash = None
+        for stage in STAGES:
+            if plan and plan[-1][1]:
+                plan.append((stage, "never run" if manifest.get(stage) is None
+                             else f"if {plan[-1][0]} output changes"))
+                continue
+            plan.append((stage, manifest.staleness(stage, self.stage_input(stage, recording_path, upstream_hash))))
+            upstream_hash = manifest.output_hash(stage)
+        return plan
+
+    def transcribe_stage(self, recording_path: str, manifest: RecordingManifest) -> Optional[str]:
+        if not Path(recording_path).exists():
+            logger.error(f"Recording {recording_path} does not exist.")
+            return None
+        with metrics.span("stage", stage="transcribe") as span:
+            span.set(recording=Path(recording_path).name)
+            input_hash = self.stage_input("transcribe", recording_path, None)
+            if manifest.staleness("transcribe", input_hash) is None:
+                span.set(skipped=True)
+                logger.info(f"Transcription is up to date: {manifest.get('transcribe')['path']}")
+                return manifest.get("transcribe")["path"]
+            transcription_path = self.transcribe(recording_path)
+            transcription_data = self.load_transcription(transcription_path) if transcription_path else None
+            if transcription_data is None:
                 return None
-            
+            manifest.record("transcribe", input_hash, hash_text(transcription_data['text']), path=transcription_path)
+            return transcription_path
+
+    def extract_stage(self, recording_path: str, manifest: RecordingManifest, transcription_path: str,
+                      listener: Optional[NotesListener] = None) -> Optional[DocNotes]:
+        with metrics.span("stage", stage="extract") as span:
+            span.set(recording=Path(recording_path).name)
+            input_hash = self.stage_input("extract", recording_path, manifest.output_hash("transcribe"))
+            if manifest.staleness("extract", input_hash) is None:
+                span.set(skipped=True)
+                logger.info("First pass notes are up to date")
+                return DocNotes.model_validate_json(Path(manifest.get("extract")["path"]).read_text(encoding='utf-8'))
+            duplicate = self.duplicate_stage("extract", recording_path, input_hash)
+            if duplicate:
+                # a copy of an already extracted lecture: same transcript, so the same notes under this name
+                span.set(duplicate=True)
+                notes = DocNotes.model_validate_json(Path(duplicate["path"]).read_text(encoding='utf-8'))
+                saved_notes_path = self.save_notes(notes, self.notes_name(recording_path))
+                if saved_notes_path:
+                    manifest.record("extract", input_hash, duplicate["output"], path=saved_notes_path)
+                return notes
+            transcription_data = self.load_transcription(transcription_path)
+            if transcription_data is None:
+                return None
+            notes = self.extract_structured_notes(transcription_data['text'], transcription_data.get('segments'),
+                                                  listener)
+            if not notes:
+                return None
+            saved_notes_path = self.save_notes(notes, self.notes_name(recording_path))
+            if saved_notes_path:
+                logger.info(f"First pass notes saved to: {saved_notes_path}")
+                manifest.record("extract", input_hash, hash_text(notes.model_dump_json()), path=saved_notes_path)
+            return notes
+
+    def enhance_stage(self, recording_path: str, manifest: RecordingManifest, notes: DocNotes,
+                      listener: Optional[NotesListener] = None,
+                      session: Optional[FanOutSession] = None) -> Optional[EnhancedDocNotes]:
+        with metrics.span("stage", stage="enhance") as span:
+            span.set(recording=Path(recording_path).name)
+            # hash the notes themselves, since up-to-date notes are loaded rather than re-extracted
+            input_hash = self.stage_input("enhance", recording_path, hash_text(notes.model_dump_json()))
+            if manifest.staleness("enhance", input_hash) is None:
+                span.set(skipped=True)
+                logger.info("Enhanced notes are up to date")
+                return EnhancedDocNotes.model_validate_json(
+                    Path(manifest.get("enhance")["path"]).read_text(encoding='utf-8'))
+            duplicate = self.duplicate_stage("enhance", recording_path, input_hash)
+            if duplicate:
+                span.set(duplicate=True)
+                final_notes = EnhancedDocNotes.model_validate_json(Path(duplicate["path"]).read_text(encoding='utf-8'))
+                saved_path = self.note_processor.save_notes(final_notes, self.notes_name(recording_path))
+                if saved_path:
+                    manifest.record("enhance", input_hash, duplicate["output"], path=saved_path)
+                    self.update_search_index(manifest)
+                return final_notes
+            final_notes, failed = self.enhance_notes(notes, self.notes_name(recording_path), listener, session)
+            if failed:
+                # not recorded, so the next run retries; the parts that succeeded come back from the LLM cache
+                span.set(failed_parts=failed)
+                logger.warning("Enhanced notes are partial; the next run retries the failed parts")
+            elif final_notes:
+                manifest.record("enhance", input_hash, hash_text(final_notes.model_dump_json()),
+                                path=str(self.note_processor.final_notes_dir / f"{self.notes_name(recording_path)}_notes.json"))
+                self.update_search_index(manifest)
+            return final_notes
+
+    def publish_stage(self, recording_path: str, manifest: RecordingManifest,
+                      final_notes: EnhancedDocNotes, flush: bool = True) -> None:
+        with metrics.span("stage", stage="publish") as span:
+            span.set(recording=Path(recording_path).name)
+            input_hash = self.stage_input("publish", recording_path, hash_text(final_notes.model_dump_json()))
+            if manifest.staleness("publish", input_hash) is None:
+                span.set(skipped=True)
+                logger.info(f"Already published: {manifest.get('publish').get('outputs')}")
+                return
+            outputs = self.publish_notes(final_notes, self.publish_key(recording_path), flush=False)
+            with self._publish_lock:
+                self._pending_publish.append((manifest, input_hash, hash_text(json.dumps(outputs, sort_keys=True)),
+                                              {"outputs": outputs}))
+            if flush:
+                self.flush_publishing()
+
+    def update_search_index(self, manifest: RecordingManifest) -> None:
+        #Index whatever changed for this recording; a failure here never fails the recording
+        if self.search_index is None:
+            return
+        try:
+            self.search_index.index_manifest(manifest.path, manifest.data)
+        except Exception as e:
+            logger.error(f"Error updating the search index: {e}")
+
+    def process_lecture(self, recording_path: str, flush_publishing: bool = True,
+                        listener: Optional[NotesListener] = None) -> Optional[EnhancedDocNotes]:
+        #Run the stages whose inputs changed since the recording's manifest was written.
+        #A listener turns on streaming: it sees notes as they are written, fan-out enhancement starts on
+        #each first-pass subtopic as it arrives and the integrations prepare while the notes are written.
+        session = None
+        background = None
+        try:
+            logger.info(f"Starting processing of: {recording_path}")
+            manifest = self.manifests.for_recording(recording_path)
+
+            # Transcribe audio
+            transcription_path = self.transcribe_stage(recording_path, manifest)
+            if not transcription_path:
+                return None
+
+            prepared = []
+            if listener is not None:
+                background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prepare")
+                listener = _PreparingListener(self, self.publish_key(recording_path), background, prepared, listener)
+                if self.note_processor.fan_out:
+                    listener = session = FanOutSession(self.note_processor, listener)
+
             # Extract structured notes
-            notes = self.extract_structured_notes(transcription_text)
+            notes = self.extract_stage(recording_path, manifest, transcription_path, listener)
             if not notes:
                 return None
-            # Second pass for enhanced notes
-            note_processor = NoteProcessor()
-            final_notes = note_processor.process_notes(notes)
 
-            # Save notes
-            recording_name = Path(recording_path).stem
-            saved_notes_path = self.save_notes(notes, recording_name)
-            saved_final_notes_path = note_processor.save_notes(final_notes, recording_name) if final_notes else None
-            if saved_notes_path:
-                logger.info(f"Processing complete! First pass notes saved to: {saved_notes_path}")
-            if saved_final_notes_path:
-                logger.info(f"Processing complete! First pass notes saved to: {saved_final_notes_path}")    
-            doc_client = GoogleDocsClient()
-            sheet_client = GoogleSheetsClient()
-
-            logger.info(f"Creating doc with title {final_notes.main_topic} - Lecture Notes")
-            doc_id = doc_client.create_doc(f"{final_notes.main_topic} - Lecture Notes")
-            logger.info(f"Doc created with ID: {doc_id}")
-
-            logger.info("Writing notes to Google Doc...")
-            notes_text = f"\nMain Topic: {final_notes.main_topic}"
-            if final_notes.sub_topics:
-                notes_text += f"\n📋 Subtopics ({len(final_notes.sub_topics)}):"
-                for i, subtopic in enumerate(final_notes.sub_topics, 1):
-                    notes_text += f"\n  {i}. {subtopic.title}"
-                    notes_text += f"     {subtopic.description}"
-                    notes_text += f"     Practice Questions: {', '.join(subtopic.practice_questions)}" if subtopic.practice_questions else ""
-                    notes_text += f"     Definitions: {', '.join(subtopic.definitions)}" if subtopic.definitions else ""
-                    if subtopic.examples:
-                        notes_text += f"     Examples: {', '.join(subtopic.examples)}"
-
-            if final_notes.assignments:
-                notes_text += f"\nAssignments ({len(final_notes.assignments)}):"
-                for assignment in final_notes.assignments:
-                    notes_text += f"  • {assignment.title}"
-                    notes_text += f"    Due: {assignment.due_date}"
-                    if assignment.description:
-                        notes_text += f"    📄 Details: {assignment.description}"
-            
-            if final_notes.key_takeaways:
-                notes_text += f"\nKey Takeaways:"
-                for takeaway in final_notes.key_takeaways:
-                    notes_text += f"  • {takeaway}"
-            
+            # Second pass for enhanced notes
+            final_notes = self.enhance_stage(recording_path, manifest, notes, listener, session)
+            if not final_notes:
+                return None
 
-            doc_client.write_text(doc_id, notes_text)
-            logger.info("Notes written to Google Doc successfully.")
-            if final_notes.assignments:
-                logger.info("Writing assignments to Google Sheet...")
-                sheet_id = sheet_client.create_spreadsheet("Assignments_Tracker")
-                sheet_client.write_data(
-                    sheet_id,
-                    "Sheet1!A:C",
-                    [[assignment.title, assignment.description or "", assignment.due_date] for assignment in final_notes.assignments]
-                )
+            # the doc must exist before it is written to
+            for future in prepared:
+                future.result()
+            self.publish_stage(recording_path, manifest, final_notes, flush=flush_publishing)
             return final_notes
             
         except Exception as e:
             logger.error(f"Error in process_lecture: {e}")
             return None
-        
+        finally:
+            if session:
+                session.close()
+            if background:
+                background.shutdown(wait=True)
+
+
+class _PreparingListener(NotesListener):
+    #Forwards events to listener and, once the first pass names the main topic, prepares publishing in
+    #the background; prepare_publishing never raises, so the futures only say when it is done
+    def __init__(self, processor: LectureProcessor, recording_name: str, executor: ThreadPoolExecutor,
+                 prepared: List, listener: NotesListener):
+        self.processor = processor
+        self.recording_name = recording_name
+        self.executor = executor
+        self.prepared = prepared
+        self.listener = listener
 
+    def on_main_topic(self, main_topic: str) -> None:
+        if not self.prepared:
+            self.prepared.append(self.executor.submit(self.processor.prepare_publishing,
+                                                      self.recording_name, main_topic))
+        self.listener.on_main_topic(main_topic)
 
-    
\ No newline at end of file
+    def on_subtopic(self, stage: str, index: int, subtopic) -> None:
+        self.listener.on_subtopic(stage, index, subtopic)
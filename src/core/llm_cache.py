@@ -0,0 +1,121 @@
+import os
+import json
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+from src.utils.file_utils import hash_text
+from src.utils.logger import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    #On-disk cache of structured responses, keyed on the model, the full prompt and the response schema,
+    #so editing a prompt or a Pydantic model invalidates old entries without any bookkeeping
+    def __init__(self, cache_dir: Path, max_bytes: Optional[int] = None, enabled: bool = True):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # running size of the entries, so put() only scans the directory once the cache is over budget
+        self._total_bytes = sum(f.stat().st_size for f in self.cache_dir.glob("*.json")) \
+            if max_bytes is not None else 0
+
+    @staticmethod
+    def key_for(prompt_messages: List[Dict], model: str, text_format: Type[BaseModel]) -> str:
+        return hash_text(
+            model,
+            text_format.__name__,
+            json.dumps(text_format.model_json_schema(), sort_keys=True),
+            json.dumps(prompt_messages, sort_keys=True, ensure_ascii=False),
+        )
+
+    def _path_for(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def contains(self, prompt_messages: List[Dict], model: str, text_format: Type[BaseModel]) -> bool:
+        #Whether parse() would answer this request from disk, without touching the entry
+        return self.enabled and self._path_for(self.key_for(prompt_messages, model, text_format)).exists()
+
+    def get(self, key: str, text_format: Type[BaseModel]) -> Optional[BaseModel]:
+        path = self._path_for(key)
+        try:
+            parsed = text_format.model_validate_json(path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable LLM cache entry {path.name}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+        # mtime doubles as the LRU timestamp
+        os.utime(path)
+        return parsed
+
+    def put(self, key: str, parsed: BaseModel) -> None:
+        path = self._path_for(key)
+        data = parsed.model_dump_json().encode('utf-8')
+        # a temp file of its own, since pipeline threads and batch runs can write the same key at once
+        with tempfile.NamedTemporaryFile('wb', dir=self.cache_dir, prefix=f"{key}.",
+                                         suffix=".tmp", delete=False) as f:
+            f.write(data)
+        with self._lock:
+            try:
+                replaced = path.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+            try:
+                os.replace(f.name, path)
+            except OSError:
+                Path(f.name).unlink(missing_ok=True)
+                raise
+            self._total_bytes += len(data) - replaced
+            over = self.max_bytes is not None and self._total_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self) -> None:
+        #Delete least recently used entries until the cache fits in max_bytes; the scan also
+        #corrects the running total for entries removed or discarded behind its back
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            files = [(f, f.stat()) for f in self.cache_dir.glob("*.json")]
+            total = sum(stat.st_size for _, stat in files)
+            for f, stat in sorted(files, key=lambda item: item[1].st_mtime):
+                if total <= self.max_bytes:
+                    break
+                f.unlink(missing_ok=True)
+                total -= stat.st_size
+            self._total_bytes = total
+
+    def parse(self, client, prompt_messages: List[Dict], model: str,
+              text_format: Type[BaseModel], **stream_callbacks) -> BaseModel:
+        #Serve repeats from disk, otherwise ask client (an AsyncLLMClient) for a parsed response.
+        #client may also be a zero-argument callable returning one, so cache hits never build it.
+        #stream_callbacks (on_delta, on_restart) stream a miss; hits return at once without them.
+        client_factory = client if not hasattr(client, "parse") else (lambda: client)
+        if not self.enabled:
+            return client_factory().parse(prompt_messages, model, text_format, **stream_callbacks)
+        key = self.key_for(prompt_messages, model, text_format)
+        cached = self.get(key, text_format)
+        with self._lock:
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.incr("cache_requests", cache="llm", result="hit" if cached is not None else "miss")
+        if cached is not None:
+            logger.info(f"Using cached {text_format.__name__} response")
+            return cached
+        parsed = client_factory().parse(prompt_messages, model, text_format, **stream_callbacks)
+        if parsed is not None:
+            self.put(key, parsed)
+        return parsed
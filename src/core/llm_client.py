@@ -0,0 +1,174 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Type
+
+import openai
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+
+from src.core.chunking import count_tokens
+from src.utils.logger import metrics
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying; anything else (bad request, auth, schema) fails straight away
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class TokenBucket:
+    #Async token bucket refilled continuously at capacity per minute
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # a single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    #Server-requested delay from Retry-After / retry-after-ms headers, if any
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class AsyncLLMClient:
+    #Shared OpenAI request layer: a concurrency cap, request/token rate limits and jittered
+    #exponential backoff, running on one background event loop that any thread can submit to
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 max_concurrency: int = 8, requests_per_minute: int = 500,
+                 tokens_per_minute: int = 200_000, max_retries: int = 6,
+                 base_delay: float = 1.0, max_delay: float = 60.0,
+                 expected_output_tokens: int = 2_000, timeout: float = 600.0):
+        # retries are handled here so they share the rate limiter, not inside the SDK
+        self.client = AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            base_url=base_url or os.getenv("OPENAI_BASE_URL"),
+            max_retries=0,
+            timeout=timeout,
+        )
+        self.max_concurrency = max_concurrency
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.expected_output_tokens = expected_output_tokens
+        self.retries = 0
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-client", daemon=True)
+        self._thread.start()
+
+    def estimate_tokens(self, prompt_messages: List[Dict], model: str) -> int:
+        prompt_tokens = sum(count_tokens(message['content'], model) for message in prompt_messages)
+        return prompt_tokens + self.expected_output_tokens
+
+    def backoff_delay(self, attempt: int, error: Exception) -> float:
+        # full jitter, but never sooner than the server asked for
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = retry_after_seconds(error)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    async def _stream(self, prompt_messages: List[Dict], model: str, text_format: Type[BaseModel],
+                      on_delta: Callable[[str], None], span) -> object:
+        #Same request as responses.parse, but hands each output text delta to on_delta as it arrives
+        started = time.perf_counter()
+        async with self.client.responses.stream(input=prompt_messages, model=model, text_format=text_format) as stream:
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    if "first_token" not in span.attrs:
+                        span.set(first_token=round(time.perf_counter() - started, 6))
+                    on_delta(event.delta)
+            return await stream.get_final_response()
+
+    async def parse_async(self, prompt_messages: List[Dict], model: str, text_format: Type[BaseModel],
+                          on_delta: Optional[Callable[[str], None]] = None,
+                          on_restart: Optional[Callable[[], None]] = None) -> BaseModel:
+        #With on_delta the response is streamed; on_restart is called before a retry re-sends it
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        estimated_tokens = self.estimate_tokens(prompt_messages, model)
+        attempt = 0
+        with metrics.span("openai", model=model, schema=text_format.__name__, stream=on_delta is not None) as span:
+            while True:
+                queued = time.perf_counter()
+                await self.request_bucket.acquire()
+                await self.token_bucket.acquire(estimated_tokens)
+                span.set(rate_limit_wait=round(span.attrs.get("rate_limit_wait", 0.0)
+                                               + time.perf_counter() - queued, 6))
+                try:
+                    async with self._semaphore:
+                        if on_delta is None:
+                            response = await self.client.responses.parse(
+                                input=prompt_messages,
+                                model=model,
+                                text_format=text_format,
+                            )
+                        else:
+                            response = await self._stream(prompt_messages, model, text_format, on_delta, span)
+                    usage = getattr(response, "usage", None)
+                    if usage is not None:
+                        metrics.incr("openai_input_tokens", usage.input_tokens, model=model)
+                        metrics.incr("openai_output_tokens", usage.output_tokens, model=model)
+                        span.set(input_tokens=usage.input_tokens, output_tokens=usage.output_tokens)
+                    span.set(attempts=attempt + 1)
+                    return response.output_parsed
+                except RETRYABLE_ERRORS as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self.backoff_delay(attempt, e)
+                    attempt += 1
+                    self.retries += 1
+                    metrics.incr("openai_retries", model=model, error=type(e).__name__)
+                    if on_restart is not None:
+                        on_restart()
+                    logger.warning(f"{type(e).__name__} from OpenAI, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+    def parse(self, prompt_messages: List[Dict], model: str, text_format: Type[BaseModel],
+              on_delta: Optional[Callable[[str], None]] = None,
+              on_restart: Optional[Callable[[], None]] = None) -> BaseModel:
+        #Blocking wrapper for the synchronous processors; safe to call from any thread.
+        #on_delta and on_restart run on the client's event loop thread.
+        future = asyncio.run_coroutine_threadsafe(
+            self.parse_async(prompt_messages, model, text_format, on_delta, on_restart), self._loop)
+        return future.result()
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.client.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.utils.file_utils import hash_file, hash_text
+
+logger = logging.getLogger(__name__)
+
+# Stages in run order; each stage's input hash includes the previous stage's output hash
+STAGES = ("transcribe", "extract", "enhance", "publish")
+
+
+class RecordingManifest:
+    #What each stage of one recording last consumed and produced, as content hashes plus the
+    #files or IDs it wrote. A stage is fresh when its input hash matches and its output file still
+    #exists with the content it was recorded with.
+    def __init__(self, path: Path, recording_path: str):
+        self.path = Path(path)
+        self.recording_path = str(Path(recording_path).resolve())
+        self.data = self._load()
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        data.setdefault("recording", self.recording_path)
+        data.setdefault("stages", {})
+        return data
+
+    def _save(self) -> None:
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, stage: str) -> Optional[Dict]:
+        return self.data["stages"].get(stage)
+
+    def output_hash(self, stage: str) -> Optional[str]:
+        record = self.get(stage)
+        return record["output"] if record else None
+
+    def staleness(self, stage: str, input_hash: str) -> Optional[str]:
+        #Why stage has to run, or None when its recorded output can be reused
+        record = self.get(stage)
+        if not record:
+            return "never run"
+        if record["input"] != input_hash:
+            return "inputs changed"
+        if record.get("path") and not Path(record["path"]).exists():
+            return "output missing"
+        if record.get("path") and Path(record["path"]).is_file() and record.get("file_hash") != hash_file(record["path"]):
+            # overwritten since, e.g. by another recording's notes when files were named by stem
+            return "output changed"
+        return None
+
+    def record(self, stage: str, input_hash: str, output_hash: str, **outputs) -> None:
+        #Store a finished stage; saved immediately so an interrupted run resumes after it
+        path = outputs.get("path")
+        if path and Path(path).is_file():
+            outputs["file_hash"] = hash_file(path)
+        self.data["stages"][stage] = {"input": input_hash, "output": output_hash,
+                                      "completed": time.time(), **outputs}
+        self._save()
+
+
+class ManifestStore:
+    #One manifest file per recording under data/manifests, keyed by the recording's path
+    def __init__(self, manifest_dir: Path):
+        self.manifest_dir = Path(manifest_dir)
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key_for(recording_path: str) -> str:
+        return hash_text(str(Path(recording_path).resolve()))[:16]
+
+    def for_recording(self, recording_path: str) -> RecordingManifest:
+        return RecordingManifest(self.manifest_dir / f"{self.key_for(recording_path)}.json", recording_path)
+
+
+def format_plan(recording_path: str, plan: List[Tuple[str, Optional[str]]]) -> str:
+    #One line per stage: "run (reason)" or "skip"
+    lines = [f"{Path(recording_path).name}:"]
+    for stage, reason in plan:
+        lines.append(f"  {stage:<11} {'run (' + reason + ')' if reason else 'skip'}")
+    return "\n".join(lines)
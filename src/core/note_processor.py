@@ -1,64 +1,191 @@
-from pydantic import BaseModel, Field
-from openai import OpenAI
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 import json
-import whisper
-import os
+import threading
 from dotenv import load_dotenv
 import logging
-from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 
-from src.prompts.prompts import messages
-from src.models.lecture_models import SubTopic, Assignment, DocNotes, EnhancedResult, EnhancedDocNotes
-from src.integrations.google_docs import GoogleDocsClient
-from src.integrations.google_sheets import GoogleSheetsClient
-from src.prompts.prompts import messages_for_enhanced_notes
+from pydantic import BaseModel
+
+from src.models.lecture_models import (DocNotes, SubTopic, EnhancedResult, EnhancedSubTopic, EnhancedDocNotes,
+                                       KeyTakeaways)
+from src.prompts.prompts import (messages_for_enhanced_notes, messages_for_subtopic_enhancement,
+                                 messages_for_key_takeaways)
+from src.core.resources import ResourcePool
+from src.core.streaming import NotesListener, StructuredStream
+from src.utils.file_utils import hash_text
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class NoteProcessor:
-    def __init__(self, model_name: str = 'gpt-4.1'):
+    def __init__(self, model_name: str = 'gpt-4.1', pool: Optional[ResourcePool] = None,
+                 fan_out: bool = False, fan_out_concurrency: int = 8):
         load_dotenv()
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.pool = pool or ResourcePool(enhance_model_name=model_name)
         self.model_name = model_name
+        # one concurrent request per subtopic instead of one long response for the whole lecture
+        self.fan_out = fan_out
+        self.fan_out_concurrency = fan_out_concurrency
         # create directory for detailed notes
-        self.final_notes_dir = Path(__file__).resolve().parents[2] / "data" / "detailed_notes"
+        self.final_notes_dir = self.pool.data_dir / "detailed_notes"
         self.final_notes_dir.mkdir(parents=True, exist_ok=True)
     
-    def process_notes(self, first_pass_notes: DocNotes) -> Optional[EnhancedResult]:
+    @property
+    def client(self):
+        return self.pool.get_llm_client()
+
+    def build_prompt_messages(self, first_pass_notes: DocNotes) -> List[Dict]:
+        # Convert first pass notes to text for prompt, joined once rather than grown piece by piece
+        parts = [f"\nMain Topic: {first_pass_notes.main_topic}"]
+        if first_pass_notes.sub_topics:
+            parts.append(f"\nSubtopics ({len(first_pass_notes.sub_topics)}):")
+            for i, subtopic in enumerate(first_pass_notes.sub_topics, 1):
+                parts.append(f"\n  {i}. {subtopic.title}")
+                parts.append(f"     {subtopic.description}")
+                if subtopic.examples:
+                    parts.append(f"     Examples: {', '.join(subtopic.examples)}")
+        notes_text = "".join(parts)
+        system_msg = messages_for_enhanced_notes[0]['content'] if messages_for_enhanced_notes and 'content' in messages_for_enhanced_notes[0] else \
+                "You are a meticulous note-enhancing assistant."
+        return [
+                {'role': 'system', 'content': system_msg},
+                {'role': 'user',
+                'content': f"Please analyze this lecture transcription and extract structured notes:\n\n{notes_text}"}
+            ]
+
+    def build_subtopic_messages(self, main_topic: str, earlier_titles: List[str], subtopic: SubTopic) -> List[Dict]:
+        # only the earlier titles, which are known while the first pass is still streaming, so a request
+        # started early is the same request (and cache entry) as one started after extraction
+        parts = [f"\nMain Topic: {main_topic}"]
+        if earlier_titles:
+            parts.append(f"\nEarlier subtopics: {'; '.join(earlier_titles)}")
+        parts.append(f"\n\nSubtopic to expand: {subtopic.title}\n     {subtopic.description}")
+        if subtopic.examples:
+            parts.append(f"\n     Examples: {', '.join(subtopic.examples)}")
+        notes_text = "".join(parts)
+        return [
+                {'role': 'system', 'content': messages_for_subtopic_enhancement[0]['content']},
+                {'role': 'user', 'content': f"Please expand this subtopic into detailed study notes:\n{notes_text}"}
+            ]
+
+    def build_takeaways_messages(self, first_pass_notes: DocNotes) -> List[Dict]:
+        parts = [f"\nMain Topic: {first_pass_notes.main_topic}"]
+        parts.extend(f"\n  {i}. {subtopic.title}: {subtopic.description}"
+                     for i, subtopic in enumerate(first_pass_notes.sub_topics, 1))
+        if first_pass_notes.key_takeaways:
+            parts.append(f"\nFirst-pass takeaways: {'; '.join(first_pass_notes.key_takeaways)}")
+        notes_text = "".join(parts)
+        return [
+                {'role': 'system', 'content': messages_for_key_takeaways[0]['content']},
+                {'role': 'user', 'content': f"Please list the key takeaways of this lecture:\n{notes_text}"}
+            ]
+
+    def fingerprint(self) -> str:
+        #Changes whenever the enhancement model, mode, prompts or output schemas do
+        if self.fan_out:
+            return hash_text(self.model_name, "fan-out",
+                             json.dumps(messages_for_subtopic_enhancement, sort_keys=True),
+                             json.dumps(messages_for_key_takeaways, sort_keys=True),
+                             json.dumps(EnhancedSubTopic.model_json_schema(), sort_keys=True),
+                             json.dumps(KeyTakeaways.model_json_schema(), sort_keys=True))
+        return hash_text(self.model_name, json.dumps(messages_for_enhanced_notes, sort_keys=True),
+                         json.dumps(EnhancedResult.model_json_schema(), sort_keys=True))
+
+    def process_notes(self, first_pass_notes: DocNotes,
+                      listener: Optional[NotesListener] = None) -> Optional[EnhancedDocNotes]:
+        return self.enhance(first_pass_notes, listener)[0]
+
+    def enhance(self, first_pass_notes: DocNotes, listener: Optional[NotesListener] = None,
+                session: Optional["FanOutSession"] = None) -> Tuple[Optional[EnhancedDocNotes], int]:
+        #Enhanced notes plus how many parts fell back to their first-pass content (fan-out only).
+        #listener gets each enhanced subtopic as soon as it is done; session holds fan-out requests
+        #already started while the first pass streamed.
+        if self.fan_out and first_pass_notes.sub_topics:
+            return self._enhance_fan_out(first_pass_notes, listener, session)
         try:
-            # Convert first pass notes to text for prompt
-            notes_text = f"\nMain Topic: {first_pass_notes.main_topic}"
-            if first_pass_notes.sub_topics:
-                notes_text += f"\nSubtopics ({len(first_pass_notes.sub_topics)}):"
-                for i, subtopic in enumerate(first_pass_notes.sub_topics, 1):
-                    notes_text += f"\n  {i}. {subtopic.title}"
-                    notes_text += f"     {subtopic.description}"
-                    if subtopic.examples:
-                        notes_text += f"     Examples: {', '.join(subtopic.examples)}"
             logger.info("Processing notes for enhanced details...")
-            system_msg = messages_for_enhanced_notes[0]['content'] if messages_for_enhanced_notes and 'content' in messages_for_enhanced_notes[0] else \
-                    "You are a meticulous note-enhancing assistant."
-            prompt_messages = [
-                    {'role': 'system', 'content': system_msg},
-                    {'role': 'user',
-                    'content': f"Please analyze this lecture transcription and extract structured notes:\n\n{notes_text}"}
-                ]
-            response = self.client.responses.parse(
-                input=prompt_messages,
-                model=self.model_name,
-                text_format=EnhancedResult
+            prompt_messages = self.build_prompt_messages(first_pass_notes)
+            stream = None
+            if listener is not None:
+                stream = StructuredStream("sub_topics", EnhancedSubTopic,
+                                          on_item=lambda index, subtopic: listener.on_subtopic("enhance", index, subtopic))
+            enhanced_result: EnhancedResult = self.pool.llm_cache.parse(
+                self.pool.get_llm_client, prompt_messages, self.model_name, EnhancedResult,
+                **({"on_delta": stream.feed, "on_restart": stream.restart} if stream else {})
             )
-            enhanced_result: EnhancedResult = response.output_parsed
-            enhanced_notes = EnhancedDocNotes(main_topic=first_pass_notes.main_topic, assignments=first_pass_notes.assignments, sub_topics=enhanced_result.sub_topics, key_takeaways=enhanced_result.key_takeaways)
+            if stream:
+                stream.finish(enhanced_result)
+            enhanced_notes = EnhancedDocNotes.from_results(first_pass_notes.main_topic, first_pass_notes.assignments, enhanced_result)
             logger.info("Enhanced notes processing complete.")
 
-            return enhanced_notes
+            return enhanced_notes, 0
     
         except Exception as e:
             logger.error(f"Error preparing notes for enhancement: {e}")
+            return None, 0
+
+    def _enhance_subtopic(self, main_topic: str, earlier_titles: List[str],
+                          subtopic: SubTopic) -> Optional[EnhancedSubTopic]:
+        try:
+            enhanced = self.pool.llm_cache.parse(self.pool.get_llm_client,
+                                                 self.build_subtopic_messages(main_topic, earlier_titles, subtopic),
+                                                 self.model_name, EnhancedSubTopic)
+        except Exception as e:
+            logger.warning(f"Enhancing subtopic '{subtopic.title}' failed: {e}")
             return None
+        if enhanced is None:
+            logger.warning(f"Enhancing subtopic '{subtopic.title}' returned nothing")
+        return enhanced
+
+    def _key_takeaways(self, first_pass_notes: DocNotes) -> Optional[List[str]]:
+        try:
+            result = self.pool.llm_cache.parse(self.pool.get_llm_client, self.build_takeaways_messages(first_pass_notes),
+                                               self.model_name, KeyTakeaways)
+        except Exception as e:
+            logger.warning(f"Key takeaways request failed: {e}")
+            return None
+        return result.key_takeaways if result else None
+
+    def _enhance_fan_out(self, first_pass_notes: DocNotes, listener: Optional[NotesListener] = None,
+                         session: Optional["FanOutSession"] = None) -> Tuple[Optional[EnhancedDocNotes], int]:
+        #One concurrent request per subtopic plus one for the takeaways, reassembled in the original order.
+        #A failed subtopic keeps its first-pass content rather than sinking the whole lecture.
+        sub_topics = first_pass_notes.sub_topics
+        titles = [subtopic.title for subtopic in sub_topics]
+        logger.info(f"Enhancing {len(sub_topics)} subtopics concurrently...")
+        with ThreadPoolExecutor(max_workers=min(self.fan_out_concurrency, len(sub_topics) + 1)) as executor:
+            takeaways_future = executor.submit(self._key_takeaways, first_pass_notes)
+            futures: Dict[Future, int] = {}
+            for index, subtopic in enumerate(sub_topics):
+                future = session.take(first_pass_notes.main_topic, titles[:index], subtopic) if session else None
+                if future is None:
+                    future = executor.submit(self._enhance_subtopic, first_pass_notes.main_topic,
+                                             titles[:index], subtopic)
+                futures[future] = index
+            enhanced: List[Optional[EnhancedSubTopic]] = [None] * len(sub_topics)
+            for future in as_completed(futures):
+                index = futures[future]
+                enhanced[index] = future.result()
+                if listener is not None:
+                    listener.on_subtopic("enhance", index, enhanced[index] if enhanced[index] is not None
+                                         else EnhancedSubTopic(**sub_topics[index].model_dump()))
+            key_takeaways = takeaways_future.result()
+        failed = sum(result is None for result in enhanced) + (key_takeaways is None)
+        if failed == len(sub_topics) + 1:
+            logger.error("Every enhancement request failed")
+            return None, failed
+        if failed:
+            logger.warning(f"{failed} of {len(sub_topics) + 1} enhancement requests failed; "
+                           f"those parts keep their first-pass notes")
+        enhanced_notes = EnhancedDocNotes(
+            main_topic=first_pass_notes.main_topic,
+            assignments=first_pass_notes.assignments,
+            sub_topics=[result if result is not None else EnhancedSubTopic(**subtopic.model_dump())
+                        for subtopic, result in zip(sub_topics, enhanced)],
+            key_takeaways=key_takeaways if key_takeaways is not None else first_pass_notes.key_takeaways,
+        )
+        logger.info("Enhanced notes processing complete.")
+        return enhanced_notes, failed
 
         
     def save_notes(self, notes: EnhancedDocNotes, filename: str) -> str:
@@ -75,7 +202,59 @@ class NoteProcessor:
             logger.error(f"Error saving notes: {e}")
             return None
 
-        
 
+class FanOutSession(NotesListener):
+    #Starts fan-out enhancement requests while the first pass is still streaming: each first-pass
+    #subtopic is sent off as soon as it is complete, and enhance() later takes the request whose
+    #inputs match instead of sending it again. Also forwards every event to listener.
+    def __init__(self, note_processor: NoteProcessor, listener: Optional[NotesListener] = None):
+        self.note_processor = note_processor
+        self.listener = listener
+        self._executor = ThreadPoolExecutor(max_workers=note_processor.fan_out_concurrency,
+                                            thread_name_prefix="fan-out")
+        self._lock = threading.Lock()
+        self._main_topic: Optional[str] = None
+        self._titles: List[str] = []
+        self._waiting: List[SubTopic] = []
+        # (main topic, earlier titles, subtopic JSON) -> request
+        self._started: Dict[Tuple[str, Tuple[str, ...], str], Future] = {}
+
+    def _start(self, subtopic: SubTopic) -> None:
+        earlier = list(self._titles)
+        self._titles.append(subtopic.title)
+        key = (self._main_topic, tuple(earlier), subtopic.model_dump_json())
+        self._started[key] = self._executor.submit(self.note_processor._enhance_subtopic,
+                                                   self._main_topic, earlier, subtopic)
+
+    def on_main_topic(self, main_topic: str) -> None:
+        with self._lock:
+            self._main_topic = main_topic
+            waiting, self._waiting = self._waiting, []
+            for subtopic in waiting:
+                self._start(subtopic)
+        if self.listener:
+            self.listener.on_main_topic(main_topic)
+
+    def on_subtopic(self, stage: str, index: int, subtopic: BaseModel) -> None:
+        if stage == "extract":
+            with self._lock:
+                if self._main_topic is None:
+                    self._waiting.append(subtopic)
+                else:
+                    self._start(subtopic)
+        if self.listener:
+            self.listener.on_subtopic(stage, index, subtopic)
+
+    def take(self, main_topic: str, earlier_titles: List[str], subtopic: SubTopic) -> Optional[Future]:
+        #The request already started for exactly these inputs, if any
+        with self._lock:
+            return self._started.pop((main_topic, tuple(earlier_titles), subtopic.model_dump_json()), None)
 
-    
\ No newline at end of file
+    def close(self) -> None:
+        #Drop requests nobody took (e.g. the chunk merge changed a subtopic) that have not started yet
+        with self._lock:
+            unused = len(self._started)
+            self._started.clear()
+        if unused:
+            logger.debug(f"{unused} early enhancement requests went unused")
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,152 @@
+import queue
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from src.models.lecture_models import DocNotes, EnhancedDocNotes
+from src.core.manifest import RecordingManifest
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of input for a stage's workers
+_STOP = object()
+
+
+@dataclass
+class PipelineJob:
+    index: int
+    recording_path: Path
+    manifest: Optional[RecordingManifest] = None
+    transcription_path: Optional[str] = None
+    notes: Optional[DocNotes] = None
+    final_notes: Optional[EnhancedDocNotes] = None
+    error: Optional[str] = None
+    # set for jobs fed by the serve daemon's queue
+    job_id: Optional[str] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None and self.final_notes is not None
+
+
+class _Stage:
+    #A named step with its own worker threads, reading jobs from inbox and forwarding to outbox
+    def __init__(self, name: str, func: Callable[[PipelineJob], None], workers: int):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.inbox: Optional[queue.Queue] = None
+        self.outbox: Optional[queue.Queue] = None
+        self.stop_count = 1
+        # called with (job, stage name) just before the stage works on a job
+        self.on_start: Optional[Callable[[PipelineJob, str], None]] = None
+        self._remaining = self.workers
+        self._lock = threading.Lock()
+
+    def _work(self) -> None:
+        while True:
+            job = self.inbox.get()
+            if job is _STOP:
+                break
+            # a failed job skips the remaining stages but still flows through to the results
+            if job.error is None:
+                try:
+                    if self.on_start:
+                        self.on_start(job, self.name)
+                    self.func(job)
+                except Exception as e:
+                    job.error = f"{self.name} stage failed: {e}"
+                if job.error:
+                    logger.error(f"{job.recording_path.name}: {job.error}")
+            self.outbox.put(job)
+        with self._lock:
+            self._remaining -= 1
+            last = self._remaining == 0
+        if last:
+            for _ in range(self.stop_count):
+                self.outbox.put(_STOP)
+
+    def start(self) -> List[threading.Thread]:
+        self._remaining = self.workers
+        threads = [
+            threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+
+class LecturePipeline:
+    #Runs transcription, LLM passes and publishing as overlapping stages linked by bounded queues,
+    #so Whisper works on the next recording while earlier ones wait on OpenAI or Google
+    def __init__(self, processor, transcribe_workers: int = 1, llm_workers: int = 4,
+                 publish_workers: int = 2, queue_size: int = 4,
+                 on_stage: Optional[Callable[[PipelineJob, str], None]] = None):
+        self.processor = processor
+        self.queue_size = queue_size
+        self.stages = [
+            _Stage("transcribe", self._transcribe, transcribe_workers),
+            _Stage("llm", self._extract_and_enhance, llm_workers),
+            _Stage("publish", self._publish, publish_workers),
+        ]
+        for stage in self.stages:
+            stage.on_start = on_stage
+
+    def _transcribe(self, job: PipelineJob) -> None:
+        logger.info(f"Starting processing of: {job.recording_path}")
+        job.manifest = self.processor.manifests.for_recording(str(job.recording_path))
+        job.transcription_path = self.processor.transcribe_stage(str(job.recording_path), job.manifest)
+        if not job.transcription_path:
+            job.error = "transcription failed"
+
+    def _extract_and_enhance(self, job: PipelineJob) -> None:
+        job.notes = self.processor.extract_stage(str(job.recording_path), job.manifest, job.transcription_path)
+        if not job.notes:
+            job.error = "note extraction failed"
+            return
+        job.final_notes = self.processor.enhance_stage(str(job.recording_path), job.manifest, job.notes)
+        if not job.final_notes:
+            job.error = "note enhancement failed"
+
+    def _publish(self, job: PipelineJob) -> None:
+        # assignment rows are flushed in bulk once the directory is done
+        self.processor.publish_stage(str(job.recording_path), job.manifest, job.final_notes, flush=False)
+
+    def stream(self, jobs: Iterable[PipelineJob]) -> Iterator[PipelineJob]:
+        #Yield jobs as they finish, in completion order. jobs may block between items (the serve
+        #daemon feeds it from its queue), and the stream ends once jobs is exhausted and drained.
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results: queue.Queue = queue.Queue()
+        for i, stage in enumerate(self.stages):
+            stage.inbox = queues[i]
+            stage.outbox = queues[i + 1] if i + 1 < len(self.stages) else results
+            stage.stop_count = self.stages[i + 1].workers if i + 1 < len(self.stages) else 1
+            stage.start()
+
+        def feed() -> None:
+            for job in jobs:
+                queues[0].put(job)
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_STOP)
+
+        threading.Thread(target=feed, name="pipeline-feed", daemon=True).start()
+
+        while True:
+            job = results.get()
+            if job is _STOP:
+                return
+            yield job
+
+    def run(self, recordings: List[Path]) -> Iterator[PipelineJob]:
+        #Yield finished jobs in input order so reporting matches the sequential path
+        jobs = (PipelineJob(index=index, recording_path=Path(recording)) for index, recording in enumerate(recordings))
+        finished: Dict[int, PipelineJob] = {}
+        next_index = 0
+        for job in self.stream(jobs):
+            finished[job.index] = job
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
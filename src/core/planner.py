@@ -0,0 +1,304 @@
+import json
+import math
+import wave
+import logging
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+from src.models.lecture_models import DocNotes, EnhancedResult, EnhancedSubTopic, KeyTakeaways, SubTopic
+from src.core.chunking import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# USD per million (input, output) tokens; dated snapshots match on their base name
+MODEL_PRICES = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+# chat formatting around each message, and the primer for the reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+# first-pass notes come to about this share of the transcript, and never much less than the floor
+EXTRACT_OUTPUT_RATIO = 0.15
+MIN_EXTRACT_OUTPUT_TOKENS = 400
+# enhanced notes run to about this many times the first-pass notes they expand
+ENHANCE_OUTPUT_RATIO = 3.0
+# first-pass notes hold about one subtopic per this many output tokens (fan-out sends one request each)
+TOKENS_PER_SUBTOPIC = 250
+# speech in a recording that has not been transcribed yet
+TOKENS_PER_AUDIO_MINUTE = 200
+# response time: wait for the first token, then decode the rest
+FIRST_TOKEN_SECONDS = 0.8
+OUTPUT_TOKENS_PER_SECOND = 60.0
+
+
+def price_for(model_name: str) -> Optional[tuple]:
+    #(input, output) USD per million tokens, from the longest MODEL_PRICES name model_name starts with
+    matches = [name for name in MODEL_PRICES if model_name == name or model_name.startswith(name + "-")]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+
+def message_tokens(prompt_messages: List[Dict], model_name: str) -> int:
+    return sum(count_tokens(message['content'], model_name) + TOKENS_PER_MESSAGE
+               for message in prompt_messages) + TOKENS_PER_REPLY
+
+
+def schema_tokens(text_format: Type[BaseModel], model_name: str) -> int:
+    # structured output sends the response schema with every request
+    return count_tokens(json.dumps(text_format.model_json_schema()), model_name)
+
+
+def audio_duration(recording_path: str) -> Optional[float]:
+    #Length of a recording in seconds from its header (ffprobe for anything but WAV), or None
+    try:
+        if Path(recording_path).suffix.lower() == ".wav":
+            with wave.open(str(recording_path), 'rb') as f:
+                return f.getnframes() / f.getframerate()
+        output = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration",
+                                 "-of", "default=noprint_wrappers=1:nokey=1", str(recording_path)],
+                                capture_output=True, text=True, check=True).stdout
+        return float(output.strip())
+    except Exception as e:
+        logger.debug(f"Could not read the duration of {recording_path}: {e}")
+        return None
+
+
+@dataclass
+class PassEstimate:
+    stage: str
+    model: str
+    requests: int = 0
+    # requests the LLM cache already answers; they cost nothing and are not counted below
+    cached: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    seconds: float = 0.0
+    # input counted from the real prompts rather than estimated
+    exact: bool = False
+
+    @property
+    def cost(self) -> Optional[float]:
+        prices = price_for(self.model)
+        if prices is None:
+            return None
+        return (self.input_tokens * prices[0] + self.output_tokens * prices[1]) / 1_000_000
+
+    def add_requests(self, input_tokens: List[int], output_tokens: List[int], concurrency: int) -> None:
+        #Count uncached requests sent concurrency at a time; each wave lasts as long as its longest reply
+        self.requests += len(input_tokens)
+        self.input_tokens += sum(input_tokens)
+        self.output_tokens += sum(output_tokens)
+        concurrency = max(1, concurrency)
+        for start in range(0, len(output_tokens), concurrency):
+            self.seconds += FIRST_TOKEN_SECONDS + max(output_tokens[start:start + concurrency]) / OUTPUT_TOKENS_PER_SECOND
+
+
+@dataclass
+class FilePlan:
+    recording: str
+    # transcript tokens as Whisper wrote them and as the first pass will send them; None when estimated from duration
+    transcript_tokens: Optional[int] = None
+    compacted_tokens: Optional[int] = None
+    audio_seconds: Optional[float] = None
+    passes: List[PassEstimate] = field(default_factory=list)
+    # why the recording could not be estimated (e.g. its length is unknown); it has no passes then
+    unplannable: Optional[str] = None
+    # the original a known duplicate reuses the outputs of; it costs nothing
+    duplicate_of: Optional[str] = None
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(estimate.input_tokens + estimate.output_tokens for estimate in self.passes)
+
+    @property
+    def cost(self) -> Optional[float]:
+        costs = [estimate.cost for estimate in self.passes]
+        return None if any(cost is None for cost in costs) else sum(costs)
+
+    @property
+    def seconds(self) -> float:
+        return sum(estimate.seconds for estimate in self.passes)
+
+
+class TokenPlanner:
+    #Estimates what the two LLM passes will cost for a recording before anything is sent. Stages
+    #the manifest says are up to date and requests already in the LLM cache count as free. With a
+    #transcript on disk the first pass is counted from its real (compacted, chunked) prompts; without
+    #one it is estimated from the recording's length. The second pass is counted from the first-pass
+    #notes when they exist, otherwise estimated from the first pass's expected output (split into
+    #TOKENS_PER_SUBTOPIC-sized subtopic requests when enhancement fans out).
+    def __init__(self, processor):
+        self.processor = processor
+        self.note_processor = processor.note_processor
+
+    def _transcript(self, recording_path: str) -> Optional[Dict]:
+        record = self.processor.manifests.for_recording(recording_path).get("transcribe")
+        path = record["path"] if record and Path(record["path"]).exists() else \
+            self.processor.transcription_cache.get(self.processor.transcription_key(recording_path))
+        return self.processor.load_transcription(path) if path else None
+
+    def _original_of(self, recording_path: str) -> Optional[Dict]:
+        #The original a known dedup duplicate reuses the transcript and notes of
+        if self.processor.fingerprints is None or not Path(recording_path).exists():
+            return None
+        return self.processor.fingerprints.original_of(self.processor.transcription_cache.audio_hash(recording_path))
+
+    def _first_pass_notes(self, recording_path: str) -> Optional[DocNotes]:
+        record = self.processor.manifests.for_recording(recording_path).get("extract")
+        if not record or not Path(record["path"]).exists():
+            return None
+        return DocNotes.model_validate_json(Path(record["path"]).read_text(encoding='utf-8'))
+
+    def _count(self, estimate: PassEstimate, prompts: List[List[Dict]], outputs: List[int],
+               text_format: Type[BaseModel], concurrency: int) -> None:
+        #Add prompts (with their expected output tokens) to estimate, leaving out LLM cache hits
+        llm_cache = self.processor.pool.llm_cache
+        inputs, expected = [], []
+        for prompt_messages, output_tokens in zip(prompts, outputs):
+            if llm_cache.contains(prompt_messages, estimate.model, text_format):
+                estimate.cached += 1
+                continue
+            inputs.append(message_tokens(prompt_messages, estimate.model) + schema_tokens(text_format, estimate.model))
+            expected.append(output_tokens)
+        estimate.add_requests(inputs, expected, concurrency)
+
+    def plan_file(self, recording_path: str) -> FilePlan:
+        processor = self.processor
+        stages = dict(processor.plan(recording_path))
+        plan = FilePlan(recording=str(recording_path))
+        extract = PassEstimate("extract", processor.model_name)
+        enhance = PassEstimate("enhance", self.note_processor.model_name)
+        # expected first-pass output, which is also the second pass's input
+        notes_tokens = 0
+
+        original = self._original_of(recording_path) if stages["extract"] or stages["enhance"] else None
+        if original:
+            plan.duplicate_of = original["path"]
+            return plan
+
+        transcript = self._transcript(recording_path) if stages["extract"] else None
+        if transcript is not None:
+            plan.transcript_tokens = count_tokens(transcript['text'], extract.model)
+            text, segments = processor.prompt_transcript(transcript['text'], transcript.get('segments'))
+            plan.compacted_tokens = count_tokens(text, extract.model)
+            prompts = processor.build_extraction_prompts(text, segments, compacted=True)
+            outputs = [max(MIN_EXTRACT_OUTPUT_TOKENS,
+                           int(count_tokens(prompt_messages[-1]['content'], extract.model) * EXTRACT_OUTPUT_RATIO))
+                       for prompt_messages in prompts]
+            notes_tokens = sum(outputs)
+            extract.exact = True
+            self._count(extract, prompts, outputs, DocNotes, processor.chunk_concurrency)
+        elif stages["extract"]:
+            plan.audio_seconds = audio_duration(recording_path)
+            if plan.audio_seconds is None:
+                # counting it as empty would let it through a token budget as nearly free
+                plan.unplannable = "no transcript and its length is unknown"
+                return plan
+            transcript_tokens = int(plan.audio_seconds / 60 * TOKENS_PER_AUDIO_MINUTE)
+            requests = max(1, math.ceil(transcript_tokens / processor.chunk_max_tokens))
+            overhead = message_tokens(processor._prompt_messages(""), extract.model) \
+                + schema_tokens(DocNotes, extract.model)
+            per_request = transcript_tokens // requests
+            outputs = [max(MIN_EXTRACT_OUTPUT_TOKENS, int(per_request * EXTRACT_OUTPUT_RATIO))] * requests
+            notes_tokens = sum(outputs)
+            extract.add_requests([per_request + overhead] * requests, outputs, processor.chunk_concurrency)
+
+        notes = self._first_pass_notes(recording_path) if stages["enhance"] and not stages["extract"] else None
+        if notes is not None:
+            enhance.exact = True
+            if self.note_processor.fan_out and notes.sub_topics:
+                titles = [subtopic.title for subtopic in notes.sub_topics]
+                prompts = [self.note_processor.build_subtopic_messages(notes.main_topic, titles[:index], subtopic)
+                           for index, subtopic in enumerate(notes.sub_topics)]
+                outputs = [int(count_tokens(subtopic.model_dump_json(), enhance.model) * ENHANCE_OUTPUT_RATIO)
+                           for subtopic in notes.sub_topics]
+                self._count(enhance, prompts, outputs, EnhancedSubTopic, self.note_processor.fan_out_concurrency)
+                takeaways = self.note_processor.build_takeaways_messages(notes)
+                self._count(enhance, [takeaways], [MIN_EXTRACT_OUTPUT_TOKENS], KeyTakeaways, 1)
+            else:
+                outputs = [int(count_tokens(notes.model_dump_json(), enhance.model) * ENHANCE_OUTPUT_RATIO)]
+                self._count(enhance, [self.note_processor.build_prompt_messages(notes)], outputs, EnhancedResult, 1)
+        elif stages["enhance"] and self.note_processor.fan_out:
+            # the first pass has not run: one request per expected subtopic, each carrying its share
+            # of the notes, then the key takeaways over all of them
+            subtopics = max(1, round(notes_tokens / TOKENS_PER_SUBTOPIC))
+            per_subtopic = notes_tokens // subtopics
+            empty = SubTopic(title="", description="")
+            overhead = message_tokens(self.note_processor.build_subtopic_messages("", [], empty), enhance.model) \
+                + schema_tokens(EnhancedSubTopic, enhance.model)
+            enhance.add_requests([per_subtopic + overhead] * subtopics,
+                                 [int(per_subtopic * ENHANCE_OUTPUT_RATIO)] * subtopics,
+                                 self.note_processor.fan_out_concurrency)
+            overhead = message_tokens(self.note_processor.build_takeaways_messages(DocNotes(main_topic="", sub_topics=[])),
+                                      enhance.model) + schema_tokens(KeyTakeaways, enhance.model)
+            enhance.add_requests([notes_tokens + overhead], [MIN_EXTRACT_OUTPUT_TOKENS], 1)
+        elif stages["enhance"]:
+            # the first pass has not run, so its notes are sized from its expected output
+            overhead = message_tokens(self.note_processor.build_prompt_messages(DocNotes(main_topic="", sub_topics=[])),
+                                      enhance.model) + schema_tokens(EnhancedResult, enhance.model)
+            enhance.add_requests([notes_tokens + overhead], [int(notes_tokens * ENHANCE_OUTPUT_RATIO)], 1)
+
+        plan.passes = [estimate for estimate in (extract, enhance) if estimate.requests or estimate.cached]
+        return plan
+
+
+def _format_cost(cost: Optional[float]) -> str:
+    return f"${cost:.4f}" if cost is not None else "$?"
+
+
+def _format_row(label: str, input_tokens: int, output_tokens: int, cost: Optional[float], seconds: float,
+                note: str = "") -> str:
+    return (f"  {label:<24} {input_tokens:>10,} in {output_tokens:>9,} out "
+            f"{_format_cost(cost):>10}  ~{seconds:,.0f}s{note}")
+
+
+def format_file_plan(plan: FilePlan) -> str:
+    #One line per LLM pass plus the file's total
+    name = Path(plan.recording).name
+    if plan.unplannable:
+        return f"{name}: cannot plan ({plan.unplannable})"
+    if plan.duplicate_of:
+        return f"{name}: duplicate of {Path(plan.duplicate_of).name}, reuses its outputs\n  nothing to send"
+    if plan.transcript_tokens is not None:
+        header = f"{name}: transcript {plan.transcript_tokens:,} tokens, {plan.compacted_tokens:,} sent after compaction"
+    elif plan.audio_seconds is not None:
+        header = f"{name}: not transcribed yet, {plan.audio_seconds / 60:.0f} min of audio"
+    else:
+        header = f"{name}:"
+    lines = [header]
+    if not plan.passes:
+        lines.append("  nothing to send")
+        return "\n".join(lines)
+    for estimate in plan.passes:
+        label = f"{estimate.stage} {estimate.model}"
+        note = "" if estimate.exact else " (estimated)"
+        if estimate.cached:
+            note += f", {estimate.cached} cached"
+        requests = f"{estimate.requests} request{'' if estimate.requests == 1 else 's'}"
+        lines.append(_format_row(label, estimate.input_tokens, estimate.output_tokens, estimate.cost,
+                                 estimate.seconds, f"  {requests}{note}"))
+    lines.append(_format_row("total", sum(e.input_tokens for e in plan.passes),
+                             sum(e.output_tokens for e in plan.passes), plan.cost, plan.seconds))
+    return "\n".join(lines)
+
+
+def format_directory_plan(label: str, plans: List[FilePlan]) -> str:
+    #Sum over every file; latency assumes the files run one after another. Files that could not be
+    #planned are left out of the total and counted separately.
+    unplannable = [plan for plan in plans if plan.unplannable]
+    plans = [plan for plan in plans if not plan.unplannable]
+    costs = [plan.cost for plan in plans]
+    input_tokens = sum(e.input_tokens for plan in plans for e in plan.passes)
+    output_tokens = sum(e.output_tokens for plan in plans for e in plan.passes)
+    return (f"{label} ({len(plans)} recordings):\n"
+            + _format_row("total", input_tokens, output_tokens,
+                          None if any(cost is None for cost in costs) else sum(costs),
+                          sum(plan.seconds for plan in plans))
+            + (f"\n  {len(unplannable)} more could not be planned and are not included" if unplannable else ""))
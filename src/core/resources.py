@@ -0,0 +1,203 @@
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Set
+
+from dotenv import load_dotenv
+
+from src.core.llm_cache import LLMResponseCache
+from src.integrations.base_integration import BaseIntegration, load_integration_factory
+
+# whisper/torch, openai and the Google client stack are imported by the getters that need them,
+# so --help, dry runs and cache-only reruns never pay for them
+if TYPE_CHECKING:
+    from src.core.llm_client import AsyncLLMClient
+    from src.integrations.google_docs import GoogleDocsClient
+    from src.integrations.google_sheets import GoogleSheetsClient
+    from src.integrations.google_calendar import GoogleCalendarClient
+    from src.integrations.publisher import GooglePublisher
+
+logger = logging.getLogger(__name__)
+
+
+def load_whisper_model(size: str):
+    import whisper
+
+    return whisper.load_model(size)
+
+
+class ResourcePool:
+    #Holds the expensive, reusable resources for one run (Whisper weights, API clients)
+    #so they are created once and shared by every recording instead of once per file
+    def __init__(self, model_name: str = "gpt-4.1-mini", whisper_model: str = "base",
+                 enhance_model_name: str = "gpt-4.1", llm_cache_max_bytes: Optional[int] = None,
+                 llm_cache_enabled: bool = True, llm_client_options: Optional[Dict] = None,
+                 tracker_id: Optional[str] = None, data_dir: Optional[Path] = None,
+                 whisper_loader: Optional[Callable[[str], object]] = None,
+                 integrations: Sequence[str] = ("google",), calendar_id: Optional[str] = None):
+        load_dotenv()
+        # every cache and state file of the run lives under data_dir (default: the repo's data/)
+        self.data_dir = Path(data_dir) if data_dir else Path(__file__).resolve().parents[2] / "data"
+        self.model_name = model_name
+        self.whisper_model = whisper_model
+        self.enhance_model_name = enhance_model_name
+        # concurrency, rate limit and retry settings for AsyncLLMClient
+        self.llm_client_options = llm_client_options or {}
+        # builds a Whisper model for a size; benchmarks swap in a fake
+        self.whisper_loader = whisper_loader or load_whisper_model
+        # registered integrations that finished notes are published to, loaded on first publish
+        self.integration_names: List[str] = list(integrations)
+
+        # re-entrant: the publisher is built from the docs and sheets clients
+        self._lock = threading.RLock()
+        self._whisper_models: Dict[str, object] = {}
+        self._llm_client: Optional["AsyncLLMClient"] = None
+        self._docs_client: Optional["GoogleDocsClient"] = None
+        self._sheets_client: Optional["GoogleSheetsClient"] = None
+        self._calendar_client: Optional["GoogleCalendarClient"] = None
+        self._integrations: Dict[str, BaseIntegration] = {}
+        self.tracker_id = tracker_id
+        self.calendar_id = calendar_id
+        self.llm_cache = LLMResponseCache(
+            self.data_dir / "llm_cache",
+            max_bytes=llm_cache_max_bytes,
+            enabled=llm_cache_enabled,
+        )
+
+        # seconds spent creating each resource, and how many more recordings used it after the first;
+        # reuse is only tracked for Whisper models and integrations (the authenticated Google services),
+        # the resources a per-file run would actually have rebuilt
+        self.load_times: Dict[str, float] = {}
+        self.reuse_counts: Dict[str, int] = {}
+        self._users: Dict[str, Set[str]] = {}
+
+    def _get_or_create(self, key: str, attr_get, attr_set, factory, recording: Optional[str] = None):
+        #Return the cached resource for key, building it (and timing the build) on first use.
+        #Passing the recording it is needed for counts it towards reuse, once per recording.
+        with self._lock:
+            resource = attr_get()
+            if resource is None:
+                start = time.perf_counter()
+                resource = factory()
+                self.load_times[key] = time.perf_counter() - start
+                attr_set(resource)
+                logger.info(f"Loaded {key} in {self.load_times[key]:.2f}s")
+            if recording is not None:
+                users = self._users.setdefault(key, set())
+                users.add(recording)
+                self.reuse_counts[key] = len(users) - 1
+            return resource
+
+    def get_whisper(self, size: Optional[str] = None, recording: Optional[str] = None):
+        #Whisper models are cached per size so tiered/mixed runs also load each size once
+        size = size or self.whisper_model
+        return self._get_or_create(
+            f"whisper:{size}",
+            lambda: self._whisper_models.get(size),
+            lambda model: self._whisper_models.__setitem__(size, model),
+            lambda: self.whisper_loader(size),
+            recording,
+        )
+
+    def get_llm_client(self) -> "AsyncLLMClient":
+        #One rate-limited OpenAI client for every request in the run, whichever thread makes it
+        def create():
+            from src.core.llm_client import AsyncLLMClient
+
+            return AsyncLLMClient(api_key=os.getenv("OPENAI_API_KEY"), **self.llm_client_options)
+
+        return self._get_or_create(
+            "openai",
+            lambda: self._llm_client,
+            lambda client: setattr(self, "_llm_client", client),
+            create,
+        )
+
+    def has_llm_client(self) -> bool:
+        return self._llm_client is not None
+
+    def _configure_google_scopes(self) -> None:
+        # every Google client asks for the scopes of all enabled integrations, so one authorization
+        # covers the run and calendar access is only requested when calendar sync is on
+        from src.integrations.google_auth import configure_scopes, scopes_for
+
+        configure_scopes(scopes_for(self.integration_names, self.calendar_id))
+
+    def get_docs_client(self) -> "GoogleDocsClient":
+        def create():
+            from src.integrations.google_docs import GoogleDocsClient
+
+            self._configure_google_scopes()
+            return GoogleDocsClient()
+
+        return self._get_or_create(
+            "google_docs",
+            lambda: self._docs_client,
+            lambda client: setattr(self, "_docs_client", client),
+            create,
+        )
+
+    def get_sheets_client(self) -> "GoogleSheetsClient":
+        def create():
+            from src.integrations.google_sheets import GoogleSheetsClient
+
+            self._configure_google_scopes()
+            return GoogleSheetsClient()
+
+        return self._get_or_create(
+            "google_sheets",
+            lambda: self._sheets_client,
+            lambda client: setattr(self, "_sheets_client", client),
+            create,
+        )
+
+    def get_calendar_client(self) -> "GoogleCalendarClient":
+        def create():
+            from src.integrations.google_calendar import GoogleCalendarClient
+
+            self._configure_google_scopes()
+            return GoogleCalendarClient()
+
+        return self._get_or_create(
+            "google_calendar",
+            lambda: self._calendar_client,
+            lambda client: setattr(self, "_calendar_client", client),
+            create,
+        )
+
+    def get_integration(self, name: str, recording: Optional[str] = None) -> BaseIntegration:
+        #The named integration, imported and built through the registry on first use
+        return self._get_or_create(
+            f"integration:{name}",
+            lambda: self._integrations.get(name),
+            lambda integration: self._integrations.__setitem__(name, integration),
+            lambda: load_integration_factory(name)(self),
+            recording,
+        )
+
+    def get_integrations(self, recording: Optional[str] = None) -> List[BaseIntegration]:
+        return [self.get_integration(name, recording) for name in self.integration_names]
+
+    def loaded_integrations(self) -> List[BaseIntegration]:
+        #Integrations already built this run, without loading the rest
+        with self._lock:
+            return list(self._integrations.values())
+
+    def get_publisher(self) -> "GooglePublisher":
+        return self.get_integration("google")
+
+    def has_publisher(self) -> bool:
+        return bool(self._integrations)
+
+    def saved_load_seconds(self) -> float:
+        #Time a run building Whisper and the Google services once per recording would have spent
+        #rebuilding them; an integration's load time includes the Google clients it authenticated
+        return sum(self.load_times.get(key, 0.0) * count for key, count in self.reuse_counts.items())
+
+    def report(self) -> str:
+        loaded = ", ".join(f"{key} ({seconds:.2f}s)" for key, seconds in self.load_times.items()) or "nothing"
+        return (f"Resource pool loaded {loaded}; "
+                f"reuse saved ~{self.saved_load_seconds():.1f}s of load time; "
+                f"LLM cache {self.llm_cache.hits} hits / {self.llm_cache.misses} misses")
@@ -0,0 +1,339 @@
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+import importlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.core.transcript_store import open_transcription
+
+logger = logging.getLogger(__name__)
+
+# transcript segments are indexed in windows of about this length, long enough to read as a hit
+WINDOW_SECONDS = 30.0
+HASHING_DIMENSIONS = 512
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    recording TEXT PRIMARY KEY,
+    manifest TEXT NOT NULL,
+    manifest_mtime INTEGER NOT NULL,
+    transcript_hash TEXT,
+    notes_hash TEXT,
+    indexed REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS windows USING fts5(
+    text, recording UNINDEXED, start UNINDEXED, end UNINDEXED, tokenize='porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    recording TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    title TEXT NOT NULL,
+    text TEXT NOT NULL,
+    start REAL,
+    vector BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_recording ON entries (recording);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def _words(text: str) -> List[str]:
+    return "".join(ch.lower() if ch.isalnum() else " " for ch in text).split()
+
+
+class HashingEmbedder:
+    #Signed feature hashing of words and word pairs into a fixed-size unit vector. Needs no model
+    #download and is stable across processes (crc32, not Python's salted hash).
+    def __init__(self, dimensions: int = HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = _words(text)
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                digest = zlib.crc32(feature.encode("utf-8"))
+                vectors[row, digest % self.dimensions] += 1.0 if digest & 0x80000000 else -1.0
+        # dampen repeated words, then normalise so a dot product is cosine similarity
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class SentenceTransformerEmbedder:
+    #A local sentence-transformers model; only importable when that optional package is installed
+    def __init__(self, model_name: str):
+        module = importlib.import_module("sentence_transformers")
+        self.model = module.SentenceTransformer(model_name)
+        self.name = f"st-{model_name}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+
+def load_embedder(name: str = "hashing"):
+    #"hashing" needs nothing extra; anything else names a sentence-transformers model
+    if name == "hashing":
+        return HashingEmbedder()
+    try:
+        return SentenceTransformerEmbedder(name)
+    except ImportError:
+        logger.warning(f"sentence-transformers is not installed; using hashing embeddings instead of {name}")
+        return HashingEmbedder()
+
+
+def transcript_windows(transcription_path: str, window_seconds: float = WINDOW_SECONDS) -> List[Tuple[float, float, str]]:
+    #(start, end, text) for consecutive runs of segments spanning about window_seconds
+    transcription = open_transcription(transcription_path)
+    windows = []
+    start, end, parts = None, 0.0, []
+    for segment in transcription.get("segments") or []:
+        if start is None:
+            start = float(segment["start"])
+        parts.append(segment["text"].strip())
+        end = float(segment["end"])
+        if end - start >= window_seconds:
+            windows.append((start, end, " ".join(parts)))
+            start, parts = None, []
+    if parts:
+        windows.append((start, end, " ".join(parts)))
+    return windows
+
+
+def format_offset(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def recording_link(recording: str, seconds: Optional[float]) -> str:
+    #file:// URI with a media fragment, which players and browsers open at that offset
+    uri = Path(recording).as_uri()
+    return f"{uri}#t={int(seconds)}" if seconds is not None else uri
+
+
+class SearchIndex:
+    #Full-text index over transcript windows (SQLite FTS5, BM25 ranked) plus a vector index over
+    #subtopics and definitions from the enhanced notes (NumPy matrix, cosine similarity).
+    #Recordings are tracked by their manifest, so updates only open files whose stage output changed.
+    def __init__(self, db_path: Union[str, Path], embedder: str = "hashing"):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.embedder_name = embedder
+        self._embedder = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        # (ids, matrix) of the entries table, reloaded after writes
+        self._vectors: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = load_embedder(self.embedder_name)
+            self._check_embedder(self._embedder.name)
+        return self._embedder
+
+    def _check_embedder(self, name: str) -> None:
+        #Vectors from another embedder are not comparable; drop them so the next update re-embeds
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'embedder'").fetchone()
+            if row is not None and row["value"] != name:
+                logger.info(f"Embedder changed from {row['value']} to {name}; notes will be re-embedded")
+                self._conn.execute("DELETE FROM entries")
+                self._conn.execute("UPDATE documents SET notes_hash = NULL")
+                self._vectors = None
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('embedder', ?)", (name,))
+
+    def _document(self, recording: str) -> Optional[sqlite3.Row]:
+        return self._conn.execute("SELECT * FROM documents WHERE recording = ?", (recording,)).fetchone()
+
+    def index_manifest(self, manifest_path: Union[str, Path], manifest: Optional[Dict] = None) -> bool:
+        #Bring one recording up to date from its manifest; returns whether anything was re-read
+        manifest_path = Path(manifest_path)
+        mtime = manifest_path.stat().st_mtime_ns
+        if manifest is None:
+            manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+        recording = manifest["recording"]
+        stages = manifest.get("stages", {})
+        transcribe, enhance = stages.get("transcribe"), stages.get("enhance")
+        transcript_hash = transcribe["output"] if transcribe else None
+        notes_hash = enhance["output"] if enhance else None
+        self.embedder
+        with self._lock:
+            document = self._document(recording)
+        old_transcript = document["transcript_hash"] if document else None
+        old_notes = document["notes_hash"] if document else None
+        # read the changed files outside the lock; only the writes below are serialised
+        windows = None
+        if transcript_hash != old_transcript and transcript_hash and Path(transcribe["path"]).exists():
+            windows = transcript_windows(transcribe["path"])
+        entries = None
+        if notes_hash != old_notes and notes_hash and Path(enhance["path"]).exists():
+            entries = self._note_entries(json.loads(Path(enhance["path"]).read_text(encoding='utf-8')))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                if transcript_hash != old_transcript:
+                    self._conn.execute("DELETE FROM windows WHERE recording = ?", (recording,))
+                    self._conn.executemany(
+                        "INSERT INTO windows (text, recording, start, end) VALUES (?, ?, ?, ?)",
+                        [(text, recording, round(start, 2), round(end, 2)) for start, end, text in windows or []])
+                if notes_hash != old_notes or windows is not None:
+                    # entry offsets come from the transcript, so they are redone when either side changes
+                    if entries is None and notes_hash == old_notes and notes_hash:
+                        entries = self._stored_entries(recording)
+                    if windows is None and entries:
+                        windows = self._stored_windows(recording)
+                    starts = self._locate(windows or [], entries or [])
+                    self._conn.execute("DELETE FROM entries WHERE recording = ?", (recording,))
+                    self._conn.executemany(
+                        "INSERT INTO entries (recording, kind, title, text, start, vector) VALUES (?, ?, ?, ?, ?, ?)",
+                        [(recording, kind, title, text, start, vector.astype(np.float32).tobytes())
+                         for (kind, title, text, vector), start in zip(entries or [], starts)])
+                    self._vectors = None
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents (recording, manifest, manifest_mtime, transcript_hash, "
+                    "notes_hash, indexed) VALUES (?, ?, ?, ?, ?, ?)",
+                    (recording, str(manifest_path), mtime, transcript_hash if windows is not None or
+                     transcript_hash == old_transcript else None,
+                     notes_hash if entries is not None or notes_hash == old_notes else None, time.time()))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return windows is not None or entries is not None
+
+    def _note_entries(self, notes: Dict) -> List[Tuple[str, str, str, np.ndarray]]:
+        #(kind, title, text, vector) for every subtopic and definition in EnhancedDocNotes JSON
+        rows = []
+        for sub_topic in notes.get("sub_topics", []):
+            rows.append(("subtopic", sub_topic["title"], sub_topic.get("description") or ""))
+            for definition in sub_topic.get("definitions") or []:
+                rows.append(("definition", sub_topic["title"], definition))
+        if not rows:
+            return []
+        vectors = self.embedder.embed([f"{title}. {text}" for _, title, text in rows])
+        return [(kind, title, text, vector) for (kind, title, text), vector in zip(rows, vectors)]
+
+    def _stored_entries(self, recording: str) -> List[Tuple[str, str, str, np.ndarray]]:
+        rows = self._conn.execute("SELECT kind, title, text, vector FROM entries WHERE recording = ?",
+                                  (recording,)).fetchall()
+        return [(row["kind"], row["title"], row["text"], np.frombuffer(row["vector"], dtype=np.float32))
+                for row in rows]
+
+    def _stored_windows(self, recording: str) -> List[Tuple[float, float, str]]:
+        rows = self._conn.execute("SELECT start, end, text FROM windows WHERE recording = ?", (recording,)).fetchall()
+        return [(float(row["start"]), float(row["end"]), row["text"]) for row in rows]
+
+    def _locate(self, windows: List[Tuple[float, float, str]],
+                entries: List[Tuple[str, str, str, np.ndarray]]) -> List[Optional[float]]:
+        #Start of the transcript window most similar to each entry, for linking notes to the audio
+        if not windows or not entries:
+            return [None] * len(entries)
+        similarity = np.stack([vector for *_, vector in entries]) @ self.embedder.embed([text for *_, text in windows]).T
+        return [float(windows[best][0]) if similarity[row, best] > 0 else None
+                for row, best in enumerate(similarity.argmax(axis=1))]
+
+    def update(self, manifest_dir: Union[str, Path]) -> Dict[str, int]:
+        #Index new and changed recordings and drop deleted ones. Manifests whose mtime is unchanged
+        #are not even opened, so an update over an unchanged semester costs one stat() per recording.
+        manifest_dir = Path(manifest_dir)
+        with self._lock:
+            known = {row["manifest"]: row["manifest_mtime"]
+                     for row in self._conn.execute("SELECT manifest, manifest_mtime FROM documents")}
+        counts = {"indexed": 0, "unchanged": 0, "removed": 0}
+        seen = set()
+        for manifest_path in sorted(manifest_dir.glob("*.json")) if manifest_dir.exists() else []:
+            seen.add(str(manifest_path))
+            if known.get(str(manifest_path)) == manifest_path.stat().st_mtime_ns:
+                counts["unchanged"] += 1
+                continue
+            try:
+                changed = self.index_manifest(manifest_path)
+            except Exception as e:
+                logger.error(f"Error indexing {manifest_path}: {e}")
+                continue
+            counts["indexed" if changed else "unchanged"] += 1
+        with self._lock:
+            for manifest in set(known) - seen:
+                recording = self._conn.execute("SELECT recording FROM documents WHERE manifest = ?",
+                                               (manifest,)).fetchone()["recording"]
+                self._conn.execute("DELETE FROM windows WHERE recording = ?", (recording,))
+                self._conn.execute("DELETE FROM entries WHERE recording = ?", (recording,))
+                self._conn.execute("DELETE FROM documents WHERE recording = ?", (recording,))
+                self._vectors = None
+                counts["removed"] += 1
+        return counts
+
+    def clear(self) -> None:
+        with self._lock:
+            for table in ("documents", "windows", "entries"):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._vectors = None
+
+    def search_transcripts(self, query: str, limit: int = 10) -> List[Dict]:
+        match = _match_query(query)
+        if not match:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT recording, start, end, snippet(windows, 0, '[', ']', '...', 16) AS snippet, "
+                "bm25(windows) AS rank FROM windows WHERE windows MATCH ? ORDER BY rank LIMIT ?",
+                (match, limit)).fetchall()
+        return [{"kind": "transcript", "recording": row["recording"], "start": float(row["start"]),
+                 "end": float(row["end"]), "text": row["snippet"], "score": round(-row["rank"], 4)}
+                for row in rows]
+
+    def _load_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            if self._vectors is None:
+                rows = self._conn.execute("SELECT id, vector FROM entries ORDER BY id").fetchall()
+                ids = np.array([row["id"] for row in rows], dtype=np.int64)
+                matrix = (np.frombuffer(b"".join(row["vector"] for row in rows), dtype=np.float32)
+                          .reshape(len(rows), -1) if rows else np.zeros((0, 1), dtype=np.float32))
+                self._vectors = (ids, matrix)
+            return self._vectors
+
+    def search_notes(self, query: str, limit: int = 10) -> List[Dict]:
+        ids, matrix = self._load_vectors()
+        if not len(ids):
+            return []
+        scores = matrix @ self.embedder.embed([query])[0]
+        top = np.argsort(-scores)[:limit] if len(scores) <= limit else \
+            np.argpartition(-scores, limit)[:limit]
+        top = top[np.argsort(-scores[top])]
+        with self._lock:
+            rows = {row["id"]: row for row in self._conn.execute(
+                f"SELECT id, recording, kind, title, text, start FROM entries WHERE id IN "
+                f"({','.join('?' * len(top))})", [int(ids[i]) for i in top])}
+        return [{"kind": rows[int(ids[i])]["kind"], "recording": rows[int(ids[i])]["recording"],
+                 "start": rows[int(ids[i])]["start"], "title": rows[int(ids[i])]["title"],
+                 "text": rows[int(ids[i])]["text"], "score": round(float(scores[i]), 4)}
+                for i in top if scores[i] > 0]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    for table in ("documents", "windows", "entries")}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _match_query(text: str) -> str:
+    #FTS5 query matching any of the words in text, each quoted so punctuation and keywords are literal
+    words = list(dict.fromkeys(_words(text)))[:32]
+    return " OR ".join(f'"{word}"' for word in words)
@@ -0,0 +1,230 @@
+import json
+import time
+import logging
+import subprocess
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from src.core.vad import SAMPLE_RATE, JOIN_GAP_SECONDS, VadStats, detect_speech_regions, remap_result
+from src.utils.logger import metrics
+
+logger = logging.getLogger(__name__)
+
+# audio read from ffmpeg per block
+BLOCK_SECONDS = 30.0
+# Whisper decodes 30 s mel windows, so each call gets exactly one
+WINDOW_SECONDS = 30.0
+# a window's last segment ending this close to its edge was probably cut off
+EDGE_SECONDS = 1.0
+# words of the previous windows passed as the next window's prompt
+PROMPT_WORDS = 100
+
+
+def stream_audio(recording_path: str, block_seconds: float = BLOCK_SECONDS, start_seconds: float = 0.0,
+                 sample_rate: int = SAMPLE_RATE) -> Iterator[np.ndarray]:
+    #Decode a recording through ffmpeg as float32 blocks of block_seconds: the same mono 16 kHz PCM
+    #as whisper.load_audio, but never more than one block in memory
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0"]
+    if start_seconds:
+        command += ["-ss", f"{start_seconds:.3f}"]
+    command += ["-i", str(recording_path), "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le",
+                "-ar", str(sample_rate), "-"]
+    block_bytes = int(block_seconds * sample_rate) * 2
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    finished = False
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if len(data) % 2:
+                data = data[:-1]
+            if data:
+                yield np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+            if len(data) < block_bytes:
+                finished = True
+                break
+    finally:
+        process.stdout.close()
+        if not finished:
+            # the consumer stopped early
+            process.kill()
+        error = process.stderr.read().decode(errors="replace").strip()
+        process.stderr.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise RuntimeError(f"Failed to decode {recording_path}: {error[-500:]}")
+
+
+class _SpeechBuffer:
+    #Audio waiting for Whisper on a timeline with the silence cut out (with VAD), plus the map from
+    #that timeline back to the recording's. Holds at most a window and a block of samples.
+    def __init__(self, origin: float, vad: bool):
+        self.vad = vad
+        self.samples = np.zeros(0, dtype=np.float32)
+        # trimmed-timeline seconds of samples[0], and of the end of everything appended so far
+        self.start = 0.0
+        self.appended = 0
+        # (trimmed_start_seconds, original_start_seconds), as vad.trim_to_regions returns
+        self.offsets: List[List[float]] = [[0.0, origin]]
+        self.original_position = origin
+        self.stats = VadStats(original_seconds=0.0, speech_seconds=0.0, regions=0, vad_seconds=0.0)
+        self._open_region = True
+
+    def _append(self, samples: np.ndarray, original_start: float, contiguous: bool) -> None:
+        if not contiguous:
+            if self.appended:
+                gap = np.zeros(int(SAMPLE_RATE * JOIN_GAP_SECONDS), dtype=np.float32)
+                self.samples = np.concatenate([self.samples, gap])
+                self.appended += len(gap)
+            self.offsets.append([self.appended / SAMPLE_RATE, original_start])
+        self.samples = np.concatenate([self.samples, samples])
+        self.appended += len(samples)
+
+    def add(self, block: np.ndarray) -> None:
+        block_start = self.original_position
+        self.original_position += len(block) / SAMPLE_RATE
+        self.stats.original_seconds += len(block) / SAMPLE_RATE
+        if not self.vad:
+            self._append(block, block_start, contiguous=True)
+            return
+        start_time = time.perf_counter()
+        regions = detect_speech_regions(block)
+        self.stats.vad_seconds += time.perf_counter() - start_time
+        for index, (start, end) in enumerate(regions):
+            # speech running across the block edge continues without a gap
+            contiguous = index == 0 and start == 0 and self._open_region
+            self._append(block[start:end], block_start + start / SAMPLE_RATE, contiguous)
+            self.stats.speech_seconds += (end - start) / SAMPLE_RATE
+            self.stats.regions += not contiguous
+        self._open_region = bool(regions) and regions[-1][1] == len(block)
+
+    def consume(self, seconds: float) -> None:
+        #Drop the first seconds of the buffer, and the offsets only they needed
+        drop = min(len(self.samples), int(round(seconds * SAMPLE_RATE)))
+        self.samples = self.samples[drop:]
+        self.start += drop / SAMPLE_RATE
+        while len(self.offsets) > 1 and self.offsets[1][0] <= self.start:
+            self.offsets.pop(0)
+
+    def window_offsets(self) -> np.ndarray:
+        #The offsets for timestamps relative to the start of the buffer, for vad.remap_result
+        offsets = np.asarray(self.offsets, dtype=np.float64)
+        offsets[:, 0] -= self.start
+        return offsets
+
+
+def checkpoint_path_for(trans_path) -> Path:
+    #Where transcribe_streaming appends finished segments until the transcription at trans_path is saved
+    trans_path = Path(trans_path)
+    return trans_path.with_name(f"{trans_path.name.split('.')[0]}.partial.jsonl")
+
+
+def _load_checkpoint(checkpoint_path: Optional[Path]) -> List[Dict]:
+    if not checkpoint_path or not checkpoint_path.exists():
+        return []
+    segments = []
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                segments.append(json.loads(line))
+            except json.JSONDecodeError:
+                # a line cut off by a crash; everything after it is decoded again
+                break
+    return segments
+
+
+def transcribe_streaming(model, recording_path: str, language: str, vad: bool = True,
+                         checkpoint_path: Optional[Path] = None, refine_model=None,
+                         refine_model_name: Optional[str] = None, **transcribe_kwargs) -> Dict:
+    #Transcribe a recording of any length in bounded memory: ffmpeg is read block by block and
+    #Whisper gets one 30 s window at a time, prompted with the text before it. Each window starts where
+    #the previous one's last complete segment ended, so nothing cut by its edge is lost. Finished segments are appended to
+    #checkpoint_path as they come, so an interrupted run resumes where it stopped. With refine_model,
+    #each window's low-confidence segments are re-decoded while its audio is still in memory.
+    from src.core.tiered_transcription import TierStats, escalation_spans, record_tier_stats, refine_spans
+
+    checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+    segments = _load_checkpoint(checkpoint_path)
+    resume_at = segments[-1]["end"] if segments else 0.0
+    if segments:
+        logger.info(f"Resuming {Path(recording_path).name} at {resume_at:.0f}s from {len(segments)} checkpointed segments")
+    checkpoint = open(checkpoint_path, 'a', encoding='utf-8') if checkpoint_path else None
+    buffer = _SpeechBuffer(resume_at, vad)
+    prompt = deque((word for segment in segments for word in segment["text"].split()), maxlen=PROMPT_WORDS)
+    window_samples = int(WINDOW_SECONDS * SAMPLE_RATE)
+    tier = TierStats(refine_model=refine_model_name or "", audio_seconds=0.0, escalated_seconds=0.0,
+                     refined_seconds=0.0, segments=0, escalated_segments=0, fast_seconds=0.0, refine_seconds=0.0)
+    windows = 0
+    blocks = stream_audio(recording_path, start_seconds=resume_at)
+    exhausted = False
+    try:
+        with metrics.span("whisper", vad=vad, stream=True) as span:
+            while True:
+                while len(buffer.samples) < window_samples and not exhausted:
+                    block = next(blocks, None)
+                    if block is None:
+                        exhausted = True
+                    else:
+                        buffer.add(block)
+                if not len(buffer.samples):
+                    break
+                window = buffer.samples[:window_samples]
+                final = exhausted and len(buffer.samples) <= window_samples
+                result = model.transcribe(window, language=language, verbose=None,
+                                          initial_prompt=" ".join(prompt) or None, **transcribe_kwargs)
+                windows += 1
+                window_segments = result.get("segments") or []
+                advance = len(window) / SAMPLE_RATE
+                if not final and window_segments:
+                    if len(window_segments) > 1 and window_segments[-1]["end"] >= advance - EDGE_SECONDS:
+                        # cut off by the window edge: decoded again, whole, at the start of the next window
+                        window_segments = window_segments[:-1]
+                    # audio after the last segment may hold the start of a word, so it is heard again too
+                    advance = window_segments[-1]["end"] or advance
+                if refine_model is not None and window_segments:
+                    spans = escalation_spans(window_segments)
+                    tier.audio_seconds += advance
+                    tier.segments += len(window_segments)
+                    if spans:
+                        tier.escalated_segments += sum(last - first + 1 for first, last in spans)
+                        tier.escalated_seconds += sum(window_segments[last]["end"] - window_segments[first]["start"]
+                                                      for first, last in spans)
+                        refined = {"segments": window_segments}
+                        with metrics.span("whisper", tier="refine") as refine_span:
+                            tier.refined_seconds += refine_spans(refined, window, refine_model, refine_model_name,
+                                                                 spans, language)
+                        tier.refine_seconds += refine_span.elapsed
+                        window_segments = refined["segments"]
+                remap_result({"segments": window_segments}, buffer.window_offsets())
+                for segment in window_segments:
+                    segments.append(segment)
+                    prompt.extend(segment["text"].split())
+                    if checkpoint:
+                        checkpoint.write(json.dumps(segment, ensure_ascii=False) + "\n")
+                if checkpoint:
+                    checkpoint.flush()
+                buffer.consume(advance)
+                if final:
+                    break
+            span.set(audio_seconds=buffer.stats.original_seconds, windows=windows,
+                     rtf=span.elapsed / buffer.stats.original_seconds if buffer.stats.original_seconds else None)
+    finally:
+        blocks.close()
+        if checkpoint:
+            checkpoint.close()
+    metrics.incr("audio_seconds", buffer.stats.original_seconds)
+
+    for number, segment in enumerate(segments):
+        segment["id"] = number
+    result = {"text": "".join(segment["text"] for segment in segments), "segments": segments,
+              "language": language}
+    if vad:
+        result["vad"] = buffer.stats.to_dict()
+    if refine_model is not None:
+        tier.fast_seconds = max(0.0, span.elapsed - tier.refine_seconds)
+        record_tier_stats(tier.to_dict())
+        result["tiered"] = tier.to_dict()
+    logger.info(f"Streamed {buffer.stats.original_seconds:.0f}s of audio through Whisper in {windows} windows")
+    return result
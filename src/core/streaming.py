@@ -0,0 +1,132 @@
+import json
+import logging
+from typing import Any, Callable, List, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+
+class NotesListener:
+    #Receives notes while they are being produced, for interactive output and early starts.
+    #Methods may be called from the LLM client's event loop or from worker threads, so keep them quick.
+    def on_main_topic(self, main_topic: str) -> None:
+        pass
+
+    def on_subtopic(self, stage: str, index: int, subtopic: BaseModel) -> None:
+        #stage is "extract" for first-pass SubTopics and "enhance" for EnhancedSubTopics
+        pass
+
+
+class StructuredStream:
+    #Incremental scanner over a JSON object as its text streams in. Reports each top-level string
+    #field once its closing quote arrives, and each element of array_field once its closing brace
+    #does, validated as item_model. Nothing here decides the final result: the caller still takes the
+    #SDK's validated output, and finish() delivers whatever the stream did not.
+    def __init__(self, array_field: str, item_model: Type[BaseModel],
+                 on_item: Optional[Callable[[int, BaseModel], None]] = None,
+                 on_field: Optional[Callable[[str, Any], None]] = None):
+        self.array_field = array_field
+        self.item_model = item_model
+        self.on_item = on_item
+        self.on_field = on_field
+        # survive restart(), so a retried request never reports an item or field twice
+        self.items_reported = 0
+        self.fields_reported: set = set()
+        self.restart()
+
+    def restart(self) -> None:
+        #Forget the partial text, e.g. when the request is retried after a dropped stream
+        self._buffer = ""
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._in_array = False
+        self._item_start: Optional[int] = None
+        self._item_index = 0
+
+    def feed(self, delta: str) -> None:
+        start = len(self._buffer)
+        self._buffer += delta
+        for i in range(start, len(self._buffer)):
+            self._step(i, self._buffer[i])
+
+    def _step(self, i: int, char: str) -> None:
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if len(self._stack) == 1:
+                    self._top_level_string(json.loads(self._buffer[self._string_start:i + 1]))
+            return
+        if char == '"':
+            self._in_string = True
+            self._string_start = i
+        elif char in "{[":
+            self._stack.append(char)
+            depth = len(self._stack)
+            if depth == 1:
+                self._expect_key = True
+            elif depth == 2 and char == "[" and self._key == self.array_field:
+                self._in_array = True
+            elif depth == 3 and char == "{" and self._in_array:
+                self._item_start = i
+        elif char in "}]":
+            self._stack.pop()
+            depth = len(self._stack)
+            if depth == 2 and char == "}" and self._item_start is not None:
+                self._item(self._buffer[self._item_start:i + 1])
+                self._item_start = None
+            elif depth == 1 and char == "]":
+                self._in_array = False
+        elif len(self._stack) == 1:
+            if char == ":":
+                self._expect_key = False
+            elif char == ",":
+                self._expect_key = True
+
+    def _top_level_string(self, value: str) -> None:
+        if self._expect_key:
+            self._key = value
+        elif self._key not in self.fields_reported:
+            self.fields_reported.add(self._key)
+            if self.on_field:
+                self.on_field(self._key, value)
+
+    def _item(self, raw: str) -> None:
+        index = self._item_index
+        self._item_index += 1
+        if index < self.items_reported:
+            return
+        try:
+            item = self.item_model.model_validate_json(raw)
+        except ValidationError as e:
+            # finish() delivers it from the validated result instead
+            logger.debug(f"Streamed {self.item_model.__name__} {index} did not validate: {e}")
+            return
+        if index == self.items_reported:
+            self.items_reported += 1
+            if self.on_item:
+                self.on_item(index, item)
+
+    def finish(self, result: Optional[BaseModel]) -> None:
+        #Report anything the stream did not from the final validated result: everything on a cache
+        #hit, the remaining items otherwise
+        if result is None:
+            return
+        for name, value in result:
+            if isinstance(value, str) and name not in self.fields_reported:
+                self.fields_reported.add(name)
+                if self.on_field:
+                    self.on_field(name, value)
+        items = getattr(result, self.array_field) or []
+        for index in range(self.items_reported, len(items)):
+            self.items_reported += 1
+            if self.on_item:
+                self.on_item(index, items[index])
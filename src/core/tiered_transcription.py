@@ -0,0 +1,187 @@
+import time
+import logging
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.core.vad import SAMPLE_RATE, transcribe_with_vad
+from src.utils.logger import metrics
+
+logger = logging.getLogger(__name__)
+
+# the thresholds Whisper itself uses to decide a decode went wrong and retry at a higher temperature
+LOGPROB_THRESHOLD = -1.0
+COMPRESSION_RATIO_THRESHOLD = 2.4
+NO_SPEECH_THRESHOLD = 0.6
+# audio kept either side of an escalated span so the larger model hears whole words
+SPAN_PADDING_SECONDS = 0.5
+
+
+@dataclass
+class TierStats:
+    refine_model: str
+    # audio the fast model decoded, and how much of it was flagged for the refine model
+    audio_seconds: float
+    escalated_seconds: float
+    # audio the refine model actually decoded, padding included
+    refined_seconds: float
+    segments: int
+    escalated_segments: int
+    fast_seconds: float
+    refine_seconds: float
+
+    @property
+    def escalated_fraction(self) -> float:
+        return self.escalated_seconds / self.audio_seconds if self.audio_seconds else 0.0
+
+    @property
+    def estimated_speedup(self) -> Optional[float]:
+        # the refine model's measured speed on the escalated spans, extrapolated to the whole recording
+        if not self.refined_seconds or not self.refine_seconds:
+            return None
+        full_seconds = self.refine_seconds / self.refined_seconds * self.audio_seconds
+        return full_seconds / (self.fast_seconds + self.refine_seconds)
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), "escalated_fraction": self.escalated_fraction,
+                "estimated_speedup": self.estimated_speedup}
+
+
+def is_low_confidence(segment: Dict, logprob_threshold: float = LOGPROB_THRESHOLD,
+                      compression_ratio_threshold: float = COMPRESSION_RATIO_THRESHOLD,
+                      no_speech_threshold: float = NO_SPEECH_THRESHOLD) -> bool:
+    #Whether a Whisper segment is worth decoding again with a larger model
+    avg_logprob = segment.get("avg_logprob", 0.0)
+    if segment.get("no_speech_prob", 0.0) > no_speech_threshold and avg_logprob < logprob_threshold:
+        # Whisper's own test for silence: there is nothing there to get right
+        return False
+    return avg_logprob < logprob_threshold or segment.get("compression_ratio", 0.0) > compression_ratio_threshold
+
+
+def escalation_spans(segments: List[Dict], **thresholds) -> List[Tuple[int, int]]:
+    #(first, last) indexes of runs of consecutive low-confidence segments, each re-decoded as one clip
+    spans: List[Tuple[int, int]] = []
+    for index, segment in enumerate(segments):
+        if not is_low_confidence(segment, **thresholds):
+            continue
+        if spans and spans[-1][1] == index - 1:
+            spans[-1] = (spans[-1][0], index)
+        else:
+            spans.append((index, index))
+    return spans
+
+
+def _shift(segment: Dict, offset: float) -> Dict:
+    segment = dict(segment)
+    segment["start"], segment["end"] = segment["start"] + offset, segment["end"] + offset
+    if segment.get("words"):
+        segment["words"] = [{**word, "start": word["start"] + offset, "end": word["end"] + offset}
+                            for word in segment["words"]]
+    return segment
+
+
+def refine_spans(result: Dict, audio: np.ndarray, model, model_name: str, spans: List[Tuple[int, int]],
+                 language: str, padding: float = SPAN_PADDING_SECONDS, **transcribe_kwargs) -> float:
+    #Re-decode each span's audio with model and splice its segments into result in place of the
+    #originals; returns the seconds of audio decoded. Timestamps are on the original recording.
+    segments = result["segments"]
+    duration = len(audio) / SAMPLE_RATE
+    replacements: Dict[int, Tuple[int, List[Dict]]] = {}
+    decoded = 0.0
+    for first, last in spans:
+        start, end = segments[first]["start"], segments[last]["end"]
+        clip_start, clip_end = max(0.0, start - padding), min(duration, end + padding)
+        clip = audio[int(clip_start * SAMPLE_RATE):int(clip_end * SAMPLE_RATE)]
+        decoded += len(clip) / SAMPLE_RATE
+        refined = model.transcribe(clip, language=language, verbose=None, **transcribe_kwargs)
+        # the padding is context only: keep what the larger model placed inside the span
+        kept = []
+        for segment in refined.get("segments", []):
+            segment = _shift(segment, clip_start)
+            if start <= (segment["start"] + segment["end"]) / 2 <= end:
+                # clamped, so the spliced segments never overlap their neighbours
+                segment["start"], segment["end"] = max(segment["start"], start), min(segment["end"], end)
+                segment["refined_by"] = model_name
+                kept.append(segment)
+        if kept:
+            replacements[first] = (last, kept)
+        else:
+            logger.debug(f"{model_name} heard nothing in {start:.1f}-{end:.1f}s; keeping the fast transcript")
+
+    spliced: List[Dict] = []
+    index = 0
+    while index < len(segments):
+        if index in replacements:
+            last, kept = replacements[index]
+            spliced.extend(kept)
+            index = last + 1
+        else:
+            spliced.append(segments[index])
+            index += 1
+    for number, segment in enumerate(spliced):
+        segment["id"] = number
+    result["segments"] = spliced
+    result["text"] = "".join(segment["text"] for segment in spliced)
+    return decoded
+
+
+def transcribe_tiered(fast_model, refine_model, refine_model_name: str, recording_path: str, language: str,
+                      vad: bool = True, audio: Optional[np.ndarray] = None, **thresholds) -> Dict:
+    #Transcribe with fast_model, then re-decode only its low-confidence segments with refine_model.
+    #The result carries a "tiered" entry with the escalated fraction and the estimated speedup over
+    #running refine_model on the whole recording.
+    if audio is None:
+        import whisper
+
+        with metrics.span("decode"):
+            audio = whisper.load_audio(recording_path)
+    start = time.perf_counter()
+    if vad:
+        result = transcribe_with_vad(fast_model, recording_path, language, audio=audio)
+        audio_seconds = result["vad"]["speech_seconds"] or result["vad"]["original_seconds"]
+    else:
+        audio_seconds = len(audio) / SAMPLE_RATE
+        metrics.incr("audio_seconds", audio_seconds)
+        with metrics.span("whisper", vad=False) as span:
+            result = fast_model.transcribe(audio, language=language, verbose=None)
+            span.set(audio_seconds=audio_seconds, rtf=span.elapsed / audio_seconds if audio_seconds else None)
+    fast_seconds = time.perf_counter() - start
+
+    segments = result.get("segments") or []
+    spans = escalation_spans(segments, **thresholds)
+    escalated_seconds = sum(segments[last]["end"] - segments[first]["start"] for first, last in spans)
+    start = time.perf_counter()
+    refined_seconds = 0.0
+    if spans:
+        with metrics.span("whisper", tier="refine") as span:
+            refined_seconds = refine_spans(result, audio, refine_model, refine_model_name, spans, language)
+            span.set(model=refine_model_name, audio_seconds=refined_seconds, spans=len(spans),
+                     rtf=span.elapsed / refined_seconds if refined_seconds else None)
+    stats = TierStats(
+        refine_model=refine_model_name,
+        audio_seconds=audio_seconds,
+        escalated_seconds=escalated_seconds,
+        refined_seconds=refined_seconds,
+        segments=len(segments),
+        escalated_segments=sum(last - first + 1 for first, last in spans),
+        fast_seconds=fast_seconds,
+        refine_seconds=time.perf_counter() - start,
+    )
+    record_tier_stats(stats.to_dict())
+    result["tiered"] = stats.to_dict()
+    speedup = f", ~{stats.estimated_speedup:.1f}x faster than {refine_model_name} throughout" \
+        if stats.estimated_speedup else ""
+    logger.info(f"Escalated {stats.escalated_segments} of {stats.segments} segments "
+                f"({stats.escalated_fraction:.0%} of the audio) to {refine_model_name}{speedup}")
+    return result
+
+
+def record_tier_stats(stats: Dict) -> None:
+    #Counters behind the run summary's escalated_fraction and tiered_speedup; transcription worker
+    #processes send their stats back so the parent can record them
+    metrics.incr("tier_audio_seconds", stats["audio_seconds"])
+    metrics.incr("tier_escalated_seconds", stats["escalated_seconds"])
+    metrics.incr("tier_refined_seconds", stats["refined_seconds"])
+    metrics.incr("tier_fast_seconds", stats["fast_seconds"])
+    metrics.incr("tier_refine_seconds", stats["refine_seconds"])
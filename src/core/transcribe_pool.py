@@ -0,0 +1,124 @@
+import os
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.core.vad import transcribe_with_vad
+from src.core.tiered_transcription import transcribe_tiered, record_tier_stats
+from src.core.stream_decode import checkpoint_path_for, transcribe_streaming
+from src.core.transcript_store import save_transcription
+from src.utils.logger import metrics
+
+logger = logging.getLogger(__name__)
+
+# Per-process state, set up once by _init_worker
+_worker_model = None
+_worker_refine_model = None
+
+
+def _init_worker(whisper_model: str, torch_threads: int, refine_model: Optional[str] = None) -> None:
+    #Load one Whisper model (two when tiered) per worker process, pinned to its share of torch threads
+    global _worker_model, _worker_refine_model
+    import torch
+    import whisper
+
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(1)
+    _worker_model = whisper.load_model(whisper_model)
+    _worker_refine_model = whisper.load_model(refine_model) if refine_model else None
+
+
+def _transcribe_in_worker(recording_path: str, trans_path: str, language: str, vad: bool,
+                          refine_model: Optional[str] = None,
+                          stream_decode: bool = False) -> Tuple[str, float, float, Optional[Dict]]:
+    #Transcribe one recording and save it the same way LectureProcessor.transcribe does
+    start = time.perf_counter()
+    if stream_decode:
+        result = transcribe_streaming(_worker_model, recording_path, language, vad=vad,
+                                      checkpoint_path=checkpoint_path_for(trans_path),
+                                      refine_model=_worker_refine_model, refine_model_name=refine_model)
+    elif refine_model:
+        result = transcribe_tiered(_worker_model, _worker_refine_model, refine_model, recording_path, language,
+                                   vad=vad)
+    elif vad:
+        result = transcribe_with_vad(_worker_model, recording_path, language)
+    else:
+        result = _worker_model.transcribe(recording_path, language=language, verbose=None)
+    save_transcription(result, trans_path)
+    if stream_decode:
+        checkpoint_path_for(trans_path).unlink(missing_ok=True)
+    segments = result.get("segments") or []
+    if "vad" in result:
+        audio_seconds = result["vad"]["original_seconds"]
+    else:
+        audio_seconds = segments[-1]["end"] if segments else 0.0
+    return trans_path, audio_seconds, time.perf_counter() - start, result.get("tiered")
+
+
+class TranscriptionPool:
+    #Shards recordings across worker processes, each holding its own Whisper model
+    def __init__(self, whisper_model: str = "base", workers: int = 2, torch_threads: Optional[int] = None,
+                 language: str = "en", vad: bool = True, refine_model: Optional[str] = None,
+                 stream_decode: bool = False):
+        self.whisper_model = whisper_model
+        self.refine_model = refine_model
+        # workers decode block by block, so a long recording no longer costs its length in memory
+        self.stream_decode = stream_decode
+        self.language = language
+        self.vad = vad
+        self.workers = max(1, workers)
+        # split the cores evenly; torch intra-op threading stops scaling after a few cores anyway
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // self.workers)
+
+    def transcribe_all(self, jobs: List[Tuple[str, Path]]) -> Dict[str, Optional[str]]:
+        #Transcribe (recording_path, transcription_path) pairs, skipping ones already on disk
+        results: Dict[str, Optional[str]] = {}
+        pending = []
+        for recording_path, trans_path in jobs:
+            if Path(trans_path).exists():
+                results[recording_path] = str(trans_path)
+            else:
+                pending.append((recording_path, str(trans_path)))
+        if not pending:
+            return results
+
+        logger.info(f"Transcribing {len(pending)} recordings with {self.workers} workers "
+                    f"x {self.torch_threads} torch threads")
+        wall_start = time.perf_counter()
+        audio_total = 0.0
+        # spawn avoids inheriting torch/OpenMP state from the parent process
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(pending)), mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(self.whisper_model, self.torch_threads, self.refine_model)) as executor:
+            futures = {
+                executor.submit(_transcribe_in_worker, recording_path, trans_path, self.language, self.vad,
+                                self.refine_model, self.stream_decode): recording_path
+                for recording_path, trans_path in pending
+            }
+            for future in as_completed(futures):
+                recording_path = futures[future]
+                try:
+                    trans_path, audio_seconds, elapsed, tier_stats = future.result()
+                    audio_total += audio_seconds
+                    # worker processes cannot reach this process's metrics, so their timings are added here
+                    metrics.incr("audio_seconds", audio_seconds)
+                    metrics.record("whisper", elapsed, {"worker": "process"}, audio_seconds=audio_seconds,
+                                   rtf=elapsed / audio_seconds if audio_seconds else None)
+                    if tier_stats:
+                        record_tier_stats(tier_stats)
+                    results[recording_path] = trans_path
+                    logger.info(f"Transcription saved to: {trans_path} "
+                                f"({audio_seconds:.0f}s audio in {elapsed:.0f}s)")
+                except Exception as e:
+                    logger.error(f"Error transcribing {recording_path}: {e}")
+                    results[recording_path] = None
+
+        wall = time.perf_counter() - wall_start
+        throughput = audio_total / wall if wall > 0 else 0.0
+        logger.info(f"Transcribed {audio_total:.0f}s of audio in {wall:.0f}s "
+                    f"({throughput:.2f} audio-seconds per wall-second)")
+        return results
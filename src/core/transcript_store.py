@@ -0,0 +1,212 @@
+import json
+import zlib
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+STORE_SUFFIX = ".tstore"
+FORMAT_VERSION = 1
+
+# One row per Whisper segment; text and token ids live in separate blobs addressed by offset
+SEGMENT_DTYPE = np.dtype([
+    ("start", "<f4"),
+    ("end", "<f4"),
+    ("avg_logprob", "<f4"),
+    ("no_speech_prob", "<f4"),
+    ("compression_ratio", "<f4"),
+    ("temperature", "<f4"),
+    ("seek", "<i4"),
+    ("text_offset", "<i8"),
+    ("text_length", "<i4"),
+    ("token_offset", "<i8"),
+    ("token_count", "<i4"),
+])
+
+_SEGMENT_FLOATS = ("start", "end", "avg_logprob", "no_speech_prob", "compression_ratio", "temperature")
+
+
+def write_transcript_store(result: Dict, path: Union[str, Path]) -> Path:
+    #Write a Whisper result as a .tstore directory: segments.npy, tokens.npy, zlib-compressed text, meta.json
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+
+    segments = result.get("segments") or []
+    table = np.zeros(len(segments), dtype=SEGMENT_DTYPE)
+    text_parts: List[bytes] = []
+    token_parts: List[np.ndarray] = []
+    text_offset = 0
+    token_offset = 0
+    for i, segment in enumerate(segments):
+        for field in _SEGMENT_FLOATS:
+            table[field][i] = segment.get(field) or 0.0
+        table["seek"][i] = segment.get("seek", 0)
+        encoded = segment.get("text", "").encode("utf-8")
+        tokens = np.asarray(segment.get("tokens") or [], dtype=np.int32)
+        table["text_offset"][i], table["text_length"][i] = text_offset, len(encoded)
+        table["token_offset"][i], table["token_count"][i] = token_offset, len(tokens)
+        text_parts.append(encoded)
+        token_parts.append(tokens)
+        text_offset += len(encoded)
+        token_offset += len(tokens)
+
+    segment_text = b"".join(text_parts)
+    full_text = result.get("text", "").encode("utf-8")
+    np.save(tmp_path / "segments.npy", table)
+    np.save(tmp_path / "tokens.npy", np.concatenate(token_parts) if token_parts else np.zeros(0, dtype=np.int32))
+    (tmp_path / "segment_text.zlib").write_bytes(zlib.compress(segment_text, 6))
+    # Whisper's text is normally the segment texts joined, so it is only stored when it differs
+    if full_text != segment_text:
+        (tmp_path / "text.zlib").write_bytes(zlib.compress(full_text, 6))
+
+    meta = {key: value for key, value in result.items() if key not in ("text", "segments")}
+    meta["format_version"] = FORMAT_VERSION
+    (tmp_path / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    shutil.rmtree(path, ignore_errors=True)
+    tmp_path.rename(path)
+    return path
+
+
+class TranscriptReader:
+    #Lazy reader for a .tstore: the segment table and token ids are memory-mapped and the text is
+    #decompressed only when asked for. Supports ['text'] and .get('segments') like a loaded JSON result.
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._segments: Optional[np.ndarray] = None
+        self._tokens: Optional[np.ndarray] = None
+        self._segment_text: Optional[bytes] = None
+        self._text: Optional[str] = None
+        self._meta: Optional[Dict] = None
+
+    @property
+    def meta(self) -> Dict:
+        if self._meta is None:
+            self._meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        return self._meta
+
+    @property
+    def segments(self) -> np.ndarray:
+        if self._segments is None:
+            self._segments = np.load(self.path / "segments.npy", mmap_mode="r")
+        return self._segments
+
+    @property
+    def tokens(self) -> np.ndarray:
+        if self._tokens is None:
+            self._tokens = np.load(self.path / "tokens.npy", mmap_mode="r")
+        return self._tokens
+
+    def _segment_bytes(self) -> bytes:
+        if self._segment_text is None:
+            self._segment_text = zlib.decompress((self.path / "segment_text.zlib").read_bytes())
+        return self._segment_text
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            text_path = self.path / "text.zlib"
+            data = zlib.decompress(text_path.read_bytes()) if text_path.exists() else self._segment_bytes()
+            self._text = data.decode("utf-8")
+        return self._text
+
+    @property
+    def duration(self) -> float:
+        return float(self.segments["end"][-1]) if len(self.segments) else 0.0
+
+    def segment_text(self, index: int) -> str:
+        row = self.segments[index]
+        offset = int(row["text_offset"])
+        return self._segment_bytes()[offset:offset + int(row["text_length"])].decode("utf-8")
+
+    def segment_tokens(self, index: int) -> np.ndarray:
+        row = self.segments[index]
+        offset = int(row["token_offset"])
+        return self.tokens[offset:offset + int(row["token_count"])]
+
+    def slice_indices(self, start: float, end: float) -> range:
+        #Indices of segments overlapping [start, end) seconds
+        first = int(np.searchsorted(self.segments["end"], start, side="right"))
+        last = int(np.searchsorted(self.segments["start"], end, side="left"))
+        return range(first, max(first, last))
+
+    def slice_text(self, start: float, end: float) -> str:
+        return "".join(self.segment_text(i) for i in self.slice_indices(start, end))
+
+    def segment_dicts(self, indices: Optional[range] = None, with_tokens: bool = False) -> List[Dict]:
+        #Segments in Whisper's dict form; token lists are left out unless asked for
+        rows = []
+        for i in indices if indices is not None else range(len(self.segments)):
+            row = self.segments[i]
+            segment = {"id": i, "seek": int(row["seek"]), "text": self.segment_text(i)}
+            segment.update({field: float(row[field]) for field in _SEGMENT_FLOATS})
+            if with_tokens:
+                segment["tokens"] = self.segment_tokens(i).tolist()
+            rows.append(segment)
+        return rows
+
+    def to_whisper_result(self) -> Dict:
+        meta = {key: value for key, value in self.meta.items() if key != "format_version"}
+        return {"text": self.text, "segments": self.segment_dicts(with_tokens=True), **meta}
+
+    # dict-style access so processors can treat stores and JSON results alike
+    def __getitem__(self, key: str) -> Any:
+        if key == "text":
+            return self.text
+        if key == "segments":
+            return self.segment_dicts()
+        return self.meta[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+def save_transcription(result: Dict, path: Union[str, Path]) -> Path:
+    #Write result as JSON or as a transcript store, depending on the path's suffix
+    path = Path(path)
+    if path.suffix == STORE_SUFFIX:
+        return write_transcript_store(result, path)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def open_transcription(path: Union[str, Path]) -> Union[Dict, TranscriptReader]:
+    #Reader for a .tstore, or the parsed dict for a legacy JSON transcription
+    path = Path(path)
+    if path.suffix == STORE_SUFFIX:
+        return TranscriptReader(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def transcription_size(path: Union[str, Path]) -> int:
+    path = Path(path)
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+    return path.stat().st_size
+
+
+def remove_transcription(path: Union[str, Path]) -> None:
+    path = Path(path)
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def convert_json_file(json_path: Union[str, Path], remove_json: bool = True) -> Path:
+    #Convert one JSON transcription into a store next to it
+    json_path = Path(json_path)
+    with open(json_path, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+    store_path = write_transcript_store(result, json_path.with_suffix(STORE_SUFFIX))
+    if remove_json:
+        json_path.unlink()
+    return store_path
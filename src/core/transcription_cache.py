@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.utils.file_utils import hash_file, hash_text
+from src.utils.logger import metrics
+from src.core.transcript_store import (
+    STORE_SUFFIX, save_transcription, transcription_size, remove_transcription, convert_json_file,
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+# a hit rewrites the index only when the entry's stored last_access is older than this; eviction
+# works in days, so an hour of LRU resolution is plenty
+LAST_ACCESS_RESOLUTION = 3600
+
+
+class TranscriptionCache:
+    #Transcriptions stored under a key derived from the audio content, Whisper model and language,
+    #with a JSON index used for lookups and size/LRU eviction. Transcriptions saved by name before
+    #the index existed (<stem>.json) are adopted into it the first time their recording is keyed.
+    def __init__(self, cache_dir: Path, max_bytes: Optional[int] = None, storage_format: str = "store"):
+        self.cache_dir = Path(cache_dir)
+        # "store" writes compact .tstore directories, "json" the original Whisper JSON
+        self.storage_format = storage_format
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.cache_dir / INDEX_FILE
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+        if "legacy" not in self._index:
+            with self._lock:
+                self._index["legacy"] = self._scan_legacy()
+                self._save_index()
+
+    def _load_index(self) -> Dict[str, Dict]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            index = {}
+        index.setdefault("entries", {})
+        # remembers the content hash per (path, size, mtime) so unchanged files are not re-hashed
+        index.setdefault("sources", {})
+        return index
+
+    def _save_index(self) -> None:
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    @staticmethod
+    def _is_key(stem: str) -> bool:
+        return len(stem) == 64 and all(c in "0123456789abcdef" for c in stem)
+
+    def _scan_legacy(self) -> Dict[str, str]:
+        #Unindexed transcriptions named after their recording, by stem
+        indexed = {entry.get("file", f"{key}.json") for key, entry in self._index["entries"].items()}
+        legacy = {}
+        for path in sorted(self.cache_dir.iterdir()):
+            if path.suffix not in (".json", STORE_SUFFIX) or path.name == INDEX_FILE or path.name in indexed:
+                continue
+            # key-named files without an entry are unfinished writes, not old transcriptions
+            if not self._is_key(path.stem):
+                legacy[path.stem] = path.name
+        if legacy:
+            logger.info(f"Found {len(legacy)} transcriptions saved by recording name; they are indexed on next use")
+        return legacy
+
+    def _adopt_legacy(self, key: str, recording_path: str, whisper_model: str, language: str) -> None:
+        #Move the <stem> transcription of recording_path, if one is waiting, under key
+        stem = Path(recording_path).stem
+        with self._lock:
+            name = self._index["legacy"].get(stem)
+            if not name or key in self._index["entries"]:
+                return
+            del self._index["legacy"][stem]
+            legacy_path = self.cache_dir / name
+            if not legacy_path.exists():
+                self._save_index()
+                return
+            path = self.cache_dir / f"{key}{legacy_path.suffix}"
+            os.replace(legacy_path, path)
+            self._register_locked(key, recording_path, whisper_model, language, path)
+        logger.info(f"Indexed the existing transcription {name} of {Path(recording_path).name}")
+
+    def audio_hash(self, recording_path: str) -> str:
+        rp = Path(recording_path).resolve()
+        stat = rp.stat()
+        fingerprint = f"{stat.st_size}:{stat.st_mtime_ns}"
+        with self._lock:
+            known = self._index["sources"].get(str(rp))
+            if known and known["fingerprint"] == fingerprint:
+                return known["sha256"]
+        digest = hash_file(rp)
+        with self._lock:
+            self._index["sources"][str(rp)] = {"fingerprint": fingerprint, "sha256": digest}
+            self._save_index()
+        return digest
+
+    def key_for(self, recording_path: str, whisper_model: str, language: str) -> str:
+        key = self.key_for_hash(self.audio_hash(recording_path), whisper_model, language)
+        if self._index["legacy"]:
+            self._adopt_legacy(key, recording_path, whisper_model, language)
+        return key
+
+    def key_for_hash(self, audio_hash: str, whisper_model: str, language: str) -> str:
+        return hash_text(audio_hash, whisper_model, language)
+
+    def path_for(self, key: str) -> Path:
+        #Where a new transcription for key is written, in the configured format
+        suffix = STORE_SUFFIX if self.storage_format == "store" else ".json"
+        return self.cache_dir / f"{key}{suffix}"
+
+    def _entry_path(self, key: str, entry: Dict) -> Path:
+        # entries remember their own file, so both formats can coexist in one cache
+        return self.cache_dir / entry.get("file", f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        #Return the cached transcription path for key, refreshing its LRU timestamp. Hits are counted
+        #in memory and only reach disk once last_access is LAST_ACCESS_RESOLUTION stale, or with the next write.
+        with self._lock:
+            entry = self._index["entries"].get(key)
+            if not entry:
+                metrics.incr("cache_requests", cache="transcription", result="miss")
+                return None
+            path = self._entry_path(key, entry)
+            if not path.exists():
+                del self._index["entries"][key]
+                self._save_index()
+                metrics.incr("cache_requests", cache="transcription", result="miss")
+                return None
+            metrics.incr("cache_requests", cache="transcription", result="hit")
+            now = time.time()
+            stale = now - entry["last_access"] >= LAST_ACCESS_RESOLUTION
+            entry["last_access"] = now
+            entry["hits"] = entry.get("hits", 0) + 1
+            if stale:
+                self._save_index()
+            return str(path)
+
+    def add(self, key: str, recording_path: str, whisper_model: str, language: str,
+            path: Optional[Path] = None) -> str:
+        #Register a transcription already written to path (default path_for(key)), then evict if over budget
+        path = Path(path) if path else self.path_for(key)
+        with self._lock:
+            self._register_locked(key, recording_path, whisper_model, language, path)
+        return str(path)
+
+    def _register_locked(self, key: str, recording_path: str, whisper_model: str, language: str, path: Path) -> None:
+        now = time.time()
+        self._index["entries"][key] = {
+            "source": str(Path(recording_path).resolve()),
+            "whisper_model": whisper_model,
+            "language": language,
+            "file": path.name,
+            "size": transcription_size(path),
+            "created": now,
+            "last_access": now,
+            "hits": 0,
+        }
+        self._evict_locked(self.max_bytes)
+        self._save_index()
+
+    def put(self, key: str, result: Dict, recording_path: str, whisper_model: str, language: str) -> str:
+        save_transcription(result, self.path_for(key))
+        return self.add(key, recording_path, whisper_model, language)
+
+    def _evict_locked(self, max_bytes: Optional[int], older_than: Optional[float] = None) -> List[str]:
+        entries = self._index["entries"]
+        removed = []
+        if older_than is not None:
+            removed += [key for key, entry in entries.items() if entry["last_access"] < older_than]
+        if max_bytes is not None:
+            total = sum(entry["size"] for key, entry in entries.items() if key not in removed)
+            for key, entry in sorted(entries.items(), key=lambda item: item[1]["last_access"]):
+                if total <= max_bytes:
+                    break
+                if key not in removed:
+                    removed.append(key)
+                    total -= entry["size"]
+        for key in removed:
+            remove_transcription(self._entry_path(key, entries[key]))
+            del entries[key]
+        if removed:
+            logger.info(f"Evicted {len(removed)} cached transcriptions")
+        return removed
+
+    def prune(self, max_bytes: Optional[int] = None, older_than_days: Optional[float] = None) -> List[str]:
+        #Drop least recently used entries until under max_bytes, and anything unused for older_than_days
+        older_than = time.time() - older_than_days * 86400 if older_than_days is not None else None
+        with self._lock:
+            removed = self._evict_locked(max_bytes, older_than)
+            # forget hashes of recordings that no longer exist
+            self._index["sources"] = {
+                path: source for path, source in self._index["sources"].items() if Path(path).exists()
+            }
+            self._save_index()
+        return removed
+
+    def convert_to_store(self) -> int:
+        #Rewrite every indexed or legacy JSON transcription as a .tstore, keeping the index pointing
+        #at it; returns how many
+        converted = 0
+        with self._lock:
+            entries = {entry.get("file", f"{key}.json"): entry for key, entry in self._index["entries"].items()}
+            legacy = self._index["legacy"]
+            for json_path in sorted(self.cache_dir.glob("*.json")):
+                entry = entries.get(json_path.name)
+                if not entry and legacy.get(json_path.stem) != json_path.name:
+                    continue
+                store_path = convert_json_file(json_path)
+                if entry:
+                    entry["file"] = store_path.name
+                    entry["size"] = transcription_size(store_path)
+                else:
+                    legacy[json_path.stem] = store_path.name
+                converted += 1
+            self._save_index()
+        if converted:
+            logger.info(f"Converted {converted} JSON transcriptions to {STORE_SUFFIX}")
+        return converted
+
+    def entries(self) -> Dict[str, Dict]:
+        with self._lock:
+            return dict(self._index["entries"])
+
+    def stats(self) -> Dict[str, float]:
+        entries = self.entries()
+        return {
+            "entries": len(entries),
+            "total_bytes": sum(entry["size"] for entry in entries.values()),
+            "hits": sum(entry.get("hits", 0) for entry in entries.values()),
+            "max_bytes": self.max_bytes or 0,
+        }
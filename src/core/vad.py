@@ -0,0 +1,171 @@
+import time
+import logging
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.utils.logger import metrics
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+# silence inserted between kept regions so Whisper does not run words together
+JOIN_GAP_SECONDS = 0.3
+
+
+@dataclass
+class VadStats:
+    original_seconds: float
+    speech_seconds: float
+    regions: int
+    vad_seconds: float
+
+    @property
+    def skipped_fraction(self) -> float:
+        return 1.0 - self.speech_seconds / self.original_seconds if self.original_seconds else 0.0
+
+    @property
+    def estimated_speedup(self) -> float:
+        # Whisper cost is roughly linear in the audio it decodes
+        return self.original_seconds / self.speech_seconds if self.speech_seconds else 1.0
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), "skipped_fraction": self.skipped_fraction,
+                "estimated_speedup": self.estimated_speedup}
+
+
+def frame_energy_db(audio: np.ndarray, frame_samples: int) -> np.ndarray:
+    #RMS energy per non-overlapping frame in dBFS, computed on a strided view
+    usable = len(audio) - len(audio) % frame_samples
+    frames = audio[:usable].reshape(-1, frame_samples)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    return 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+
+def _runs(mask: np.ndarray) -> np.ndarray:
+    #(start, end) frame index pairs of consecutive True values
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    return edges.reshape(-1, 2)
+
+
+def detect_speech_regions(audio: np.ndarray, sample_rate: int = SAMPLE_RATE, frame_ms: int = 30,
+                          margin_db: float = 12.0, floor_db: float = -50.0,
+                          min_speech_ms: int = 250, min_silence_ms: int = 1500,
+                          padding_ms: int = 300) -> List[Tuple[int, int]]:
+    #Speech regions as (start_sample, end_sample), using an adaptive threshold above the noise floor.
+    #Short pauses inside speech are kept so sentences are never cut mid-thought.
+    frame_samples = int(sample_rate * frame_ms / 1000)
+    if len(audio) < frame_samples:
+        return [(0, len(audio))] if len(audio) else []
+    energy = frame_energy_db(audio, frame_samples)
+    noise_floor = np.percentile(energy, 10)
+    threshold = max(noise_floor + margin_db, floor_db)
+    runs = _runs(energy > threshold)
+    if len(runs) == 0:
+        return []
+
+    # close gaps shorter than min_silence_ms
+    min_silence_frames = max(1, min_silence_ms // frame_ms)
+    gaps = runs[1:, 0] - runs[:-1, 1]
+    keep_break = np.concatenate(([True], gaps >= min_silence_frames))
+    group_ids = np.cumsum(keep_break) - 1
+    starts = runs[keep_break, 0]
+    ends = np.zeros(len(starts), dtype=runs.dtype)
+    np.maximum.at(ends, group_ids, runs[:, 1])
+
+    # drop blips, then pad and convert to samples
+    long_enough = (ends - starts) >= max(1, min_speech_ms // frame_ms)
+    starts, ends = starts[long_enough], ends[long_enough]
+    padding = int(sample_rate * padding_ms / 1000)
+    start_samples = np.maximum(starts * frame_samples - padding, 0)
+    end_samples = np.minimum(ends * frame_samples + padding, len(audio))
+
+    # padding can make neighbours overlap; merge them
+    regions: List[Tuple[int, int]] = []
+    for start, end in zip(start_samples.tolist(), end_samples.tolist()):
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], max(end, regions[-1][1]))
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def trim_to_regions(audio: np.ndarray, regions: List[Tuple[int, int]],
+                    sample_rate: int = SAMPLE_RATE) -> Tuple[np.ndarray, np.ndarray]:
+    #Concatenate speech regions with short gaps; returns the trimmed audio and an (n, 2) array of
+    #(trimmed_start_seconds, original_start_seconds) for mapping timestamps back
+    gap = np.zeros(int(sample_rate * JOIN_GAP_SECONDS), dtype=audio.dtype)
+    pieces = []
+    offsets = []
+    position = 0
+    for i, (start, end) in enumerate(regions):
+        if i:
+            pieces.append(gap)
+            position += len(gap)
+        offsets.append((position / sample_rate, start / sample_rate))
+        pieces.append(audio[start:end])
+        position += end - start
+    trimmed = np.concatenate(pieces) if pieces else audio[:0]
+    return trimmed, np.asarray(offsets, dtype=np.float64).reshape(-1, 2)
+
+
+def to_original_time(times: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    #Map timestamps on the trimmed timeline back onto the original recording
+    index = np.clip(np.searchsorted(offsets[:, 0], times, side='right') - 1, 0, len(offsets) - 1)
+    return offsets[index, 1] + (times - offsets[index, 0])
+
+
+def remap_result(result: Dict, offsets: np.ndarray) -> Dict:
+    #Rewrite segment (and word) start/end in a Whisper result to original-recording time
+    for segment in result.get("segments", []):
+        segment["start"], segment["end"] = (float(t) for t in to_original_time(
+            np.array([segment["start"], segment["end"]]), offsets))
+        for word in segment.get("words", []) or []:
+            word["start"], word["end"] = (float(t) for t in to_original_time(
+                np.array([word["start"], word["end"]]), offsets))
+    return result
+
+
+def transcribe_with_vad(model, recording_path: str, language: str, min_skip_fraction: float = 0.05,
+                        audio: Optional[np.ndarray] = None, **transcribe_kwargs) -> Dict:
+    #Transcribe only the speech in a recording; the result's timestamps refer to the original audio.
+    #Pass audio when the caller has already decoded the recording.
+    if audio is None:
+        import whisper
+
+        with metrics.span("decode"):
+            audio = whisper.load_audio(recording_path)
+    start = time.perf_counter()
+    with metrics.span("vad"):
+        regions = detect_speech_regions(audio)
+    speech_samples = sum(end - start_sample for start_sample, end in regions)
+    stats = VadStats(
+        original_seconds=len(audio) / SAMPLE_RATE,
+        speech_seconds=speech_samples / SAMPLE_RATE,
+        regions=len(regions),
+        vad_seconds=time.perf_counter() - start,
+    )
+
+    metrics.incr("audio_seconds", stats.original_seconds)
+    trimmed_any = bool(regions) and stats.skipped_fraction >= min_skip_fraction
+    if not trimmed_any:
+        # nothing worth trimming (or nothing detected at all): the whole file is decoded, so nothing was saved
+        stats.speech_seconds = stats.original_seconds
+    with metrics.span("whisper", vad=True) as span:
+        if not trimmed_any:
+            result = model.transcribe(audio, language=language, verbose=None, **transcribe_kwargs)
+        else:
+            trimmed, offsets = trim_to_regions(audio, regions)
+            result = remap_result(model.transcribe(trimmed, language=language, verbose=None, **transcribe_kwargs),
+                                  offsets)
+        span.set(audio_seconds=stats.original_seconds, speech_seconds=stats.speech_seconds,
+                 rtf=span.elapsed / stats.original_seconds if stats.original_seconds else None)
+    result["vad"] = stats.to_dict()
+    if trimmed_any:
+        logger.info(f"VAD kept {stats.speech_seconds:.0f}s of {stats.original_seconds:.0f}s "
+                    f"({stats.skipped_fraction:.0%} skipped, ~{stats.estimated_speedup:.1f}x faster decode)")
+    else:
+        logger.info(f"VAD found too little silence to trim; decoded all {stats.original_seconds:.0f}s")
+    return result
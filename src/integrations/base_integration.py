@@ -1 +1,54 @@
 # Base class for integrations
+import importlib
+import logging
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class BaseIntegration:
+    #A destination for finished lecture notes. publish() may only queue work; flush() writes
+    #whatever is queued once per run. Subclasses are registered by import path below, so their
+    #client libraries are imported only when a run actually publishes to them.
+    name = "base"
+
+    def publish(self, notes, recording_name: str) -> Dict[str, str]:
+        #Publish notes for one recording; returns the IDs of what was created or updated.
+        #recording_name identifies the recording: its resolved path, so same-named files do not collide.
+        raise NotImplementedError
+
+    def prepare(self, recording_name: str, main_topic: str) -> None:
+        #Optional head start while the notes are still being written; publish() must work without it
+        return None
+
+    def flush(self) -> int:
+        #Write anything queued by publish(); returns how many items were written
+        return 0
+
+
+# integration name -> "module:factory"; the factory takes the ResourcePool and returns a BaseIntegration
+_REGISTRY: Dict[str, str] = {
+    "google": "src.integrations.publisher:create_google_publisher",
+    # all-day events for assignment due dates, e.g. INTEGRATIONS='["google", "google_calendar"]'
+    "google_calendar": "src.integrations.google_calendar:create_calendar_integration",
+}
+
+
+def register_integration(name: str, target: str) -> None:
+    #Add or replace an integration, e.g. register_integration("notion", "my_plugin.notion:create")
+    if ":" not in target:
+        raise ValueError(f"Integration target must look like 'module:factory', got {target!r}")
+    _REGISTRY[name] = target
+
+
+def available_integrations() -> List[str]:
+    return sorted(_REGISTRY)
+
+
+def load_integration_factory(name: str) -> Callable:
+    #Import the module behind name only now, when the integration is first needed
+    if name not in _REGISTRY:
+        raise KeyError(f"Unknown integration {name!r}; available: {', '.join(available_integrations())}")
+    module_name, factory_name = _REGISTRY[name].split(":")
+    logger.debug(f"Loading integration {name} from {module_name}")
+    return getattr(importlib.import_module(module_name), factory_name)
@@ -0,0 +1,159 @@
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.transport.requests import Request
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.http import BatchHttpRequest
+
+from src.utils.logger import metrics
+
+logger = logging.getLogger(__name__)
+
+# One token covers every enabled integration, so clients no longer overwrite each other's token.json.
+# The notes docs and the assignments tracker are always published; other scopes are added by
+# configure_scopes() only when the integration needing them is turned on.
+SCOPES = [
+    "https://www.googleapis.com/auth/documents",
+    "https://www.googleapis.com/auth/spreadsheets",
+]
+# events on a calendar the user already has
+CALENDAR_EVENTS_SCOPE = "https://www.googleapis.com/auth/calendar.events"
+# a calendar this app creates, and its events; nothing else in the user's calendars
+CALENDAR_APP_SCOPE = "https://www.googleapis.com/auth/calendar.app.created"
+
+CREDS_DIR = Path("data/credentials")
+CREDS_PATH = CREDS_DIR / "credentials.json"
+TOKEN_PATH = CREDS_DIR / "token.json"
+DISCOVERY_DIR = CREDS_DIR / "discovery"
+# retries of 429/5xx responses, with googleapiclient's exponential backoff
+NUM_RETRIES = 3
+
+_lock = threading.RLock()
+_creds = None
+_discovery_docs: Dict[Tuple[str, str], Dict] = {}
+_local = threading.local()
+# set by use_backend() to send every API call to a local server (offline benchmarks)
+_api_endpoint: Optional[str] = None
+# bumped by use_backend() so every thread rebuilds its services
+_backend_generation = 0
+# SCOPES plus what the enabled integrations need, set by configure_scopes()
+_scopes: List[str] = list(SCOPES)
+
+
+def scopes_for(integration_names: Sequence[str], calendar_id: Optional[str] = None) -> List[str]:
+    #OAuth scopes for a run publishing to integration_names
+    scopes = list(SCOPES)
+    if "google_calendar" in integration_names:
+        # a named calendar only needs its events; otherwise the integration creates its own calendar
+        scopes.append(CALENDAR_EVENTS_SCOPE if calendar_id else CALENDAR_APP_SCOPE)
+    return scopes
+
+
+def configure_scopes(scopes: Sequence[str]) -> None:
+    #Scopes the next get_credentials() must cover; credentials already loaded without them are dropped
+    global _creds, _scopes, _backend_generation
+    with _lock:
+        _scopes = list(scopes)
+        if isinstance(_creds, Credentials) and not _creds.has_scopes(_scopes):
+            _creds = None
+            _backend_generation += 1
+
+
+def get_credentials() -> Credentials:
+    #Process-wide credentials for the configured scopes, refreshed or re-authorized only when needed
+    global _creds
+    with _lock:
+        if _creds and _creds.valid:
+            return _creds
+        creds = _creds
+        if creds is None and TOKEN_PATH.exists():
+            # loaded with the scopes it was granted, so a token missing one is re-authorized
+            creds = Credentials.from_authorized_user_file(str(TOKEN_PATH))
+            # a token written by an older single-scope client cannot serve every integration
+            if not creds.has_scopes(_scopes):
+                creds = None
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            else:
+                flow = InstalledAppFlow.from_client_secrets_file(str(CREDS_PATH), _scopes)
+                creds = flow.run_local_server(port=0)
+            CREDS_DIR.mkdir(parents=True, exist_ok=True)
+            with open(TOKEN_PATH, "w") as token:
+                token.write(creds.to_json())
+        _creds = creds
+        return _creds
+
+
+def get_discovery_document(name: str, version: str) -> Dict:
+    #Discovery document from memory, then data/credentials/discovery, then the copy bundled with
+    #googleapiclient, fetching over the network only if none of those has it
+    key = (name, version)
+    with _lock:
+        if key in _discovery_docs:
+            return _discovery_docs[key]
+        path = DISCOVERY_DIR / f"{name}.{version}.json"
+        if path.exists():
+            document = path.read_text(encoding="utf-8")
+        else:
+            document = discovery_cache.get_static_doc(name, version)
+            if document is None:
+                logger.info(f"Fetching discovery document for {name} {version}")
+                service = build(name, version, credentials=get_credentials(), static_discovery=False)
+                document = json.dumps(service._rootDesc)
+            DISCOVERY_DIR.mkdir(parents=True, exist_ok=True)
+            path.write_text(document, encoding="utf-8")
+        _discovery_docs[key] = json.loads(document)
+        return _discovery_docs[key]
+
+
+def get_service(name: str, version: str):
+    #Service object for the calling thread; httplib2 connections are not thread-safe, so each
+    #publish worker gets its own, built locally from the cached discovery document
+    services = getattr(_local, "services", None)
+    if services is None or getattr(_local, "generation", None) != _backend_generation:
+        services = _local.services = {}
+        _local.generation = _backend_generation
+    key = (name, version)
+    if key not in services:
+        client_options = {"api_endpoint": _api_endpoint} if _api_endpoint else None
+        services[key] = build_from_document(get_discovery_document(name, version), credentials=get_credentials(),
+                                            client_options=client_options)
+    return services[key]
+
+
+def use_backend(api_endpoint: Optional[str], credentials=None) -> None:
+    #Send every Google API call to api_endpoint (e.g. a FakeGoogleServer) with the given credentials,
+    #or restore the real services with None. Services built before the switch are dropped.
+    global _api_endpoint, _creds, _backend_generation
+    with _lock:
+        _api_endpoint = api_endpoint
+        _creds = credentials
+        _backend_generation += 1
+
+
+def execute(request, api: str, method: str):
+    #Run a googleapiclient request inside a metrics span, so every Docs/Sheets round trip is timed
+    with metrics.span("google", api=api, method=method):
+        return request.execute(num_retries=NUM_RETRIES)
+
+
+def new_batch(name: str, version: str, callback=None) -> BatchHttpRequest:
+    #Batch request for a service. googleapiclient sends batches to the discovery document's rootUrl
+    #even when the service was built for another endpoint, so use_backend() is applied here too.
+    if not _api_endpoint:
+        return get_service(name, version).new_batch_http_request(callback=callback)
+    batch_path = get_discovery_document(name, version).get("batchPath", "batch")
+    return BatchHttpRequest(callback=callback, batch_uri=_api_endpoint.rstrip("/") + "/" + batch_path)
+
+
+def execute_batch(batch: BatchHttpRequest, api: str, method: str) -> None:
+    #execute() for a batch: one timed HTTP round trip, with each request's result sent to the batch callback
+    with metrics.span("google", api=api, method=method):
+        batch.execute()
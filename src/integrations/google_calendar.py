@@ -1 +1,282 @@
 # Google Calendar API
+import os
+import json
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+from src.models.lecture_models import Assignment
+from src.integrations.base_integration import BaseIntegration
+from src.integrations.google_auth import execute, execute_batch, get_credentials, get_service, new_batch
+from src.integrations.publisher import assignment_key
+from src.utils.date_utils import all_day_range, parse_due_date
+from src.utils.file_utils import hash_text
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_TITLE = "Lecture Assignments"
+# the Calendar API takes at most this many requests in one batch
+BATCH_LIMIT = 50
+# private extended properties that tie an event back to its assignment
+KEY_PROPERTY = "lectureAssignmentKey"
+HASH_PROPERTY = "lectureContentHash"
+
+
+def event_key(title: str, due_date: str) -> str:
+    # the tracker's key, so a generic title ("Quiz") due on two dates is two events, as it is two rows
+    return assignment_key(title, due_date)
+
+
+def _title_of(key: str) -> str:
+    # keys written before due dates were part of them are the title alone
+    return key.rsplit("|", 1)[0]
+
+
+def event_id_for(key: str) -> str:
+    # deterministic (and valid base32hex), so an insert retried after a lost response cannot duplicate
+    return "la" + hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def build_event(assignment: Assignment) -> Optional[Dict]:
+    #All-day event body for an assignment, or None when its due date is not a calendar date.
+    #Nothing about the lecture goes in, so an assignment repeated in later lectures is not rewritten.
+    due = parse_due_date(assignment.due_date)
+    if due is None:
+        return None
+    start, end = all_day_range(due)
+    return {
+        "summary": assignment.title,
+        "description": assignment.description or "",
+        "start": {"date": start},
+        "end": {"date": end},
+        "transparency": "transparent",
+        "status": "confirmed",
+    }
+
+
+class GoogleCalendarClient:
+    def __init__(self):
+        self.creds = get_credentials()
+
+    @property
+    def service(self):
+        # built once per thread from the cached discovery document
+        return get_service("calendar", "v3")
+
+    def create_calendar(self, title: str) -> str:
+        calendar = execute(self.service.calendars().insert(body={"summary": title}), "calendar", "calendars.insert")
+        return calendar["id"]
+
+    def list_changes(self, calendar_id: str, sync_token: Optional[str] = None) -> Tuple[List[Dict], str]:
+        #Events changed since sync_token (deleted ones included), or every event without one, plus
+        #the token for next time. An expired token raises HttpError 410; start over without one.
+        events: List[Dict] = []
+        page_token = None
+        while True:
+            response = execute(self.service.events().list(
+                calendarId=calendar_id, syncToken=sync_token, pageToken=page_token, maxResults=2500,
+            ), "calendar", "events.list")
+            events.extend(response.get("items", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return events, response["nextSyncToken"]
+
+    def write_events(self, calendar_id: str, writes: List[Tuple[str, str, Dict]]) -> List[Optional[HttpError]]:
+        #Insert or update each ("insert" or "update", event_id, body) in batch requests of BATCH_LIMIT;
+        #returns each write's error, None for the ones that succeeded
+        errors: List[Optional[HttpError]] = [None] * len(writes)
+
+        def record(request_id, response, exception):
+            errors[int(request_id)] = exception
+
+        for start in range(0, len(writes), BATCH_LIMIT):
+            batch = new_batch("calendar", "v3", callback=record)
+            for index in range(start, min(start + BATCH_LIMIT, len(writes))):
+                action, event_id, body = writes[index]
+                if action == "insert":
+                    request = self.service.events().insert(calendarId=calendar_id, body={**body, "id": event_id})
+                else:
+                    request = self.service.events().update(calendarId=calendar_id, eventId=event_id, body=body)
+                batch.add(request, request_id=str(index))
+            execute_batch(batch, "calendar", "batch")
+        return errors
+
+
+class GoogleCalendarIntegration(BaseIntegration):
+    #Puts assignment due dates on a dedicated Google Calendar as all-day events. What was written is
+    #remembered per assignment (event ID and content hash) in a JSON state file, so publish() only
+    #queues new or changed assignments and flush() sends them in one batch request, after an
+    #incremental sync that picks up events deleted or lost since the last run. A run with nothing
+    #new makes no API calls at all. Events are keyed like tracker rows, by title and due date; a
+    #recording whose assignment's due date was corrected moves that event instead of adding another.
+    name = "google_calendar"
+
+    def __init__(self, calendar_client: GoogleCalendarClient, state_path: Path, calendar_id: Optional[str] = None):
+        self.calendar_client = calendar_client
+        self.state_path = Path(state_path)
+        self._lock = threading.Lock()
+        self.state = self._load_state()
+        if calendar_id and calendar_id != self.state["calendar_id"]:
+            self.state["calendar_id"] = calendar_id
+            self.state["sync_token"] = None
+            self.state["events"] = {}
+        # event key -> (body, content hash, key of the event it moves or None), written on flush()
+        self._pending: Dict[str, Tuple[Dict, str, Optional[str]]] = {}
+        # event key -> recording that queued it, kept in the state so a corrected due date moves its event
+        self._recordings: Dict[str, Optional[str]] = {}
+
+    def _load_state(self) -> Dict:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        state.setdefault("calendar_id", None)
+        state.setdefault("sync_token", None)
+        # event key -> {"event_id", "content_hash", "deleted", "recording"}
+        state.setdefault("events", {})
+        return state
+
+    def _save_state(self) -> None:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _moved_from(self, key: str, recording_name: Optional[str], current_keys: set) -> Optional[str]:
+        #The event a new key replaces: same title, written for the same recording (or before keys had
+        #due dates) and no longer among that recording's assignments, i.e. its due date was corrected
+        title = _title_of(key)
+        for old_key, known in self.state["events"].items():
+            if old_key in current_keys or known["deleted"] or _title_of(old_key) != title:
+                continue
+            if "|" not in old_key or (recording_name and known.get("recording") == recording_name):
+                return old_key
+        return None
+
+    def queue_assignments(self, assignments: List[Assignment], recording_name: Optional[str] = None) -> int:
+        #Stage events whose content differs from what the calendar was last given
+        queued = 0
+        with self._lock:
+            current_keys = {event_key(assignment.title, assignment.due_date) for assignment in assignments}
+            for assignment in assignments:
+                body = build_event(assignment)
+                if body is None:
+                    logger.debug(f"No calendar date in {assignment.due_date!r} for {assignment.title}")
+                    continue
+                key = event_key(assignment.title, assignment.due_date)
+                content_hash = hash_text(json.dumps(body, sort_keys=True))
+                body["extendedProperties"] = {"private": {KEY_PROPERTY: key, HASH_PROPERTY: content_hash}}
+                known = self.state["events"].get(key)
+                if known and known["content_hash"] == content_hash:
+                    # unchanged, or deleted in Calendar on purpose: either way there is nothing to send
+                    continue
+                moved_from = None if known else self._moved_from(key, recording_name, current_keys)
+                self._pending[key] = (body, content_hash, moved_from)
+                self._recordings[key] = recording_name
+                queued += 1
+        return queued
+
+    def publish(self, notes, recording_name: str) -> Dict[str, str]:
+        if notes.assignments:
+            queued = self.queue_assignments(notes.assignments, recording_name)
+            logger.info(f"{queued} new or changed of {len(notes.assignments)} assignments queued for the calendar")
+        return {"calendar_id": self.state["calendar_id"] or ""}
+
+    def _ensure_calendar(self) -> str:
+        if not self.state["calendar_id"]:
+            self.state["calendar_id"] = self.calendar_client.create_calendar(CALENDAR_TITLE)
+            self.state["sync_token"] = None
+            self._save_state()
+            logger.info(f"Created assignments calendar {self.state['calendar_id']}")
+        return self.state["calendar_id"]
+
+    def _sync(self, calendar_id: str) -> None:
+        #Bring the event map up to date with the calendar: events deleted there stay deleted until the
+        #assignment changes, and events written by a run that never saved its state are adopted
+        try:
+            changes, sync_token = self.calendar_client.list_changes(calendar_id, self.state["sync_token"])
+        except HttpError as e:
+            if e.resp.status != 410:
+                raise
+            logger.info("Calendar sync token expired; listing every event again")
+            changes, sync_token = self.calendar_client.list_changes(calendar_id)
+        keys_by_id = {known["event_id"]: key for key, known in self.state["events"].items()}
+        for event in changes:
+            properties = event.get("extendedProperties", {}).get("private", {})
+            # deleted events come back as little more than an ID
+            key = properties.get(KEY_PROPERTY) or keys_by_id.get(event["id"])
+            if not key:
+                continue
+            if event.get("status") == "cancelled":
+                known = self.state["events"].get(key)
+                if known:
+                    known["deleted"] = True
+            else:
+                known = self.state["events"].get(key, {})
+                self.state["events"][key] = {"event_id": event["id"], "content_hash": properties.get(HASH_PROPERTY),
+                                             "deleted": False, "recording": known.get("recording")}
+        self.state["sync_token"] = sync_token
+
+    def flush(self) -> int:
+        #Sync, then write every staged event that still differs from the calendar in one batch
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            recordings, self._recordings = self._recordings, {}
+            if not pending:
+                return 0
+            calendar_id = self._ensure_calendar()
+            self._sync(calendar_id)
+            keys, writes, moves = [], [], []
+            for key, (body, content_hash, moved_from) in pending.items():
+                known = self.state["events"].get(key)
+                if known and known["content_hash"] == content_hash and not known["deleted"]:
+                    continue
+                old = self.state["events"].get(moved_from) if moved_from and not known else None
+                if old and old["deleted"]:
+                    old = None
+                if old:
+                    # a corrected due date: the existing event is moved rather than a second one added
+                    known = old
+                # an update also restores an event deleted in Calendar
+                writes.append(("update" if known else "insert", known["event_id"] if known else event_id_for(key), body))
+                keys.append(key)
+                moves.append(moved_from if old else None)
+            written = 0
+            try:
+                errors = self.calendar_client.write_events(calendar_id, writes) if writes else []
+            finally:
+                self._save_state()
+            for key, moved_from, (action, event_id, body), error in zip(keys, moves, writes, errors):
+                # the recording that first had the assignment keeps it
+                recording = self.state["events"].get(key, {}).get("recording") or recordings.get(key)
+                if error is None:
+                    if moved_from:
+                        self.state["events"].pop(moved_from, None)
+                    self.state["events"][key] = {"event_id": event_id, "content_hash": pending[key][1],
+                                                 "deleted": False, "recording": recording}
+                    written += 1
+                elif action == "insert" and error.resp.status == 409:
+                    # the ID is taken by an event the sync has not shown us; the next run updates it instead
+                    self.state["events"][key] = {"event_id": event_id, "content_hash": None, "deleted": False,
+                                                 "recording": recording}
+                else:
+                    logger.error(f"Writing the calendar event for {body['summary']} failed: {error}")
+            self._save_state()
+            failed = len(writes) - written
+            logger.info(f"Wrote {written} assignment events to calendar {calendar_id}"
+                        + (f" ({failed} failed)" if failed else ""))
+            if failed:
+                raise RuntimeError(f"{failed} calendar events could not be written")
+            return written
+
+
+def create_calendar_integration(pool) -> GoogleCalendarIntegration:
+    #Registry factory: the Calendar client comes from the pool so it is shared and timed
+    return GoogleCalendarIntegration(pool.get_calendar_client(), pool.data_dir / "calendar_state.json",
+                                     calendar_id=pool.calendar_id)
@@ -1,34 +1,16 @@
-import os  
-from pathlib import Path
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-
-
-SCOPES = ["https://www.googleapis.com/auth/documents"]
-
-CREDS_DIR = Path("data/credentials")
-CREDS_PATH = CREDS_DIR / "credentials.json"
-TOKEN_PATH = CREDS_DIR / "token.json"
+from src.integrations.google_auth import execute, get_credentials, get_service
 
 class GoogleDocsClient:
     def __init__(self):
-        self.creds = None
-        if TOKEN_PATH.exists():
-            self.creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                self.creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(str(CREDS_PATH), SCOPES)
-                self.creds = flow.run_local_server(port=0)
-            with open(TOKEN_PATH, "w") as token:
-                token.write(self.creds.to_json())
-        self.service = build("docs", "v1", credentials=self.creds)
+        self.creds = get_credentials()
+
+    @property
+    def service(self):
+        # built once per thread from the cached discovery document
+        return get_service("docs", "v1")
 
     def get_document(self, document_id):
-        return self.service.documents().get(documentId=document_id).execute()
+        return execute(self.service.documents().get(documentId=document_id), "docs", "documents.get")
 
     def extract_text(self, document):
         text = ""
@@ -41,7 +23,7 @@ class GoogleDocsClient:
     
     def create_doc(self, title: str) -> str: 
         body = {"title": title}
-        doc = self.service.documents().create(body=body).execute()
+        doc = execute(self.service.documents().create(body=body), "docs", "documents.create")
         return doc["documentId"]
 
     def write_text(self, document_id: str, text: str) -> None:
@@ -53,4 +35,15 @@ class GoogleDocsClient:
                 }
             }
         ]
-        self.service.documents().batchUpdate(documentId=document_id, body={"requests": requests}).execute()
\ No newline at end of file
+        self.batch_update(document_id, requests)
+
+    def batch_update(self, document_id: str, requests: list) -> dict:
+        return execute(self.service.documents().batchUpdate(documentId=document_id, body={"requests": requests}),
+                       "docs", "documents.batchUpdate")
+
+    def get_end_index(self, document_id: str) -> int:
+        document = execute(self.service.documents().get(
+            documentId=document_id, fields="body/content/endIndex"
+        ), "docs", "documents.get")
+        content = document.get("body", {}).get("content", [])
+        return content[-1]["endIndex"] if content else 1
@@ -1,51 +1,61 @@
-from pathlib import Path
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-
-
-from src.prompts.prompts import messages
-from src.models.lecture_models import SubTopic, Assignment, DocNotes
-
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
-
-CREDS_DIR = Path("data/credentials")
-CREDS_PATH = CREDS_DIR / "credentials.json"
-TOKEN_PATH = CREDS_DIR / "token.json"
-
-CREDS_DIR.mkdir(parents=True, exist_ok=True)
+from src.integrations.google_auth import execute, get_credentials, get_service
 
 class GoogleSheetsClient:
     def __init__(self):
-        self.creds = None
-        if TOKEN_PATH.exists():
-            self.creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                self.creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(str(CREDS_PATH), SCOPES)
-                self.creds = flow.run_local_server(port=0)
-            CREDS_DIR.mkdir(parents=True, exist_ok=True)
-            with open(TOKEN_PATH, "w") as token:
-                token.write(self.creds.to_json())
-        self.service = build("sheets", "v4", credentials=self.creds)
-    
-    def write_data(self, spreadsheet_id: str, range_name: str, values: list) -> None:
+        self.creds = get_credentials()
+
+    @property
+    def service(self):
+        # built once per thread from the cached discovery document
+        return get_service("sheets", "v4")
+
+    def write_data(self, spreadsheet_id: str, range_name: str, values: list) -> dict:
         request = self.service.spreadsheets().values().append(
-            spreadsheet_id=spreadsheet_id,
+            spreadsheetId=spreadsheet_id,
             range=range_name,
             valueInputOption="USER_ENTERED",
             insertDataOption="INSERT_ROWS",
             body = {'values': values}
         )
-        response = request.execute()
+        response = execute(request, "sheets", "values.append")
         print(f"Data written to {spreadsheet_id} at range {range_name}")
         return response
-    def create_spreadsheet(self, title: str) -> str:
+
+    def read_values(self, spreadsheet_id: str, range_name: str) -> list:
+        response = execute(self.service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=range_name,
+        ), "sheets", "values.get")
+        return response.get('values', [])
+
+    def sheet_titles(self, spreadsheet_id: str) -> list:
+        response = execute(self.service.spreadsheets().get(
+            spreadsheetId=spreadsheet_id,
+            fields='sheets.properties.title',
+        ), "sheets", "spreadsheets.get")
+        return [sheet['properties']['title'] for sheet in response.get('sheets', [])]
+
+    def add_sheet(self, spreadsheet_id: str, sheet_title: str, header: list = None) -> None:
+        execute(self.service.spreadsheets().batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={'requests': [{'addSheet': {'properties': {'title': sheet_title}}}]},
+        ), "sheets", "spreadsheets.batchUpdate")
+        if header:
+            self.write_data(spreadsheet_id, f"{sheet_title}!A1", [header])
+
+    def create_spreadsheet(self, title: str, sheet_title: str = None, header: list = None) -> str:
         body = {
             'properties': {'title': title}
         }
-        spreadsheet = self.service.spreadsheets().create(body=body).execute()
-        return spreadsheet['spreadsheetId']
\ No newline at end of file
+        # name the first sheet and write its header row in the same call
+        if sheet_title or header:
+            sheet = {'properties': {'title': sheet_title or 'Sheet1'}}
+            if header:
+                sheet['data'] = [{
+                    'startRow': 0,
+                    'startColumn': 0,
+                    'rowData': [{'values': [{'userEnteredValue': {'stringValue': cell}} for cell in header]}],
+                }]
+            body['sheets'] = [sheet]
+        spreadsheet = execute(self.service.spreadsheets().create(body=body), "sheets", "spreadsheets.create")
+        return spreadsheet['spreadsheetId']
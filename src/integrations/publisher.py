@@ -0,0 +1,238 @@
+import os
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.models.lecture_models import Assignment, EnhancedDocNotes
+from src.integrations.base_integration import BaseIntegration
+from src.integrations.google_docs import GoogleDocsClient
+from src.integrations.google_sheets import GoogleSheetsClient
+from src.utils.file_utils import hash_text
+
+logger = logging.getLogger(__name__)
+
+TRACKER_TITLE = "Assignments_Tracker"
+TRACKER_SHEET = "Assignments"
+TRACKER_HEADER = ["Title", "Description", "Due Date"]
+# rows per values.append call
+APPEND_BATCH_SIZE = 500
+
+
+def assignment_key(title: str, due_date: str) -> str:
+    return f"{' '.join(title.lower().split())}|{due_date.strip()}"
+
+
+def utf16_len(text: str) -> int:
+    # Docs indexes count UTF-16 code units, so emoji take two
+    return len(text.encode("utf-16-le")) // 2
+
+
+def build_doc_paragraphs(notes: EnhancedDocNotes) -> List[Tuple[str, str]]:
+    #(text, style) paragraphs for a lecture doc; style is a Docs named style or "BULLET"
+    paragraphs = [(f"{notes.main_topic} - Lecture Notes", "TITLE")]
+    if notes.sub_topics:
+        paragraphs.append((f"Subtopics ({len(notes.sub_topics)})", "HEADING_1"))
+        for i, subtopic in enumerate(notes.sub_topics, 1):
+            paragraphs.append((f"{i}. {subtopic.title}", "HEADING_2"))
+            paragraphs.append((subtopic.description, "NORMAL_TEXT"))
+            for label, items in (("Definitions", subtopic.definitions),
+                                 ("Examples", subtopic.examples),
+                                 ("Practice Questions", subtopic.practice_questions)):
+                if items:
+                    paragraphs.append((label, "HEADING_3"))
+                    paragraphs.extend((item, "BULLET") for item in items)
+    if notes.assignments:
+        paragraphs.append((f"Assignments ({len(notes.assignments)})", "HEADING_1"))
+        for assignment in notes.assignments:
+            details = f" — {assignment.description}" if assignment.description else ""
+            paragraphs.append((f"{assignment.title} (due {assignment.due_date}){details}", "BULLET"))
+    if notes.key_takeaways:
+        paragraphs.append(("Key Takeaways", "HEADING_1"))
+        paragraphs.extend((takeaway, "BULLET") for takeaway in notes.key_takeaways)
+    return paragraphs
+
+
+def build_doc_requests(notes: EnhancedDocNotes, start_index: int = 1) -> List[Dict]:
+    #One insertText for the whole body followed by the paragraph styling, for a single batchUpdate
+    paragraphs = build_doc_paragraphs(notes)
+    text = "".join(f"{paragraph}\n" for paragraph, _ in paragraphs)
+    requests: List[Dict] = [{"insertText": {"location": {"index": start_index}, "text": text}}]
+    index = start_index
+    for paragraph, style in paragraphs:
+        end = index + utf16_len(paragraph) + 1
+        text_range = {"startIndex": index, "endIndex": end}
+        if style == "BULLET":
+            requests.append({"createParagraphBullets": {"range": text_range,
+                                                        "bulletPreset": "BULLET_DISC_CIRCLE_SQUARE"}})
+        else:
+            requests.append({"updateParagraphStyle": {"range": text_range,
+                                                      "paragraphStyle": {"namedStyleType": style},
+                                                      "fields": "namedStyleType"}})
+        index = end
+    return requests
+
+
+class GooglePublisher(BaseIntegration):
+    #Publishes lecture docs and assignment rows idempotently: one tracker spreadsheet for every run,
+    #assignment rows collected and appended in bulk, and docs rewritten only when their content changes.
+    #What has been published is remembered in a JSON state file.
+    name = "google"
+
+    def __init__(self, docs_client: GoogleDocsClient, sheets_client: GoogleSheetsClient,
+                 state_path: Path, tracker_id: Optional[str] = None):
+        self.docs_client = docs_client
+        self.sheets_client = sheets_client
+        self.state_path = Path(state_path)
+        self._lock = threading.Lock()
+        self.state = self._load_state()
+        if tracker_id and tracker_id != self.state["tracker_id"]:
+            self.state["tracker_id"] = tracker_id
+            self.state["assignment_keys"] = None
+        known = self.state["assignment_keys"]
+        self._known_keys: Optional[set] = set(known) if known is not None else None
+        self._pending_rows: List[List[str]] = []
+
+    def _load_state(self) -> Dict:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        state.setdefault("tracker_id", None)
+        state.setdefault("docs", {})
+        # keys of rows known to be in the tracker, so reruns need not read the sheet
+        state.setdefault("assignment_keys", None)
+        return state
+
+    def _save_state(self) -> None:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _doc_locked(self, doc_key: str) -> Optional[Dict]:
+        #The doc published for doc_key. Docs used to be keyed by recording stem, which same-named
+        #recordings in different folders shared; the first recording keyed by path takes such a doc over.
+        docs = self.state["docs"]
+        if doc_key not in docs and Path(doc_key).is_absolute():
+            stem = Path(doc_key).stem
+            if stem in docs:
+                docs[doc_key] = docs.pop(stem)
+                self._save_state()
+        return docs.get(doc_key)
+
+    def publish_doc(self, notes: EnhancedDocNotes, doc_key: str) -> str:
+        #Create or refresh the doc for doc_key; unchanged notes cost no API calls
+        content_hash = hash_text(notes.model_dump_json())
+        with self._lock:
+            existing = self._doc_locked(doc_key)
+        if existing and existing["content_hash"] == content_hash:
+            logger.info(f"Doc for {doc_key} is up to date: {existing['doc_id']}")
+            return existing["doc_id"]
+
+        if existing:
+            doc_id = existing["doc_id"]
+            logger.info(f"Rewriting doc {doc_id} for {doc_key}")
+            # a doc made by prepare() is still empty
+            end_index = self.docs_client.get_end_index(doc_id) if existing["content_hash"] else 1
+            requests = build_doc_requests(notes)
+            if end_index > 2:
+                requests.insert(0, {"deleteContentRange": {"range": {"startIndex": 1, "endIndex": end_index - 1}}})
+        else:
+            logger.info(f"Creating doc with title {notes.main_topic} - Lecture Notes")
+            doc_id = self.docs_client.create_doc(f"{notes.main_topic} - Lecture Notes")
+            requests = build_doc_requests(notes)
+        self.docs_client.batch_update(doc_id, requests)
+        logger.info(f"Notes written to Google Doc {doc_id}")
+
+        with self._lock:
+            self.state["docs"][doc_key] = {"doc_id": doc_id, "content_hash": content_hash}
+            self._save_state()
+        return doc_id
+
+    def prepare(self, recording_name: str, main_topic: str) -> None:
+        #Create the recording's doc as soon as its title is known, so publish() only writes the body
+        with self._lock:
+            if self._doc_locked(recording_name):
+                return
+        doc_id = self.docs_client.create_doc(f"{main_topic} - Lecture Notes")
+        logger.info(f"Created doc {doc_id} for {recording_name} ahead of its notes")
+        with self._lock:
+            self.state["docs"].setdefault(recording_name, {"doc_id": doc_id, "content_hash": None})
+            self._save_state()
+
+    def publish(self, notes: EnhancedDocNotes, recording_name: str) -> Dict[str, str]:
+        #Write the doc and queue the recording's assignments for the next flush()
+        doc_id = self.publish_doc(notes, recording_name)
+        if notes.assignments:
+            queued = self.queue_assignments(notes.assignments)
+            logger.info(f"{queued} new of {len(notes.assignments)} assignments queued for the tracker")
+        return {"doc_id": doc_id, "tracker_id": self.state["tracker_id"]}
+
+    def _ensure_tracker(self) -> str:
+        #Find (from state) or create the single tracker, and load the keys of rows it already holds
+        if not self.state["tracker_id"]:
+            self.state["tracker_id"] = self.sheets_client.create_spreadsheet(
+                TRACKER_TITLE, sheet_title=TRACKER_SHEET, header=TRACKER_HEADER)
+            self._known_keys = set()
+            self.state["assignment_keys"] = []
+            self._save_state()
+            logger.info(f"Created assignments tracker {self.state['tracker_id']}")
+        if self._known_keys is None:
+            # a configured tracker can be any spreadsheet, which need not have the sheet yet
+            if TRACKER_SHEET not in self.sheets_client.sheet_titles(self.state["tracker_id"]):
+                self.sheets_client.add_sheet(self.state["tracker_id"], TRACKER_SHEET, header=TRACKER_HEADER)
+                logger.info(f"Added the {TRACKER_SHEET} sheet to tracker {self.state['tracker_id']}")
+            rows = self.sheets_client.read_values(self.state["tracker_id"], f"{TRACKER_SHEET}!A:C")
+            self._known_keys = {assignment_key(row[0], row[2]) for row in rows[1:] if len(row) >= 3}
+            self.state["assignment_keys"] = sorted(self._known_keys)
+            self._save_state()
+        return self.state["tracker_id"]
+
+    def queue_assignments(self, assignments: List[Assignment]) -> int:
+        #Stage rows not yet in the tracker; they are written on flush()
+        if not assignments:
+            return 0
+        with self._lock:
+            self._ensure_tracker()
+            queued = 0
+            for assignment in assignments:
+                key = assignment_key(assignment.title, assignment.due_date)
+                if key in self._known_keys:
+                    continue
+                self._known_keys.add(key)
+                self._pending_rows.append([assignment.title, assignment.description or "", assignment.due_date])
+                queued += 1
+            return queued
+
+    def flush(self) -> int:
+        #Append every staged row in as few values.append calls as possible
+        with self._lock:
+            rows, self._pending_rows = self._pending_rows, []
+            if not rows:
+                return 0
+            tracker_id = self._ensure_tracker()
+            try:
+                for start in range(0, len(rows), APPEND_BATCH_SIZE):
+                    self.sheets_client.write_data(tracker_id, f"{TRACKER_SHEET}!A:C",
+                                                  rows[start:start + APPEND_BATCH_SIZE])
+            except Exception:
+                # re-read the sheet next time so unwritten rows are retried rather than skipped
+                self._known_keys = None
+                self.state["assignment_keys"] = None
+                self._save_state()
+                raise
+            self.state["assignment_keys"] = sorted(
+                set(self.state["assignment_keys"] or []) | {assignment_key(row[0], row[2]) for row in rows})
+            self._save_state()
+            logger.info(f"Wrote {len(rows)} assignments to tracker {tracker_id}")
+            return len(rows)
+
+
+def create_google_publisher(pool) -> GooglePublisher:
+    #Registry factory: the Docs and Sheets clients come from the pool so they are shared and timed
+    return GooglePublisher(pool.get_docs_client(), pool.get_sheets_client(),
+                           pool.data_dir / "publish_state.json", tracker_id=pool.tracker_id)
@@ -33,6 +33,10 @@ class EnhancedResult(BaseModel):
     key_takeaways: Optional[List[str]] = Field(
         None, description="Optional key takeaways or important points from the lecture, more studying focused")
 
+class KeyTakeaways(BaseModel):
+    key_takeaways: List[str] = Field(
+        ..., description="Key takeaways or important points from the lecture, more studying focused")
+
 class EnhancedDocNotes(BaseModel):
     main_topic: str = Field(..., description="The overall topic of the entire lecture")
     assignments: List[Assignment] = Field(
@@ -33,4 +33,22 @@ messages_for_enhanced_notes = [{
                     '''
 
                 
-                }]
\ No newline at end of file
+                }]
+# Fan-out enhancement: one request per subtopic, plus one for the lecture's key takeaways
+messages_for_subtopic_enhancement = [{
+                    'role': 'system',
+                    'content': '''You are a helpful assistant that expands one subtopic of a lecture's notes into detailed study notes that prepare a high honors student for their next project or exam.
+
+                    You are given the lecture's main topic, the titles of the subtopics that come before it for context, and the one subtopic to expand.
+                    For that subtopic only, write:
+                    1. A detailed explanation that goes into depth, without repeating the earlier subtopics
+                    2. Examples or supporting details
+                    3. Practice questions for self-assessment
+                    4. Key definitions
+
+                    Keep the subtopic's title.'''
+                }]
+messages_for_key_takeaways = [{
+                    'role': 'system',
+                    'content': '''You are a helpful assistant that reads a lecture's notes and lists the key takeaways a high honors student needs for their next project or exam, including niche but important points.'''
+                }]
@@ -0,0 +1,371 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import resource
+import tempfile
+import subprocess
+import contextlib
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.testing.synthetic_audio import synthesize_speech, write_wav, write_wav_blocks
+from src.testing.fake_whisper import FakeWhisperModel
+from src.testing.fake_openai import FakeOpenAIServer
+from src.testing.fake_google import FakeGoogleServer
+from src.utils.logger import metrics
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = Path(__file__).resolve().parents[2]
+BENCHMARK_VERSION = 1
+PERCENTILES = (50, 90, 99)
+# latency keys below this many seconds at p50 are too noisy to flag
+NOISE_FLOOR_SECONDS = 0.005
+# `main.py --help` should stay under this; `bench startup` fails above it
+STARTUP_BUDGET_SECONDS = 0.2
+# `bench memory` runs each transcription in a fresh interpreter, so its peak RSS is that transcription's alone
+_MEMORY_CHILD = ("import sys, json; from src.testing.benchmark import transcription_peak_rss; "
+                 "print(json.dumps(transcription_peak_rss(sys.argv[1], sys.argv[2] == 'stream', sys.argv[3] == 'vad')))")
+
+
+@dataclass
+class BenchmarkConfig:
+    name: str = "default"
+    recordings: int = 4
+    # recording lengths, cycled over the recordings
+    minutes: List[float] = field(default_factory=lambda: [5.0])
+    # "sequential", "pipeline" or "batch", as in main.process_directory
+    mode: str = "sequential"
+    whisper_rtf: float = 0.05
+    vad: bool = True
+    stream_decode: bool = False
+    # tiered transcription: the larger model's name and cost, and how often the fast one is unsure
+    refine_whisper_model: Optional[str] = None
+    refine_rtf: float = 0.25
+    low_confidence_rate: float = 0.0
+    openai_latency: float = 0.2
+    openai_error_rate: float = 0.0
+    # decode time per output token, so long single responses cost what they do against the real API
+    openai_seconds_per_token: float = 0.0
+    # items per list and words per string in fake LLM outputs; 1 and 1 give the smallest valid notes
+    notes_items: int = 1
+    notes_words: int = 1
+    enhance_fan_out: bool = False
+    google_latency: float = 0.05
+    google_error_rate: float = 0.0
+    llm_workers: int = 4
+    publish_workers: int = 2
+    # run everything once first, then measure the cached rerun
+    warm: bool = False
+    # the last `duplicates` recordings are re-encoded copies (quieter, with added noise) of the first ones
+    duplicates: int = 0
+    dedup: bool = True
+    seed: int = 0
+
+
+def source_recording(i: int, config: BenchmarkConfig) -> int:
+    #Index of the original lecture recording i is, or a copy of
+    originals = max(1, config.recordings - config.duplicates)
+    return i % originals
+
+
+def generate_recordings(directory: Path, config: BenchmarkConfig) -> List[Path]:
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(config.recordings):
+        source = source_recording(i, config)
+        minutes = config.minutes[source % len(config.minutes)]
+        audio = synthesize_speech(minutes * 60, seed=config.seed + source)
+        if source != i:
+            noise = np.random.default_rng(config.seed + i).standard_normal(len(audio)).astype(np.float32)
+            audio = np.clip(audio * 0.8 + noise * 0.002, -1.0, 1.0)
+        paths.append(write_wav(directory / f"lecture_{i:02d}.wav", audio))
+    return paths
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    stats = {f"p{p}": round(float(np.percentile(values, p)), 6) for p in PERCENTILES}
+    stats["mean"] = round(float(np.mean(values)), 6)
+    stats["count"] = len(values)
+    return stats
+
+
+def latency_stats(events: List[Dict]) -> Dict[str, Dict[str, float]]:
+    #Percentiles per span kind: stage:<name> for pipeline stages, plus whisper, decode, openai, google
+    grouped: Dict[str, List[float]] = {}
+    per_recording: Dict[str, float] = {}
+    for event in events:
+        if event.get("type") != "span":
+            continue
+        key = event["name"]
+        if key == "stage":
+            key = f"stage:{event['labels'].get('stage')}"
+            if event.get("recording"):
+                per_recording[event["recording"]] = per_recording.get(event["recording"], 0.0) + event["seconds"]
+        grouped.setdefault(key, []).append(event["seconds"])
+    stats = {key: percentiles(values) for key, values in sorted(grouped.items())}
+    # summed stage time per recording; pipeline mode overlaps these, so this is not wall time
+    stats["recording"] = percentiles(list(per_recording.values()))
+    return stats
+
+
+def peak_rss_mb() -> float:
+    #Peak resident set size of this process and any finished child processes (ru_maxrss is KiB on Linux)
+    scale = 1 / 1024 if sys.platform != "darwin" else 1 / (1024 * 1024)
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) * scale, 1)
+
+
+def measure_startup(repeats: int = 3) -> Dict[str, float]:
+    #Median wall time of `main.py --help`, of an invalid-path error and of importing main,
+    #each in a fresh interpreter
+    def timed(argv: List[str]) -> float:
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run(argv, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            samples.append(time.perf_counter() - start)
+        return round(float(np.median(samples)), 4)
+
+    return {
+        "help_seconds": timed([sys.executable, "main.py", "--help"]),
+        "invalid_path_seconds": timed([sys.executable, "main.py", "does-not-exist.mp3"]),
+        "import_seconds": timed([sys.executable, "-c", "import main"]),
+        "interpreter_seconds": timed([sys.executable, "-c", "pass"]),
+    }
+
+
+def import_profile(argv: List[str]) -> List[Tuple[str, float]]:
+    #(module, cumulative seconds) for every top-level import of `python -X importtime <argv>`, slowest first
+    result = subprocess.run([sys.executable, "-X", "importtime", *argv], cwd=REPO_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"; nested imports are indented
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit() or name.startswith("  "):
+            continue
+        imports.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(imports, key=lambda item: item[1], reverse=True)
+
+
+def format_import_profile(imports: List[Tuple[str, float]], top: int = 15) -> str:
+    lines = [f"{'import':<40} {'seconds':>9}"]
+    lines.extend(f"{name:<40} {seconds:>9.4f}" for name, seconds in imports[:top])
+    return "\n".join(lines)
+
+
+def generate_long_recording(path: Path, minutes: float, seed: int = 0) -> Path:
+    #One recording of any length, synthesized and written ten minutes at a time
+    pieces = int(np.ceil(minutes / 10))
+    return write_wav_blocks(path, (synthesize_speech(min(10.0, minutes - 10 * i) * 60, seed=seed + i)
+                                   for i in range(pieces)))
+
+
+def transcription_peak_rss(recording_path: str, stream_decode: bool, vad: bool = True) -> Dict:
+    #Transcribe one recording through LectureProcessor.transcribe with an instant fake Whisper and
+    #report this process's peak RSS before and after; measure_transcription_memory runs it in a child
+    from src.core.resources import ResourcePool
+    from src.core.lecture_processor import LectureProcessor
+
+    with tempfile.TemporaryDirectory(prefix="lecture-memory-") as data_dir:
+        pool = ResourcePool(data_dir=Path(data_dir), whisper_loader=lambda size: FakeWhisperModel(rtf=0.0))
+        processor = LectureProcessor(pool=pool, vad=vad, stream_decode=stream_decode, search_index=False)
+        processor.transcriber
+        baseline = peak_rss_mb()
+        start = time.perf_counter()
+        trans_path = processor.transcribe(str(recording_path))
+        seconds = time.perf_counter() - start
+        segments = len(processor.load_transcription(trans_path)["segments"]) if trans_path else 0
+        return {"baseline_rss_mb": baseline, "peak_rss_mb": peak_rss_mb(), "seconds": round(seconds, 2),
+                "segments": segments}
+
+
+def measure_transcription_memory(minutes: List[float], vad: bool = True, seed: int = 0) -> List[Dict]:
+    #Peak RSS of transcribing one synthetic recording of each length, decoded whole and streamed
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="lecture-memory-") as directory:
+        for length in minutes:
+            path = generate_long_recording(Path(directory) / f"lecture_{length:g}min.wav", length, seed)
+            row = {"minutes": length}
+            for mode in ("whole", "stream"):
+                output = subprocess.run([sys.executable, "-c", _MEMORY_CHILD, str(path), mode,
+                                         "vad" if vad else "no-vad"],
+                                        cwd=REPO_DIR, capture_output=True, text=True, check=True)
+                row[mode] = json.loads(output.stdout.strip().splitlines()[-1])
+            rows.append(row)
+            path.unlink()
+    return rows
+
+
+def format_memory_results(rows: List[Dict]) -> str:
+    lines = [f"{'minutes':>8} {'whole MB':>10} {'stream MB':>10} {'baseline MB':>12}"]
+    lines.extend(f"{row['minutes']:>8g} {row['whole']['peak_rss_mb']:>10.1f} {row['stream']['peak_rss_mb']:>10.1f} "
+                 f"{row['stream']['baseline_rss_mb']:>12.1f}" for row in rows)
+    return "\n".join(lines)
+
+
+def _build_processor(config: BenchmarkConfig, data_dir: Path, openai_url: str):
+    from src.core.resources import ResourcePool
+    from src.core.lecture_processor import LectureProcessor
+
+    pool = ResourcePool(
+        data_dir=data_dir,
+        whisper_loader=lambda size: FakeWhisperModel(rtf=config.refine_rtf, seed=config.seed)
+        if size == config.refine_whisper_model
+        else FakeWhisperModel(rtf=config.whisper_rtf, seed=config.seed, low_confidence_rate=config.low_confidence_rate),
+        llm_client_options={"base_url": openai_url, "base_delay": 0.05, "max_delay": 1.0},
+    )
+    return LectureProcessor(pool=pool, vad=config.vad, enhance_fan_out=config.enhance_fan_out,
+                            refine_whisper_model=config.refine_whisper_model, dedup=config.dedup,
+                            stream_decode=config.stream_decode)
+
+
+def run_benchmark(config: BenchmarkConfig, work_dir: Optional[Path] = None,
+                  startup: bool = True) -> Dict:
+    #Process synthetic recordings end to end through main.process_directory against local fakes
+    from google.auth.credentials import AnonymousCredentials
+    from src.integrations import google_auth
+    from main import process_directory
+
+    own_dir = work_dir is None
+    work_dir = Path(work_dir or tempfile.mkdtemp(prefix="lecture-bench-"))
+    audio_dir = work_dir / "audio"
+    data_dir = work_dir / "data"
+    recordings = generate_recordings(audio_dir, config)
+    audio_seconds = sum(config.minutes[source_recording(i, config) % len(config.minutes)] * 60
+                        for i in range(config.recordings))
+
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    openai_server = FakeOpenAIServer(latency=config.openai_latency, error_rate=config.openai_error_rate,
+                                     retry_after=0.05, seed=config.seed, batch_polls=1,
+                                     seconds_per_output_token=config.openai_seconds_per_token,
+                                     array_items=config.notes_items, string_words=config.notes_words)
+    google_server = FakeGoogleServer(latency=config.google_latency, error_rate=config.google_error_rate,
+                                     seed=config.seed)
+    try:
+        with openai_server, google_server, open(os.devnull, "w") as devnull:
+            google_auth.use_backend(google_server.base_url, AnonymousCredentials())
+            passes = 2 if config.warm else 1
+            for _ in range(passes):
+                metrics.reset()
+                openai_before, google_before = openai_server.request_count, google_server.request_count
+                processor = _build_processor(config, data_dir, openai_server.base_url)
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(devnull):
+                    successful = process_directory(str(audio_dir), logger, processor,
+                                                   pipeline=config.mode == "pipeline", batch=config.mode == "batch",
+                                                   batch_poll_interval=0.05, llm_workers=config.llm_workers,
+                                                   publish_workers=config.publish_workers)
+                wall = time.perf_counter() - start
+                if processor.pool.has_llm_client():
+                    processor.client.close()
+            summary = metrics.summary()
+            results = {
+                "wall_seconds": round(wall, 4),
+                "audio_seconds": round(audio_seconds, 1),
+                # seconds of audio processed per wall-clock second
+                "throughput": round(audio_seconds / wall, 3) if wall else None,
+                "recordings_per_minute": round(len(recordings) * 60 / wall, 3) if wall else None,
+                "peak_rss_mb": peak_rss_mb(),
+                "failed": len(recordings) - successful,
+                "openai_requests": openai_server.request_count - openai_before,
+                "openai_errors_injected": openai_server.rate_limited_count,
+                "google_requests": google_server.request_count - google_before,
+                "google_errors_injected": google_server.error_count,
+                "openai_input_tokens": summary["openai_input_tokens"],
+                "openai_output_tokens": summary["openai_output_tokens"],
+                "openai_retries": summary["openai_retries"],
+                "real_time_factor": summary["real_time_factor"],
+                "escalated_fraction": summary.get("escalated_fraction"),
+                "tiered_speedup": summary.get("tiered_speedup"),
+                "duplicates_reused": int(metrics.counter("duplicates_reused", stage="transcribe")),
+                "latency": latency_stats(metrics.events),
+            }
+    finally:
+        google_auth.use_backend(None)
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if startup:
+        results["startup"] = measure_startup()
+    return {
+        "benchmark_version": BENCHMARK_VERSION,
+        "name": config.name,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": asdict(config),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "results": results,
+    }
+
+
+def save_result(result: Dict, path: Path) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    return path
+
+
+def load_result(path: Path) -> Dict:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def _comparable(results: Dict) -> Dict[str, Tuple[float, bool]]:
+    #metric -> (value, higher_is_better) for every figure worth comparing between runs
+    values: Dict[str, Tuple[float, bool]] = {
+        "wall_seconds": (results["wall_seconds"], False),
+        "throughput": (results["throughput"], True),
+        "peak_rss_mb": (results["peak_rss_mb"], False),
+        "openai_requests": (results["openai_requests"], False),
+        "google_requests": (results["google_requests"], False),
+    }
+    for key, seconds in results.get("startup", {}).items():
+        values[f"startup.{key}"] = (seconds, False)
+    for key, stats in results.get("latency", {}).items():
+        if stats.get("count") and stats["p50"] >= NOISE_FLOOR_SECONDS:
+            for p in PERCENTILES:
+                values[f"latency.{key}.p{p}"] = (stats[f"p{p}"], False)
+    return values
+
+
+def compare_results(baseline: Dict, current: Dict, threshold: float = 0.10) -> Tuple[List[Dict], bool]:
+    #Rows of (metric, baseline, current, change) and whether any metric got worse by more than threshold
+    if baseline.get("config") != current.get("config"):
+        logger.warning("Benchmark configs differ; comparing anyway")
+    old, new = _comparable(baseline["results"]), _comparable(current["results"])
+    rows = []
+    regressed = False
+    for metric in sorted(old.keys() & new.keys()):
+        (before, higher_is_better), (after, _) = old[metric], new[metric]
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        regression = worse > threshold
+        regressed = regressed or regression
+        rows.append({"metric": metric, "baseline": before, "current": after, "change": change,
+                     "regression": regression})
+    return rows, regressed
+
+
+def format_comparison(rows: List[Dict], threshold: float) -> str:
+    lines = [f"{'metric':<36} {'baseline':>12} {'current':>12} {'change':>9}"]
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        lines.append(f"{row['metric']:<36} {row['baseline']:>12.4g} {row['current']:>12.4g} "
+                     f"{row['change']:>+8.1%}{flag}")
+    flagged = sum(row["regression"] for row in rows)
+    lines.append(f"\n{flagged} regression(s) beyond {threshold:.0%}")
+    return "\n".join(lines)
@@ -0,0 +1,331 @@
+import json
+import time
+import uuid
+import random
+import threading
+from email.parser import Parser
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote
+
+from src.integrations.publisher import utf16_len
+
+
+class FakeGoogleServer:
+    #Local stand-in for the Docs v1, Sheets v4 and Calendar v3 endpoints the integrations use, with
+    #configurable latency and injected 503s. Route the real clients to it with
+    #google_auth.use_backend(server.base_url).
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        # HTTP requests per "api.method", and how many of them were failed on purpose
+        self.calls: Dict[str, int] = {}
+        self.error_count = 0
+        # requests carried inside batch requests, per "api.method"; not counted in calls
+        self.batched: Dict[str, int] = {}
+        self.documents: Dict[str, Dict] = {}
+        self.spreadsheets: Dict[str, Dict[str, List[List[str]]]] = {}
+        # calendar ID -> {"summary", "events": {event ID: event}}; every change takes the next sequence
+        # number, and a sync token is the sequence number it was issued at
+        self.calendars: Dict[str, Dict] = {}
+        self._sequence = 0
+        # tokens issued before this sequence number get 410 Gone, as expired ones do
+        self.min_sync_sequence = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    @property
+    def request_count(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, method: str):
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length) if length else b""
+                content_type = "application/json"
+                if self.path.startswith("/batch/"):
+                    status, payload, content_type = server.handle_batch(self.path, raw, self.headers["Content-Type"])
+                else:
+                    status, body = server.handle(method, self.path, json.loads(raw) if raw else {})
+                    payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def do_PUT(self):
+                self._respond("PUT")
+
+        return Handler
+
+    def _route(self, method: str, path: str) -> Tuple[str, List[str]]:
+        #"api.method" name and path parameters for a request path
+        path, _, query = path.partition("?")
+        parts = [unquote(part) for part in path.strip("/").split("/")]
+        if parts[:2] == ["v1", "documents"]:
+            if len(parts) == 2:
+                return "docs.create", []
+            if parts[2].endswith(":batchUpdate"):
+                return "docs.batchUpdate", [parts[2][:-len(":batchUpdate")]]
+            return "docs.get", [parts[2]]
+        if parts[:2] == ["v4", "spreadsheets"]:
+            if len(parts) == 2:
+                return "sheets.create", []
+            if len(parts) == 3:
+                if parts[2].endswith(":batchUpdate"):
+                    return "sheets.batchUpdate", [parts[2][:-len(":batchUpdate")]]
+                return "sheets.metadata", [parts[2]]
+            if len(parts) >= 5 and parts[3] == "values":
+                if parts[4].endswith(":append"):
+                    return "sheets.append", [parts[2], parts[4][:-len(":append")]]
+                return "sheets.get", [parts[2], parts[4]]
+        # Calendar's paths have no version prefix once the endpoint is overridden
+        if parts[0] == "calendars":
+            if len(parts) == 1 and method == "POST":
+                return "calendar.calendars.insert", []
+            if len(parts) == 3 and parts[2] == "events":
+                if method == "GET":
+                    return "calendar.events.list", [parts[1], query]
+                return "calendar.events.insert", [parts[1]]
+            if len(parts) == 4 and parts[2] == "events" and method == "PUT":
+                return "calendar.events.update", [parts[1], parts[3]]
+        return f"unknown {method} {path}", []
+
+    def handle(self, method: str, path: str, body: Dict) -> Tuple[int, Dict]:
+        name, params = self._route(method, path)
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.error_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            return 503, {"error": {"code": 503, "message": "Backend unavailable", "status": "UNAVAILABLE"}}
+        handler = getattr(self, "_" + name.replace(".", "_"), None)
+        if handler is None:
+            return 404, {"error": {"code": 404, "message": f"Unknown route {method} {path}", "status": "NOT_FOUND"}}
+        with self._lock:
+            return handler(body, *params)
+
+    def handle_batch(self, path: str, raw: bytes, content_type: str) -> Tuple[int, bytes, str]:
+        #A multipart/mixed batch: one HTTP request (counted as "<api>.batch"), answered part by part
+        name = f"{path.strip('/').split('/')[1]}.batch"
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.error_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            return 503, json.dumps({"error": {"code": 503, "message": "Backend unavailable",
+                                              "status": "UNAVAILABLE"}}).encode("utf-8"), "application/json"
+        message = Parser().parsestr(f"Content-Type: {content_type}\r\n\r\n" + raw.decode("utf-8"))
+        boundary = f"batch_{uuid.uuid4().hex}"
+        chunks = []
+        for part in message.get_payload():
+            request_line, _, rest = part.get_payload().replace("\r\n", "\n").partition("\n")
+            method, request_path, _ = request_line.split(" ", 2)
+            _, _, body = rest.partition("\n\n")
+            name, params = self._route(method, request_path)
+            handler = getattr(self, "_" + name.replace(".", "_"), None)
+            with self._lock:
+                self.batched[name] = self.batched.get(name, 0) + 1
+                if handler is None:
+                    status, response = 404, {"error": {"code": 404, "message": f"Unknown route {method} {request_path}",
+                                                       "status": "NOT_FOUND"}}
+                else:
+                    status, response = handler(json.loads(body) if body.strip() else {}, *params)
+            content_id = part["Content-ID"].replace("<", "<response-", 1)
+            chunks.append(f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: {content_id}\r\n\r\n"
+                          f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\n\r\n"
+                          f"{json.dumps(response)}\r\n")
+        payload = "".join(chunks) + f"--{boundary}--\r\n"
+        return 200, payload.encode("utf-8"), f"multipart/mixed; boundary={boundary}"
+
+    def _docs_create(self, body: Dict) -> Tuple[int, Dict]:
+        document_id = f"doc-{len(self.documents) + 1}"
+        self.documents[document_id] = {"documentId": document_id, "title": body.get("title", ""), "text": ""}
+        return 200, {"documentId": document_id, "title": body.get("title", "")}
+
+    def _docs_get(self, body: Dict, document_id: str) -> Tuple[int, Dict]:
+        document = self.documents.get(document_id)
+        if document is None:
+            return 404, {"error": {"code": 404, "message": "Document not found", "status": "NOT_FOUND"}}
+        # index 1 starts the body and the final newline is implicit, as in the real API
+        end_index = utf16_len(document["text"]) + 2
+        return 200, {"documentId": document_id, "title": document["title"],
+                     "body": {"content": [{"endIndex": end_index}]}}
+
+    def _docs_batchUpdate(self, body: Dict, document_id: str) -> Tuple[int, Dict]:
+        document = self.documents.get(document_id)
+        if document is None:
+            return 404, {"error": {"code": 404, "message": "Document not found", "status": "NOT_FOUND"}}
+        for request in body.get("requests", []):
+            if "deleteContentRange" in request:
+                document["text"] = ""
+            elif "insertText" in request:
+                document["text"] += request["insertText"]["text"]
+        return 200, {"documentId": document_id, "replies": [{} for _ in body.get("requests", [])]}
+
+    def _sheets_create(self, body: Dict) -> Tuple[int, Dict]:
+        spreadsheet_id = f"sheet-{len(self.spreadsheets) + 1}"
+        sheets: Dict[str, List[List[str]]] = {}
+        for sheet in body.get("sheets", []) or [{"properties": {"title": "Sheet1"}}]:
+            rows = []
+            for data in sheet.get("data", []):
+                for row in data.get("rowData", []):
+                    rows.append([cell["userEnteredValue"]["stringValue"] for cell in row.get("values", [])])
+            sheets[sheet["properties"]["title"]] = rows
+        self.spreadsheets[spreadsheet_id] = sheets
+        return 200, {"spreadsheetId": spreadsheet_id, "properties": body.get("properties", {})}
+
+    def _sheets_metadata(self, body: Dict, spreadsheet_id: str) -> Tuple[int, Dict]:
+        sheets = self.spreadsheets.get(spreadsheet_id)
+        if sheets is None:
+            return 404, {"error": {"code": 404, "message": "Spreadsheet not found", "status": "NOT_FOUND"}}
+        return 200, {"sheets": [{"properties": {"title": title}} for title in sheets]}
+
+    def _sheets_batchUpdate(self, body: Dict, spreadsheet_id: str) -> Tuple[int, Dict]:
+        sheets = self.spreadsheets.get(spreadsheet_id)
+        if sheets is None:
+            return 404, {"error": {"code": 404, "message": "Spreadsheet not found", "status": "NOT_FOUND"}}
+        for request in body.get("requests", []):
+            title = request.get("addSheet", {}).get("properties", {}).get("title")
+            if title in sheets:
+                return 400, {"error": {"code": 400, "message": f"A sheet with the name \"{title}\" already exists",
+                                       "status": "INVALID_ARGUMENT"}}
+            if title:
+                sheets[title] = []
+        return 200, {"spreadsheetId": spreadsheet_id, "replies": [{} for _ in body.get("requests", [])]}
+
+    def _sheet_rows(self, spreadsheet_id: str, range_name: str) -> Tuple[Optional[List[List[str]]], Tuple[int, Dict]]:
+        #Rows of the sheet a range names, or None and the error the API answers with
+        sheets = self.spreadsheets.get(spreadsheet_id)
+        if sheets is None:
+            return None, (404, {"error": {"code": 404, "message": "Spreadsheet not found", "status": "NOT_FOUND"}})
+        rows = sheets.get(range_name.split("!")[0])
+        if rows is None:
+            return None, (400, {"error": {"code": 400, "message": f"Unable to parse range: {range_name}",
+                                          "status": "INVALID_ARGUMENT"}})
+        return rows, (200, {})
+
+    def _sheets_get(self, body: Dict, spreadsheet_id: str, range_name: str) -> Tuple[int, Dict]:
+        rows, error = self._sheet_rows(spreadsheet_id, range_name)
+        if rows is None:
+            return error
+        return 200, {"range": range_name, "majorDimension": "ROWS", "values": rows}
+
+    def _sheets_append(self, body: Dict, spreadsheet_id: str, range_name: str) -> Tuple[int, Dict]:
+        rows, error = self._sheet_rows(spreadsheet_id, range_name)
+        if rows is None:
+            return error
+        values = body.get("values", [])
+        rows.extend(values)
+        return 200, {"spreadsheetId": spreadsheet_id, "updates": {"updatedRange": range_name,
+                                                                   "updatedRows": len(values)}}
+
+    def _calendar_calendars_insert(self, body: Dict) -> Tuple[int, Dict]:
+        calendar_id = f"calendar-{len(self.calendars) + 1}"
+        self.calendars[calendar_id] = {"summary": body.get("summary", ""), "events": {}}
+        return 200, {"kind": "calendar#calendar", "id": calendar_id, "summary": body.get("summary", "")}
+
+    def _store_event(self, calendar_id: str, event: Dict) -> Dict:
+        self._sequence += 1
+        event = {**event, "kind": "calendar#event", "status": event.get("status", "confirmed")}
+        self.calendars[calendar_id]["events"][event["id"]] = (self._sequence, event)
+        return event
+
+    def _calendar_events_list(self, body: Dict, calendar_id: str, query: str) -> Tuple[int, Dict]:
+        calendar = self.calendars.get(calendar_id)
+        if calendar is None:
+            return 404, {"error": {"code": 404, "message": "Not Found", "status": "NOT_FOUND"}}
+        params = {key: values[0] for key, values in parse_qs(query).items()}
+        since = None
+        if "syncToken" in params:
+            since = int(params["syncToken"].split("-")[-1])
+            if since < self.min_sync_sequence:
+                return 410, {"error": {"code": 410, "message": "Sync token is no longer valid, a full sync is required.",
+                                       "errors": [{"reason": "fullSyncRequired"}], "status": "GONE"}}
+        changed = sorted(calendar["events"].values(), key=lambda item: item[0])
+        if since is None:
+            events = [event for _, event in changed if event["status"] != "cancelled"]
+        else:
+            # deleted events come back as their ID and status only, as from the real API
+            events = [event if event["status"] != "cancelled" else {"id": event["id"], "status": "cancelled"}
+                      for sequence, event in changed if sequence > since]
+        start = int(params.get("pageToken", 0))
+        end = start + int(params.get("maxResults", 250))
+        response = {"kind": "calendar#events", "items": events[start:end]}
+        if end < len(events):
+            response["nextPageToken"] = str(end)
+        else:
+            response["nextSyncToken"] = f"sync-{self._sequence}"
+        return 200, response
+
+    def _calendar_events_insert(self, body: Dict, calendar_id: str) -> Tuple[int, Dict]:
+        calendar = self.calendars.get(calendar_id)
+        if calendar is None:
+            return 404, {"error": {"code": 404, "message": "Not Found", "status": "NOT_FOUND"}}
+        event_id = body.get("id") or uuid.uuid4().hex
+        if event_id in calendar["events"]:
+            return 409, {"error": {"code": 409, "message": "The requested identifier already exists.",
+                                   "status": "ALREADY_EXISTS"}}
+        return 200, self._store_event(calendar_id, {**body, "id": event_id})
+
+    def _calendar_events_update(self, body: Dict, calendar_id: str, event_id: str) -> Tuple[int, Dict]:
+        calendar = self.calendars.get(calendar_id)
+        if calendar is None or event_id not in calendar["events"]:
+            return 404, {"error": {"code": 404, "message": "Not Found", "status": "NOT_FOUND"}}
+        return 200, self._store_event(calendar_id, {**body, "id": event_id})
+
+    def delete_event(self, calendar_id: str, event_id: str) -> None:
+        #Delete an event as a user would in the Calendar UI
+        with self._lock:
+            _, event = self.calendars[calendar_id]["events"][event_id]
+            self._store_event(calendar_id, {**event, "status": "cancelled"})
+
+    def calendar_events(self, calendar_id: str) -> List[Dict]:
+        #Events currently on a calendar, deleted ones excluded
+        with self._lock:
+            return [event for _, event in self.calendars[calendar_id]["events"].values()
+                    if event["status"] != "cancelled"]
+
+    def start(self) -> "FakeGoogleServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-google", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeGoogleServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,338 @@
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email.parser import BytesParser
+from email.policy import default
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+def sample_from_schema(schema: Dict, defs: Optional[Dict] = None, array_items: int = 1,
+                       string_words: int = 1) -> Any:
+    #A value that validates against a JSON schema, enough for structured outputs. The defaults give the
+    #smallest one; larger array_items and string_words give outputs sized like real notes.
+    defs = defs if defs is not None else schema.get("$defs", {})
+
+    def sample(node: Dict) -> Any:
+        return sample_from_schema(node, defs, array_items, string_words)
+
+    if "$ref" in schema:
+        return sample(defs[schema["$ref"].split("/")[-1]])
+    if "anyOf" in schema:
+        # prefer a non-null branch so optional fields carry data
+        options = [option for option in schema["anyOf"] if option.get("type") != "null"] or schema["anyOf"]
+        return sample(options[0])
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: sample(prop) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [sample(schema.get("items", {})) for _ in range(array_items)]
+    if kind == "integer":
+        return 1
+    if kind == "number":
+        return 1.0
+    if kind == "boolean":
+        return True
+    if kind == "null":
+        return None
+    return " ".join(["sample"] * string_words)
+
+
+def parse_multipart(content_type: str, raw: bytes) -> Dict:
+    #Form fields of a multipart/form-data body; the uploaded file's bytes land under its field name
+    message = BytesParser(policy=default).parsebytes(
+        b"Content-Type: " + content_type.encode("utf-8") + b"\r\n\r\n" + raw)
+    form: Dict = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if part.get_filename():
+            form["filename"] = part.get_filename()
+            form[name] = part.get_payload(decode=True)
+        else:
+            form[name] = part.get_content().strip()
+    return form
+
+
+class FakeOpenAIServer:
+    #Local stand-in for the OpenAI Responses, Files and Batches APIs with configurable latency and injected 429s.
+    #Point a client at it with base_url=server.base_url. seconds_per_output_token adds decode time that
+    #grows with the response, as real generation does.
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 error_rate: float = 0.0, retry_after: float = 0.1,
+                 responder: Optional[Callable[[Dict], Dict]] = None, seed: Optional[int] = None,
+                 batch_polls: int = 1, seconds_per_output_token: float = 0.0, array_items: int = 1,
+                 string_words: int = 1, batch_failures: Iterable[str] = (), rate_limit_next: int = 0):
+        self.latency = latency
+        self.seconds_per_output_token = seconds_per_output_token
+        self.array_items = array_items
+        self.string_words = string_words
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        # this many Responses requests are answered with 429 before error_rate applies, for deterministic tests
+        self.rate_limit_next = rate_limit_next
+        self.responder = responder
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self.input_tokens = 0
+        # Files and Batches API state, for exercising --batch offline
+        self.files: Dict[str, Dict] = {}
+        self.batches: Dict[str, Dict] = {}
+        self.batch_polls = batch_polls
+        # custom_ids whose batch line comes back as a server error instead of a response
+        self.batch_failures = set(batch_failures)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body, headers: Optional[Dict[str, str]] = None):
+                if isinstance(body, bytes):
+                    payload, content_type = body, "application/octet-stream"
+                else:
+                    payload, content_type = json.dumps(body).encode("utf-8"), "application/json"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _read_body(self) -> Dict:
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length)
+                content_type = self.headers.get("Content-Type", "")
+                if content_type.startswith("multipart/form-data"):
+                    return parse_multipart(content_type, raw)
+                return json.loads(raw or b"{}")
+
+            def _send_events(self, events):
+                # server-sent events, written as they are produced; the connection closing ends the stream
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                for event in events:
+                    self.wfile.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.close_connection = True
+
+            def do_POST(self):
+                status, body, headers = server.handle("POST", self.path, self._read_body())
+                if status == 200 and not isinstance(body, (bytes, dict)):
+                    return self._send_events(body)
+                self._send(status, body, headers)
+
+            def do_GET(self):
+                status, body, headers = server.handle("GET", self.path, {})
+                self._send(status, body, headers)
+
+        return Handler
+
+    def handle(self, method: str, path: str, request: Dict):
+        #Route one request; returns (status, body, headers) where body is a dict or raw bytes
+        path = path.split("?")[0].rstrip("/")
+        with self._lock:
+            self.request_count += 1
+        if method == "POST" and path.endswith("/responses"):
+            return self._handle_response(request)
+        if method == "POST" and path.endswith("/files"):
+            return 200, self._create_file(request), {}
+        if method == "GET" and path.endswith("/content"):
+            file_id = path.split("/")[-2]
+            if file_id in self.files:
+                return 200, self.files[file_id]["content"], {}
+        if method == "POST" and path.endswith("/batches"):
+            return 200, self._create_batch(request), {}
+        if method == "GET" and "/batches/" in path:
+            batch = self._poll_batch(path.split("/")[-1])
+            if batch:
+                return 200, batch, {}
+        return 404, {"error": {"message": f"Unknown route {method} {path}", "type": "invalid_request_error"}}, {}
+
+    def _handle_response(self, request: Dict):
+        with self._lock:
+            rate_limited = self.rate_limit_next > 0 or self.random.random() < self.error_rate
+            self.rate_limit_next = max(0, self.rate_limit_next - 1)
+            if rate_limited:
+                self.rate_limited_count += 1
+        if rate_limited:
+            if self.latency:
+                time.sleep(self.latency)
+            return 429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}, \
+                {"retry-after": str(self.retry_after)}
+        response = self.response_for(request)
+        if request.get("stream"):
+            return 200, self._stream_events(response), {}
+        delay = self.latency + response["usage"]["output_tokens"] * self.seconds_per_output_token
+        if delay:
+            time.sleep(delay)
+        return 200, response, {}
+
+    def _stream_events(self, response: Dict, chunk_chars: int = 16):
+        #Responses API stream for a finished response: the text arrives in deltas paced like generation
+        #(latency to the first token, then seconds_per_output_token per ~4 characters)
+        message = response["output"][0]
+        text = message["content"][0]["text"]
+        sequence = iter(range(1 << 30))
+
+        def event(kind: str, **fields) -> Dict:
+            return {"type": kind, "sequence_number": next(sequence), **fields}
+
+        if self.latency:
+            time.sleep(self.latency)
+        yield event("response.created", response={**response, "status": "in_progress", "output": []})
+        yield event("response.output_item.added", output_index=0, item={**message, "status": "in_progress", "content": []})
+        yield event("response.content_part.added", output_index=0, content_index=0, item_id=message["id"],
+                    part={"type": "output_text", "text": "", "annotations": []})
+        for start in range(0, len(text), chunk_chars):
+            delta = text[start:start + chunk_chars]
+            if self.seconds_per_output_token:
+                time.sleep(len(delta) / 4 * self.seconds_per_output_token)
+            yield event("response.output_text.delta", output_index=0, content_index=0, item_id=message["id"],
+                        delta=delta, logprobs=[])
+        yield event("response.output_text.done", output_index=0, content_index=0, item_id=message["id"],
+                    text=text, logprobs=[])
+        yield event("response.content_part.done", output_index=0, content_index=0, item_id=message["id"],
+                    part=message["content"][0])
+        yield event("response.output_item.done", output_index=0, item=message)
+        yield event("response.completed", response=response)
+
+    def _create_file(self, form: Dict) -> Dict:
+        with self._lock:
+            file_id = f"file-{len(self.files) + 1}"
+            self.files[file_id] = {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(form["file"]),
+                "created_at": int(time.time()),
+                "filename": form.get("filename", "upload.jsonl"),
+                "purpose": form.get("purpose", "batch"),
+                "status": "processed",
+                "content": form["file"],
+            }
+        return {key: value for key, value in self.files[file_id].items() if key != "content"}
+
+    def _create_batch(self, request: Dict) -> Dict:
+        #Run every line of the input file now; the batch reports in_progress for batch_polls polls
+        lines = [json.loads(line) for line in self.files[request["input_file_id"]]["content"].splitlines() if line.strip()]
+        output_lines = []
+        failed = 0
+        for line in lines:
+            if line["custom_id"] in self.batch_failures:
+                failed += 1
+                response = {"status_code": 500, "request_id": f"req_{len(output_lines) + 1}",
+                            "body": {"error": {"message": "Internal error", "type": "server_error"}}}
+            else:
+                body = self.response_for(line["body"])
+                response = {"status_code": 200, "request_id": body["id"], "body": body}
+            output_lines.append(json.dumps({
+                "id": f"batch_req_{len(output_lines) + 1}",
+                "custom_id": line["custom_id"],
+                "response": response,
+                "error": None,
+            }))
+        output_id = self._create_file({"file": "\n".join(output_lines).encode("utf-8"),
+                                       "filename": "batch_output.jsonl", "purpose": "batch_output"})["id"]
+        with self._lock:
+            batch_id = f"batch_{len(self.batches) + 1}"
+            self.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"],
+                "completion_window": request["completion_window"],
+                "created_at": int(time.time()),
+                "status": "in_progress",
+                "output_file_id": None,
+                "error_file_id": None,
+                "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+                "_failed": failed,
+                "metadata": request.get("metadata"),
+                "_polls_left": self.batch_polls,
+                "_output_file_id": output_id,
+            }
+        return self._public_batch(batch_id)
+
+    def _poll_batch(self, batch_id: str) -> Optional[Dict]:
+        with self._lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            if batch["_polls_left"] > 0:
+                batch["_polls_left"] -= 1
+            else:
+                batch["status"] = "completed"
+                batch["output_file_id"] = batch["_output_file_id"]
+                batch["request_counts"]["failed"] = batch["_failed"]
+                batch["request_counts"]["completed"] = batch["request_counts"]["total"] - batch["_failed"]
+        return self._public_batch(batch_id)
+
+    def _public_batch(self, batch_id: str) -> Dict:
+        return {key: value for key, value in self.batches[batch_id].items() if not key.startswith("_")}
+
+    def response_for(self, request: Dict) -> Dict:
+        #Build a completed Responses API payload whose text matches the requested JSON schema
+        text_format = request.get("text", {}).get("format", {})
+        if self.responder:
+            output = self.responder(request)
+        else:
+            output = sample_from_schema(text_format.get("schema", {"type": "object"}), array_items=self.array_items,
+                                        string_words=self.string_words)
+        prompt = json.dumps(request.get("input", ""))
+        input_tokens = len(prompt) // 4
+        with self._lock:
+            self.input_tokens += input_tokens
+        text = json.dumps(output)
+        return {
+            "id": f"resp_{self.request_count}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": request.get("model", "fake"),
+            "status": "completed",
+            "output": [{
+                "type": "message",
+                "id": f"msg_{self.request_count}",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {
+                "input_tokens": input_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens": len(text) // 4,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": input_tokens + len(text) // 4,
+            },
+        }
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,47 @@
+import time
+from typing import Dict, List, Union
+
+import numpy as np
+
+from src.testing.synthetic_audio import SAMPLE_RATE, read_wav
+
+WORDS = ("lecture", "theorem", "example", "definition", "assignment", "gradient", "matrix", "proof",
+         "homework", "chapter", "function", "variable", "derivative", "integral", "vector", "due")
+
+
+class FakeWhisperModel:
+    #Stands in for a loaded Whisper model: returns plausible segments for the audio it is given and
+    #spends rtf seconds per second of audio doing so, so benchmarks see realistic transcription cost.
+    #low_confidence_rate of the segments get the avg_logprob of a garbled decode.
+    def __init__(self, rtf: float = 0.05, words_per_second: float = 2.5, segment_seconds: float = 5.0,
+                 seed: int = 0, low_confidence_rate: float = 0.0):
+        self.rtf = rtf
+        self.low_confidence_rate = low_confidence_rate
+        self.words_per_second = words_per_second
+        self.segment_seconds = segment_seconds
+        self.seed = seed
+
+    def transcribe(self, audio: Union[str, np.ndarray], language: str = "en", verbose=None, **kwargs) -> Dict:
+        if isinstance(audio, str):
+            audio = read_wav(audio)
+        duration = len(audio) / SAMPLE_RATE
+        # seeded by the audio itself, so equal-length clips (such as streamed 30 s windows) differ
+        rng = np.random.default_rng([self.seed, len(audio), int(np.abs(audio[::997]).sum() * 1000)])
+        segments: List[Dict] = []
+        start = 0.0
+        while start < duration:
+            end = min(duration, start + self.segment_seconds)
+            unsure = bool(self.low_confidence_rate) and rng.random() < self.low_confidence_rate
+            count = max(1, int((end - start) * self.words_per_second))
+            text = " " + " ".join(WORDS[i] for i in rng.integers(0, len(WORDS), count)) + "."
+            segments.append({
+                "id": len(segments), "seek": int(start * 100), "start": round(start, 2), "end": round(end, 2),
+                "text": text, "tokens": rng.integers(0, 50000, count + 1).tolist(), "temperature": 0.0,
+                "avg_logprob": float(rng.uniform(-1.6, -1.05) if unsure else rng.uniform(-0.6, -0.1)),
+                "compression_ratio": float(rng.uniform(1.2, 1.8)),
+                "no_speech_prob": float(rng.uniform(0.0, 0.1)),
+            })
+            start = end
+        time.sleep(self.rtf * duration)
+        return {"text": "".join(segment["text"] for segment in segments), "segments": segments,
+                "language": language}
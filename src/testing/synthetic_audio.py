@@ -0,0 +1,63 @@
+import wave
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def synthesize_speech(seconds: float, sample_rate: int = SAMPLE_RATE, seed: Optional[int] = None,
+                      pause_fraction: float = 0.2) -> np.ndarray:
+    #Speech-like float32 audio: voiced syllables (a pitch-drifting harmonic stack under a short envelope)
+    #grouped into words and phrases, separated by pauses, over a quiet noise floor.
+    #Enough structure for VAD and decode timing; it is not intelligible speech.
+    rng = np.random.default_rng(seed)
+    total = int(seconds * sample_rate)
+    audio = (rng.standard_normal(total) * 0.003).astype(np.float32)
+    position = int(rng.uniform(0.2, 0.6) * sample_rate)
+    while position < total:
+        # one phrase of several words, then a pause whose length keeps silence near pause_fraction
+        phrase_start = position
+        for _ in range(rng.integers(3, 12)):
+            for _ in range(rng.integers(1, 4)):
+                length = int(rng.uniform(0.12, 0.3) * sample_rate)
+                end = min(position + length, total)
+                if end <= position:
+                    break
+                t = np.arange(end - position) / sample_rate
+                f0 = rng.uniform(95, 230) * (1 + 0.08 * np.sin(2 * np.pi * rng.uniform(1, 4) * t))
+                phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+                harmonics = sum(np.sin(k * phase) / k for k in range(1, 6))
+                envelope = np.sin(np.pi * np.linspace(0, 1, len(t))) ** 2
+                audio[position:end] += (0.25 * rng.uniform(0.5, 1.0) * envelope * harmonics).astype(np.float32)
+                position = end
+            position += int(rng.uniform(0.03, 0.12) * sample_rate)
+        speech = position - phrase_start
+        mean_pause = speech * pause_fraction / max(1e-6, 1 - pause_fraction)
+        position += int(rng.uniform(0.5, 1.5) * mean_pause)
+    return np.clip(audio, -1.0, 1.0)
+
+
+def write_wav(path: Union[str, Path], audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> Path:
+    #16-bit mono PCM WAV, decodable by ffmpeg and so by whisper.load_audio
+    return write_wav_blocks(path, [audio], sample_rate)
+
+
+def write_wav_blocks(path: Union[str, Path], blocks: Iterable[np.ndarray], sample_rate: int = SAMPLE_RATE) -> Path:
+    #write_wav for audio produced a block at a time, e.g. recordings too long to synthesize in one array
+    path = Path(path)
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        for audio in blocks:
+            f.writeframes((np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+    return path
+
+
+def read_wav(path: Union[str, Path]) -> np.ndarray:
+    #Float32 samples of a 16-bit mono WAV written by write_wav
+    with wave.open(str(path), "rb") as f:
+        frames = f.readframes(f.getnframes())
+    return np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
@@ -1 +1,28 @@
 # Date parsing/formatting
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
+
+# due dates are asked for as YYYY-MM-DD, but the model sometimes echoes the lecture's wording
+DUE_DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%m/%d/%Y", "%B %d, %Y", "%b %d, %Y", "%d %B %Y", "%d %b %Y")
+
+
+def parse_due_date(text: Optional[str]) -> Optional[date]:
+    #The calendar date in an assignment's due_date, or None for "TBD", "next week" and the like
+    if not text:
+        return None
+    text = " ".join(text.split()).rstrip(".")
+    for date_format in DUE_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    try:
+        # also takes a full timestamp such as 2024-03-05T23:59:00
+        return datetime.fromisoformat(text).date()
+    except ValueError:
+        return None
+
+
+def all_day_range(day: date) -> Tuple[str, str]:
+    #(start, end) dates of an all-day Calendar event on day; the end date is exclusive
+    return day.isoformat(), (day + timedelta(days=1)).isoformat()
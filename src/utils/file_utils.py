@@ -1 +1,26 @@
 # File operations
+import hashlib
+from pathlib import Path
+from typing import Union
+
+HASH_CHUNK_SIZE = 1 << 20
+# Common audio file extensions
+AUDIO_EXTENSIONS = {'.mp3', '.wav', '.m4a', '.flac', '.ogg', '.mp4'}
+
+
+def hash_file(path: Union[str, Path], chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    #SHA-256 of a file, read in fixed-size chunks so large recordings never sit in memory
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_text(*parts: str) -> str:
+    #SHA-256 over several strings, separated so ("ab", "c") and ("a", "bc") differ
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
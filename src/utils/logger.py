@@ -1 +1,240 @@
-# Logging configuration
+# Logging configuration and run instrumentation
+import os
+import re
+import json
+import time
+import cProfile
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Tuple, Union
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# prefix for every exported Prometheus metric
+METRIC_PREFIX = "lecture"
+
+
+def setup_logging(level: str = "INFO", log_file: Optional[str] = 'agentic_ai.log',
+                  verbose: bool = False) -> logging.Logger:
+    #Configure the root logger for the application; modules only ever call logging.getLogger
+    handlers: List[logging.Handler] = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    logging.basicConfig(
+        level=logging.DEBUG if verbose else getattr(logging, level.upper()),
+        format=LOG_FORMAT,
+        handlers=handlers,
+        force=True,
+    )
+    return logging.getLogger("main")
+
+
+def _label_key(labels: Dict[str, object]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+class Span:
+    #One timed operation; attributes set while it runs (tokens, audio seconds, ...) are kept with its timing
+    def __init__(self, name: str, labels: Dict[str, object]):
+        self.name = name
+        self.labels = labels
+        self.attrs: Dict[str, object] = {}
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return self.duration if self.duration is not None else time.perf_counter() - self._start
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+
+class RunMetrics:
+    #Process-wide spans and counters for one run, exported as a JSON-lines report and a
+    #Prometheus textfile. Thread-safe, so pipeline workers and the LLM event loop can record freely.
+    def __init__(self):
+        self._lock = threading.Lock()
+        # keep only the newest spans once set; the long-running serve daemon caps this, CLI runs keep all
+        self.max_events: Optional[int] = None
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.run_id = time.strftime("%Y%m%dT%H%M%S")
+            self.started = time.time()
+            self.events: Deque[Dict] = deque(maxlen=self.max_events)
+            # (name, labels) -> [count, total seconds, max seconds]
+            self.timings: Dict[Tuple[str, Tuple], List[float]] = {}
+            self.counters: Dict[Tuple[str, Tuple], float] = {}
+
+    @contextmanager
+    def span(self, name: str, **labels) -> Iterator[Span]:
+        span = Span(name, labels)
+        try:
+            yield span
+        except Exception as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.duration = time.perf_counter() - span._start
+            self.record(name, span.duration, labels, started=span.started, **span.attrs)
+
+    def record(self, name: str, seconds: float, labels: Optional[Dict[str, object]] = None,
+               started: Optional[float] = None, **attrs) -> None:
+        #Add a timing measured elsewhere, e.g. by a transcription worker process
+        labels = labels or {}
+        key = (name, _label_key(labels))
+        with self._lock:
+            timing = self.timings.setdefault(key, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+            self.events.append({
+                "type": "span", "name": name, "labels": dict(key[1]),
+                "started": started if started is not None else time.time() - seconds,
+                "seconds": round(seconds, 6), "thread": threading.current_thread().name, **attrs,
+            })
+
+    def incr(self, name: str, value: float = 1.0, **labels) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def counter(self, name: str, **labels) -> float:
+        #Sum of a counter over every label set matching labels
+        wanted = set(_label_key(labels))
+        with self._lock:
+            return sum(value for (counter_name, key), value in self.counters.items()
+                       if counter_name == name and wanted <= set(key))
+
+    def seconds(self, name: str, **labels) -> float:
+        wanted = set(_label_key(labels))
+        with self._lock:
+            return sum(timing[1] for (timing_name, key), timing in self.timings.items()
+                       if timing_name == name and wanted <= set(key))
+
+    def summary(self) -> Dict[str, object]:
+        #Run-level figures derived from the spans and counters
+        audio_seconds = self.counter("audio_seconds")
+        whisper_seconds = self.seconds("whisper")
+        summary: Dict[str, object] = {
+            "run_id": self.run_id,
+            "wall_seconds": round(time.time() - self.started, 3),
+            "audio_seconds": round(audio_seconds, 3),
+            # seconds of Whisper compute per second of audio; below 1 is faster than real time
+            "real_time_factor": round(whisper_seconds / audio_seconds, 4) if audio_seconds else None,
+            "openai_input_tokens": int(self.counter("openai_input_tokens")),
+            "openai_output_tokens": int(self.counter("openai_output_tokens")),
+            "openai_retries": int(self.counter("openai_retries")),
+        }
+        with self._lock:
+            caches = sorted({dict(key).get("cache") for name, key in self.counters if name == "cache_requests"})
+        for cache in caches:
+            hits = self.counter("cache_requests", cache=cache, result="hit")
+            total = self.counter("cache_requests", cache=cache)
+            summary[f"{cache}_cache_hit_rate"] = round(hits / total, 4) if total else None
+        stage_seconds: Dict[str, float] = {}
+        with self._lock:
+            summary["google_calls"] = sum(timing[0] for (name, _), timing in self.timings.items() if name == "google")
+            for (name, key), timing in self.timings.items():
+                stage = dict(key).get("stage")
+                if name == "stage" and stage:
+                    stage_seconds[stage] = stage_seconds.get(stage, 0.0) + timing[1]
+        summary["stage_seconds"] = {stage: round(seconds, 3) for stage, seconds in stage_seconds.items()}
+        tier_audio = self.counter("tier_audio_seconds")
+        if tier_audio:
+            # tiered transcription: share of audio re-decoded by the larger model, and the speedup over
+            # running it throughout, extrapolated from its measured speed on the escalated spans
+            refined, refine_seconds = self.counter("tier_refined_seconds"), self.counter("tier_refine_seconds")
+            tier_seconds = self.counter("tier_fast_seconds") + refine_seconds
+            summary["escalated_fraction"] = round(self.counter("tier_escalated_seconds") / tier_audio, 4)
+            summary["tiered_speedup"] = round(refine_seconds / refined * tier_audio / tier_seconds, 3) \
+                if refined and refine_seconds and tier_seconds else None
+        return summary
+
+    def write_report(self, path: Union[str, Path]) -> Path:
+        #JSON lines: one line per span, then the counters, timing totals and run summary
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        summary = self.summary()
+        with self._lock:
+            lines = list(self.events)
+            lines += [{"type": "counter", "name": name, "labels": dict(key), "value": value}
+                      for (name, key), value in sorted(self.counters.items())]
+            lines += [{"type": "timing", "name": name, "labels": dict(key), "count": count,
+                       "seconds": round(total, 6), "max_seconds": round(longest, 6)}
+                      for (name, key), (count, total, longest) in sorted(self.timings.items())]
+        lines.append({"type": "summary", **summary})
+        with open(path, 'w', encoding='utf-8') as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False, default=str) + "\n")
+        return path
+
+    def prometheus_text(self) -> str:
+        #Prometheus text exposition format, as scraped from the serve daemon's /metrics
+        out: List[str] = []
+        with self._lock:
+            timings = sorted(self.timings.items())
+            counters = sorted(self.counters.items())
+        for name in sorted({name for (name, _), _ in timings}):
+            metric = _metric_name(f"{name}_seconds")
+            out.append(f"# TYPE {metric} summary")
+            for (timing_name, key), (count, total, _) in timings:
+                if timing_name == name:
+                    out.append(f"{metric}_count{_format_labels(key)} {count}")
+                    out.append(f"{metric}_sum{_format_labels(key)} {total:.6f}")
+        for name in sorted({name for (name, _), _ in counters}):
+            metric = _metric_name(f"{name}_total")
+            out.append(f"# TYPE {metric} counter")
+            for (counter_name, key), value in counters:
+                if counter_name == name:
+                    out.append(f"{metric}{_format_labels(key)} {value:g}")
+        run_metric = _metric_name("last_run_timestamp_seconds")
+        out.append(f"# TYPE {run_metric} gauge")
+        out.append(f"{run_metric} {self.started:.0f}")
+        return "\n".join(out) + "\n"
+
+    def write_prometheus(self, path: Union[str, Path]) -> Path:
+        #prometheus_text(), renamed into place so the textfile collector never reads half a file
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(self.prometheus_text(), encoding='utf-8')
+        os.replace(tmp_path, path)
+        return path
+
+
+def _metric_name(name: str) -> str:
+    return f"{METRIC_PREFIX}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...]) -> str:
+    if not key:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+
+# one registry per process; worker processes report back through the parent
+metrics = RunMetrics()
+
+
+@contextmanager
+def profiled(path: Optional[Union[str, Path]]) -> Iterator[None]:
+    #cProfile the calling thread into path (a pstats dump); a no-op when path is None
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(path))
+        logging.getLogger(__name__).info(f"Profile written to {path}")
@@ -0,0 +1,120 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src.core.batch_runner import BatchRunner
+from src.core.llm_cache import LLMResponseCache
+from src.models.lecture_models import DocNotes
+from src.testing.fake_openai import FakeOpenAIServer
+
+MODEL = "gpt-4.1-mini"
+
+
+def prompt(text: str):
+    return [{"role": "user", "content": f"Please analyze this lecture transcription:\n\n{text}"}]
+
+
+REQUESTS = {f"lecture_{i}.wav:0": prompt(f"lecture {i}") for i in range(3)}
+
+
+def key_of(custom_id: str, requests=REQUESTS) -> str:
+    # batch lines and state are keyed by the request's LLM cache key
+    return LLMResponseCache.key_for(requests[custom_id], MODEL, DocNotes)
+
+
+@pytest.fixture
+def server():
+    with FakeOpenAIServer(batch_polls=2, batch_failures={key_of("lecture_1.wav:0")}) as server:
+        yield server
+
+
+@pytest.fixture
+def runner(server, tmp_path, monkeypatch):
+    #A BatchRunner over just what _run_pass touches: the LLM cache, client options and data dir
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    pool = SimpleNamespace(llm_cache=LLMResponseCache(tmp_path / "llm_cache"),
+                           llm_client_options={"base_url": server.base_url})
+    processor = SimpleNamespace(pool=pool, note_processor=None, data_dir=tmp_path)
+    runner = BatchRunner(processor, poll_interval=0.0)
+    runner._load_state(tmp_path / "recordings")
+    return runner
+
+
+def submitted_lines(server, batch_id: str):
+    input_file = server.files[server.batches[batch_id]["input_file_id"]]["content"]
+    return [json.loads(line) for line in input_file.splitlines() if line.strip()]
+
+
+def test_submit_poll_and_collect_with_a_failed_line(server, runner):
+    results = runner._run_pass("extract", REQUESTS, MODEL, DocNotes)
+
+    assert list(server.batches) == ["batch_1"]
+    lines = submitted_lines(server, "batch_1")
+    assert [line["custom_id"] for line in lines] == [key_of(custom_id) for custom_id in REQUESTS]
+    assert lines[0]["url"] == "/v1/responses"
+    text_format = lines[0]["body"]["text"]["format"]
+    assert text_format["type"] == "json_schema" and text_format["strict"] is True
+    assert text_format["name"] == "DocNotes"
+    # polled until done: batch_polls answers of in_progress, then completed
+    assert server.batches["batch_1"]["status"] == "completed"
+    assert server.batches["batch_1"]["request_counts"] == {"total": 3, "completed": 2, "failed": 1}
+
+    assert isinstance(results["lecture_0.wav:0"], DocNotes)
+    assert results["lecture_1.wav:0"] is None
+    assert isinstance(results["lecture_2.wav:0"], DocNotes)
+    # the state file records the failure so a rerun can retry it
+    state = json.loads(runner.state_path.read_text(encoding="utf-8"))
+    assert state["passes"]["extract"]["batch_id"] is None
+    assert state["passes"]["extract"]["results"][key_of("lecture_1.wav:0")] is None
+
+
+def test_rerun_resubmits_only_the_failed_line(server, runner):
+    runner._run_pass("extract", REQUESTS, MODEL, DocNotes)
+    server.batch_failures.clear()
+
+    results = runner._run_pass("extract", REQUESTS, MODEL, DocNotes)
+
+    assert list(server.batches) == ["batch_1", "batch_2"]
+    assert [line["custom_id"] for line in submitted_lines(server, "batch_2")] == [key_of("lecture_1.wav:0")]
+    assert all(isinstance(notes, DocNotes) for notes in results.values())
+
+
+def test_cached_results_are_not_submitted(server, runner):
+    runner._run_pass("extract", REQUESTS, MODEL, DocNotes)
+    # a new run (fresh state) finds the two successes in the LLM cache
+    runner._load_state(runner.state_path.parent / "other-recordings")
+    server.batch_failures.clear()
+
+    runner._run_pass("extract", REQUESTS, MODEL, DocNotes)
+
+    assert [line["custom_id"] for line in submitted_lines(server, "batch_2")] == [key_of("lecture_1.wav:0")]
+
+
+def test_changed_prompt_does_not_reuse_the_old_result(server, runner):
+    runner._run_pass("extract", REQUESTS, MODEL, DocNotes)
+    server.batch_failures.clear()
+    runner.llm_cache.enabled = False
+    changed = {**REQUESTS, "lecture_0.wav:0": prompt("lecture 0, transcribed again")}
+
+    runner._run_pass("extract", changed, MODEL, DocNotes)
+
+    # the edited lecture is asked again along with the failed one, under the same name
+    assert sorted(line["custom_id"] for line in submitted_lines(server, "batch_2")) == sorted(
+        [key_of("lecture_0.wav:0", changed), key_of("lecture_1.wav:0")])
+
+
+def test_batch_resumed_from_an_earlier_run_is_followed_by_the_new_prompts(server, runner):
+    # interrupted while the first batch was running
+    first = {custom_id: REQUESTS[custom_id] for custom_id in ["lecture_0.wav:0"]}
+    pass_state = runner.state["passes"].setdefault("extract", {"batch_id": None, "submitted": [], "results": {}})
+    pass_state["batch_id"] = runner._submit("extract", {key_of("lecture_0.wav:0"): first["lecture_0.wav:0"]},
+                                            MODEL, DocNotes)
+    pass_state["submitted"] = [key_of("lecture_0.wav:0")]
+    server.batch_failures.clear()
+
+    results = runner._run_pass("extract", REQUESTS, MODEL, DocNotes)
+
+    assert list(server.batches) == ["batch_1", "batch_2"]
+    assert len(submitted_lines(server, "batch_2")) == 2
+    assert all(isinstance(notes, DocNotes) for notes in results.values())
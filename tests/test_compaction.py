@@ -0,0 +1,78 @@
+from src.core.compaction import CompactionStats, compact_segments, compact_transcript
+
+
+def compact(text: str, compression_ratio: float = 1.0):
+    stats = CompactionStats()
+    segments = compact_segments([{"start": 0.0, "end": 5.0, "text": text, "compression_ratio": compression_ratio}],
+                                stats)
+    return (segments[0]["text"].strip() if segments else ""), stats
+
+
+def test_filler_words_are_dropped_and_punctuation_kept():
+    text, stats = compact(" So um the determinant is, uh, zero. That's the end, um.")
+    assert text == "So the determinant is zero. That's the end."
+    assert stats.fillers == 3
+
+
+def test_filler_phrases_set_off_by_commas_are_dropped():
+    text, stats = compact(" The proof, you know, is short. I mean, we just expand it.")
+    assert text == "The proof is short. we just expand it."
+    assert stats.fillers == 2
+
+
+def test_like_opening_a_sentence_is_a_filler():
+    text, stats = compact(" Like, this matrix is singular. Like, its rows are dependent.")
+    assert text == "this matrix is singular. its rows are dependent."
+    assert stats.fillers == 2
+
+
+def test_like_meaning_such_as_is_kept():
+    for sentence in (" Some methods, like, Gaussian elimination, scale badly.",
+                     " Fruits like apples are sweet.",
+                     " I like, mostly, the second proof."):
+        text, stats = compact(sentence)
+        assert text == sentence.strip()
+        assert stats.fillers == 0
+
+
+def test_long_runs_of_a_phrase_collapse_to_one():
+    text, stats = compact(" we take the limit" * 6 + " and it converges.")
+    assert text == "we take the limit and it converges."
+    assert stats.repeats == 5
+
+
+def test_emphasis_is_not_a_loop():
+    for sentence in (" very very good.", " Check it, check it, check it before you submit."):
+        text, stats = compact(sentence)
+        assert text == sentence.strip()
+        assert stats.repeats == 0
+
+
+def test_numbers_letters_and_math_words_are_never_collapsed():
+    for sentence in (" The all-ones vector is 1, 1, 1.",
+                     " The matrix is 1 0 0, 0 1 0, 0 0 1.",
+                     " x times x times x times x",
+                     " one one one one one one",
+                     " a b a b a b a b a b"):
+        for compression_ratio in (1.0, 3.0):
+            text, stats = compact(sentence, compression_ratio)
+            assert text == sentence.strip()
+            assert stats.repeats == 0
+
+
+def test_looping_segments_collapse_after_two_repeats():
+    text, stats = compact(" thank you. thank you.", compression_ratio=3.0)
+    assert text == "thank you."
+    assert stats.repeats == 1
+
+
+def test_empty_and_repeated_segments_are_dropped_with_their_timestamps_kept():
+    segments = [{"start": 0.0, "end": 2.0, "text": " The eigenvalues are real."},
+                {"start": 2.0, "end": 4.0, "text": " The eigenvalues are real."},
+                {"start": 4.0, "end": 5.0, "text": " um"},
+                {"start": 5.0, "end": 7.0, "text": " Next, symmetric matrices."}]
+    text, compacted, stats = compact_transcript("", segments)
+    assert text == "The eigenvalues are real. Next, symmetric matrices."
+    assert [(segment["start"], segment["end"]) for segment in compacted] == [(0.0, 2.0), (5.0, 7.0)]
+    assert stats.dropped_segments == 2
+    assert 0 < stats.saved_fraction < 1
@@ -0,0 +1,30 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from src.core.daemon import make_server, request
+from src.core.job_queue import JobQueue
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    # the handler only needs the queue for listing jobs
+    daemon = SimpleNamespace(queue=JobQueue(tmp_path / "jobs.sqlite3"))
+    path = str(tmp_path / "daemon.sock")
+    server = make_server(daemon, socket_path=path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+def test_jobs_listing_accepts_a_limit(socket_path):
+    assert request("GET", "/jobs?limit=5", socket_path=socket_path) == (200, {"jobs": []})
+
+
+@pytest.mark.parametrize("limit", ["ten", "2.5", "0", "-1"])
+def test_jobs_listing_rejects_a_bad_limit(socket_path, limit):
+    status, body = request("GET", f"/jobs?limit={limit}", socket_path=socket_path)
+    assert status == 400
+    assert "limit" in body["error"]
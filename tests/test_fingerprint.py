@@ -0,0 +1,41 @@
+import sqlite3
+
+import numpy as np
+
+from src.core import fingerprint
+from src.core.fingerprint import FINGERPRINT_VERSION, Fingerprint, FingerprintIndex, _pack_hashes
+
+
+def test_top_frequency_does_not_spill_into_the_anchor():
+    # half-bins run to 256 (bin 512), one past what 8 bits hold
+    anchor = np.array([2, 3, 256, 255], dtype=np.int64)
+    target = np.array([256, 0, 256, 256], dtype=np.int64)
+    dt = np.array([1, 1, fingerprint.MAX_DT, fingerprint.MAX_DT], dtype=np.int64)
+
+    hashes = _pack_hashes(anchor, target, dt)
+
+    assert len(set(hashes.tolist())) == 4
+    assert (hashes >> fingerprint.FREQ_SHIFT).tolist() == anchor.tolist()
+    assert ((hashes >> fingerprint.TARGET_SHIFT) & 0x1FF).tolist() == target.tolist()
+    assert (hashes & 0x3F).tolist() == dt.tolist()
+
+
+def test_index_of_an_older_version_is_dropped(tmp_path):
+    db_path = tmp_path / "index.sqlite3"
+    index = FingerprintIndex(db_path)
+    index.add("abc", str(tmp_path / "lecture.wav"),
+              Fingerprint(np.array([1, 2, 3], dtype=np.int64), np.array([0, 1, 2], dtype=np.int32), 60.0))
+    index.close()
+    # as left by the release that packed frequencies 8 bits apart
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("PRAGMA user_version = 1")
+
+    reopened = FingerprintIndex(db_path)
+    assert reopened.stats() == {"recordings": 0, "duplicates": 0, "hashes": 0}
+    reopened.add("abc", str(tmp_path / "lecture.wav"),
+                 Fingerprint(np.array([1], dtype=np.int64), np.array([0], dtype=np.int32), 60.0))
+    reopened.close()
+    # a current index is kept
+    assert FingerprintIndex(db_path).stats()["recordings"] == 1
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == FINGERPRINT_VERSION
@@ -0,0 +1,90 @@
+from typing import Dict
+
+import pytest
+from google.auth.credentials import AnonymousCredentials
+
+from src.integrations import google_auth
+from src.integrations.google_calendar import GoogleCalendarClient, GoogleCalendarIntegration
+from src.models.lecture_models import Assignment, EnhancedDocNotes
+from src.testing.fake_google import FakeGoogleServer
+
+
+def notes(*assignments: Assignment) -> EnhancedDocNotes:
+    return EnhancedDocNotes(main_topic="Linear Algebra", sub_topics=[], assignments=list(assignments))
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    # discovery documents are cached under the working directory otherwise
+    monkeypatch.setattr(google_auth, "DISCOVERY_DIR", tmp_path / "discovery")
+    with FakeGoogleServer() as server:
+        google_auth.use_backend(server.base_url, AnonymousCredentials())
+        try:
+            yield server
+        finally:
+            google_auth.use_backend(None)
+
+
+@pytest.fixture
+def sync(server, tmp_path):
+    #Publish notes for a recording through a fresh integration (as a new run would) and flush it;
+    #returns how many events were written and the requests that took, by API method
+    client = GoogleCalendarClient()
+
+    def run(lecture_notes: EnhancedDocNotes, recording: str = "lecture-01") -> Dict:
+        calls, batched = dict(server.calls), dict(server.batched)
+        integration = GoogleCalendarIntegration(client, tmp_path / "calendar_state.json")
+        integration.publish(lecture_notes, recording)
+        written = integration.flush()
+        return {
+            "written": written,
+            "calls": {name: count - calls.get(name, 0) for name, count in server.calls.items()
+                      if count != calls.get(name, 0)},
+            "batched": {name: count - batched.get(name, 0) for name, count in server.batched.items()
+                        if count != batched.get(name, 0)},
+            "calendar_id": integration.state["calendar_id"],
+        }
+
+    return run
+
+
+def test_unchanged_rerun_sends_nothing(sync):
+    lecture = notes(Assignment(title="Problem Set 1", due_date="2024-03-05"),
+                    Assignment(title="Essay", due_date="March 12, 2024", description="1500 words"))
+
+    first = sync(lecture)
+    assert first["written"] == 2
+    assert first["batched"] == {"calendar.events.insert": 2}
+
+    second = sync(lecture)
+    assert second["written"] == 0
+    assert second["calls"] == {}
+
+
+def test_changed_due_date_moves_the_event(server, sync):
+    first = sync(notes(Assignment(title="Problem Set 1", due_date="2024-03-05"),
+                       Assignment(title="Essay", due_date="2024-03-12")))
+
+    changed = sync(notes(Assignment(title="Problem Set 1", due_date="2024-03-07"),
+                         Assignment(title="Essay", due_date="2024-03-12")))
+    assert changed["written"] == 1
+    # one incremental sync, then one batch holding the single update
+    assert changed["calls"] == {"calendar.events.list": 1, "calendar.batch": 1}
+    assert changed["batched"] == {"calendar.events.update": 1}
+    events = sorted((event["summary"], event["start"]["date"])
+                    for event in server.calendar_events(first["calendar_id"]))
+    assert events == [("Essay", "2024-03-12"), ("Problem Set 1", "2024-03-07")]
+
+
+def test_same_title_in_another_recording_is_another_event(server, sync):
+    first = sync(notes(Assignment(title="Quiz", due_date="2024-03-05")), recording="algebra-01")
+    second = sync(notes(Assignment(title="Quiz", due_date="2024-03-19")), recording="physics-01")
+
+    assert second["batched"] == {"calendar.events.insert": 1}
+    assert len(server.calendar_events(first["calendar_id"])) == 2
+
+
+def test_assignments_without_a_date_are_skipped(sync):
+    result = sync(notes(Assignment(title="Project", due_date="TBD")))
+    assert result["written"] == 0
+    assert result["calls"] == {}
@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from src.core.llm_cache import LLMResponseCache
+from src.models.lecture_models import KeyTakeaways
+
+
+def test_concurrent_puts_of_one_key_leave_one_entry(tmp_path):
+    cache = LLMResponseCache(tmp_path)
+    takeaways = [KeyTakeaways(key_takeaways=[f"takeaway {i}"]) for i in range(32)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda parsed: cache.put("key", parsed), takeaways))
+
+    assert [path.name for path in tmp_path.iterdir()] == ["key.json"]
+    assert cache.get("key", KeyTakeaways) in takeaways
+
+
+def test_puts_scan_the_cache_only_when_over_budget(tmp_path, monkeypatch):
+    entry_size = len(KeyTakeaways(key_takeaways=["takeaway 00"]).model_dump_json())
+    LLMResponseCache(tmp_path).put("existing", KeyTakeaways(key_takeaways=["takeaway 99"]))
+    cache = LLMResponseCache(tmp_path, max_bytes=entry_size * 4)
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: (scans.append(1), evict()))
+
+    for i in range(3):
+        cache.put(f"key{i}", KeyTakeaways(key_takeaways=[f"takeaway {i:02}"]))
+    # rewriting an entry does not grow the total
+    cache.put("key0", KeyTakeaways(key_takeaways=["takeaway 00"]))
+    assert scans == []
+
+    cache.put("key3", KeyTakeaways(key_takeaways=["takeaway 03"]))
+    assert scans == [1]
+    assert len(list(tmp_path.glob("*.json"))) == 4
+    assert cache._total_bytes == entry_size * 4
@@ -0,0 +1,114 @@
+import time
+import asyncio
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from src.core.llm_client import AsyncLLMClient, TokenBucket, retry_after_seconds
+from src.models.lecture_models import KeyTakeaways
+from src.testing.fake_openai import FakeOpenAIServer
+
+PROMPT = [{"role": "user", "content": "Please list the key takeaways of this lecture"}]
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    clients = []
+
+    def make(server: FakeOpenAIServer, **options) -> AsyncLLMClient:
+        client = AsyncLLMClient(api_key="test", base_url=server.base_url, **options)
+        # the limiter is under test, not the tokenizer
+        monkeypatch.setattr(client, "estimate_tokens", lambda prompt_messages, model: 1_000)
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+def rate_limit_error(headers):
+    # only the response headers are read
+    return SimpleNamespace(response=SimpleNamespace(headers=headers))
+
+
+def test_retry_after_headers():
+    assert retry_after_seconds(rate_limit_error({"retry-after": "2"})) == 2.0
+    assert retry_after_seconds(rate_limit_error({"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(rate_limit_error({})) is None
+    assert retry_after_seconds(rate_limit_error({"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"})) is None
+
+
+def test_backoff_never_undercuts_retry_after():
+    client = AsyncLLMClient(api_key="test", base_delay=0.001, max_delay=0.01)
+    try:
+        for attempt in range(5):
+            assert client.backoff_delay(attempt, rate_limit_error({"retry-after": "0.5"})) == 0.5
+            assert client.backoff_delay(attempt, rate_limit_error({})) <= 0.01
+    finally:
+        client.close()
+
+
+def test_429s_are_retried_after_the_requested_wait(make_client):
+    with FakeOpenAIServer(rate_limit_next=2, retry_after=0.3) as server:
+        client = make_client(server, base_delay=0.001, max_delay=0.01)
+        started = time.monotonic()
+        result = client.parse(PROMPT, "gpt-4.1-mini", KeyTakeaways)
+        elapsed = time.monotonic() - started
+
+    assert isinstance(result, KeyTakeaways)
+    assert server.rate_limited_count == 2
+    assert client.retries == 2
+    # two waits of the server's Retry-After, not the much shorter jittered backoff
+    assert elapsed >= 0.6
+
+
+def test_retries_stop_at_max_retries(make_client):
+    with FakeOpenAIServer(rate_limit_next=5, retry_after=0.01) as server:
+        client = make_client(server, max_retries=2, base_delay=0.001)
+        with pytest.raises(openai.RateLimitError):
+            client.parse(PROMPT, "gpt-4.1-mini", KeyTakeaways)
+
+    assert client.retries == 2
+    assert server.rate_limited_count == 3
+
+
+def test_token_bucket_waits_for_refill():
+    async def scenario():
+        # 60 per minute: full at 60, refilled at one per second
+        bucket = TokenBucket(60)
+        started = time.monotonic()
+        await bucket.acquire(60)
+        assert time.monotonic() - started < 0.1
+        await bucket.acquire(0.5)
+        return time.monotonic() - started
+
+    assert 0.45 <= asyncio.run(scenario()) < 1.0
+
+
+def test_token_bucket_caps_oversized_requests():
+    async def scenario():
+        bucket = TokenBucket(60)
+        started = time.monotonic()
+        # larger than the bucket: takes what a full bucket holds instead of waiting forever
+        await bucket.acquire(1_000)
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 0.1
+
+
+def test_request_rate_limit_spaces_requests(make_client):
+    with FakeOpenAIServer() as server:
+        # a bucket of two requests, refilled at two per second
+        client = make_client(server, requests_per_minute=120)
+        client.request_bucket = TokenBucket(120)
+        client.request_bucket.tokens = 2
+        started = time.monotonic()
+        for _ in range(3):
+            client.parse(PROMPT, "gpt-4.1-mini", KeyTakeaways)
+        elapsed = time.monotonic() - started
+
+    assert server.request_count == 3
+    # the third request waited about half a second for a refill
+    assert 0.4 <= elapsed < 2.0
@@ -0,0 +1,36 @@
+from src.core.lecture_processor import LectureProcessor
+from src.core.manifest import ManifestStore
+from src.core.resources import ResourcePool
+
+
+def test_overwritten_output_is_stale(tmp_path):
+    manifest = ManifestStore(tmp_path / "manifests").for_recording(str(tmp_path / "a" / "lecture1.mp3"))
+    notes_path = tmp_path / "lecture1_notes.json"
+    notes_path.write_text('{"main_topic": "Linear Algebra"}', encoding="utf-8")
+    manifest.record("extract", "input", "output", path=str(notes_path))
+    assert manifest.staleness("extract", "input") is None
+
+    # what another recording with the same stem used to do
+    notes_path.write_text('{"main_topic": "Mechanics"}', encoding="utf-8")
+    assert manifest.staleness("extract", "input") == "output changed"
+    notes_path.unlink()
+    assert manifest.staleness("extract", "input") == "output missing"
+
+
+def test_records_without_a_file_hash_are_rechecked(tmp_path):
+    manifest = ManifestStore(tmp_path / "manifests").for_recording(str(tmp_path / "lecture1.mp3"))
+    notes_path = tmp_path / "lecture1_notes.json"
+    notes_path.write_text("{}", encoding="utf-8")
+    manifest.record("extract", "input", "output", path=str(notes_path))
+    # as written before outputs were hashed
+    del manifest.data["stages"]["extract"]["file_hash"]
+    assert manifest.staleness("extract", "input") == "output changed"
+
+
+def test_same_named_recordings_get_their_own_notes_files(tmp_path):
+    processor = LectureProcessor(pool=ResourcePool(data_dir=tmp_path / "data"), search_index=False, dedup=False)
+    names = {processor.notes_name(str(tmp_path / "a" / "lecture1.mp3")),
+             processor.notes_name(str(tmp_path / "b" / "lecture1.mp3")),
+             processor.notes_name(str(tmp_path / "a" / "lecture1.m4a"))}
+    assert len(names) == 3
+    assert all(name.startswith("lecture1-") for name in names)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from src.core import chunking, planner
+from src.core.fingerprint import Fingerprint
+from src.core.lecture_processor import LectureProcessor
+from src.core.planner import TOKENS_PER_SUBTOPIC, TokenPlanner, format_directory_plan
+from src.core.resources import ResourcePool
+from src.testing.synthetic_audio import write_wav
+
+
+class WordEncoding:
+    # a token per word is close enough to size prompts
+    def encode(self, text, **kwargs):
+        return text.split()
+
+
+@pytest.fixture
+def recording(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunking, "get_encoding", lambda model_name: WordEncoding())
+    # 30 minutes of audio, not transcribed yet
+    return str(write_wav(tmp_path / "lecture.wav", np.zeros(16000 * 60 * 30, dtype=np.float32)))
+
+
+def enhance_estimate(tmp_path, recording, fan_out: bool):
+    processor = LectureProcessor(pool=ResourcePool(data_dir=tmp_path / "data"), enhance_fan_out=fan_out,
+                                 search_index=False, dedup=False)
+    plan = TokenPlanner(processor).plan_file(recording)
+    return next(estimate for estimate in plan.passes if estimate.stage == "enhance")
+
+
+def test_enhance_without_first_pass_notes_is_one_request(tmp_path, recording):
+    enhance = enhance_estimate(tmp_path, recording, fan_out=False)
+    assert enhance.requests == 1
+    assert not enhance.exact
+
+
+def test_fan_out_enhance_without_first_pass_notes_counts_each_subtopic(tmp_path, recording):
+    single = enhance_estimate(tmp_path, recording, fan_out=False)
+    fan_out = enhance_estimate(tmp_path, recording, fan_out=True)
+
+    # 6,000 transcript tokens -> 900 tokens of first-pass notes -> 4 subtopics, plus the takeaways request
+    assert fan_out.requests == round(900 / TOKENS_PER_SUBTOPIC) + 1 == 5
+    # every request repeats the prompt and schema, so fanning out costs more input
+    assert fan_out.input_tokens > single.input_tokens
+
+
+def test_recording_of_unknown_length_cannot_be_planned(tmp_path, recording, monkeypatch):
+    monkeypatch.setattr(planner, "audio_duration", lambda recording_path: None)
+    processor = LectureProcessor(pool=ResourcePool(data_dir=tmp_path / "data"), search_index=False, dedup=False)
+
+    plan = TokenPlanner(processor).plan_file(recording)
+
+    # not counted as a free file a token budget would let through
+    assert plan.unplannable
+    assert plan.passes == []
+    assert "could not be planned" in format_directory_plan("lectures", [plan])
+
+
+def test_known_duplicate_costs_nothing(tmp_path, recording):
+    processor = LectureProcessor(pool=ResourcePool(data_dir=tmp_path / "data"), search_index=False, dedup=True)
+    fingerprint = Fingerprint(np.array([1, 2, 3], dtype=np.int64), np.array([0, 1, 2], dtype=np.int32), 1800.0)
+    processor.fingerprints.add("original-hash", str(tmp_path / "original.wav"), fingerprint)
+    processor.fingerprints.add(processor.transcription_cache.audio_hash(recording), recording, fingerprint,
+                               duplicate_of={**processor.fingerprints.get("original-hash"), "score": 0.9})
+
+    plan = TokenPlanner(processor).plan_file(recording)
+
+    assert plan.duplicate_of == str((tmp_path / "original.wav").resolve())
+    assert plan.total_tokens == 0
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+from google.auth.credentials import AnonymousCredentials
+
+from src.integrations import google_auth
+from src.integrations.google_docs import GoogleDocsClient
+from src.integrations.google_sheets import GoogleSheetsClient
+from src.integrations.publisher import TRACKER_HEADER, GooglePublisher
+from src.models.lecture_models import Assignment, EnhancedDocNotes
+from src.testing.fake_google import FakeGoogleServer
+
+
+def notes(main_topic: str) -> EnhancedDocNotes:
+    return EnhancedDocNotes(main_topic=main_topic, sub_topics=[], assignments=[])
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(google_auth, "DISCOVERY_DIR", tmp_path / "discovery")
+    with FakeGoogleServer() as server:
+        google_auth.use_backend(server.base_url, AnonymousCredentials())
+        try:
+            yield server
+        finally:
+            google_auth.use_backend(None)
+
+
+@pytest.fixture
+def publisher(server, tmp_path):
+    return GooglePublisher(GoogleDocsClient(), GoogleSheetsClient(), tmp_path / "publish_state.json")
+
+
+def test_same_named_recordings_in_different_folders_get_their_own_docs(server, publisher, tmp_path):
+    algebra = str(tmp_path / "algebra" / "week1.wav")
+    physics = str(tmp_path / "physics" / "week1.wav")
+
+    algebra_doc = publisher.publish(notes("Linear Algebra"), algebra)["doc_id"]
+    physics_doc = publisher.publish(notes("Mechanics"), physics)["doc_id"]
+
+    assert algebra_doc != physics_doc
+    assert server.documents[algebra_doc]["text"].startswith("Linear Algebra")
+    assert server.documents[physics_doc]["text"].startswith("Mechanics")
+    # republishing either one touches only its own doc
+    assert publisher.publish(notes("Linear Algebra"), algebra)["doc_id"] == algebra_doc
+
+
+def test_doc_keyed_by_stem_is_taken_over(server, tmp_path):
+    docs = GoogleDocsClient()
+    doc_id = docs.create_doc("Linear Algebra - Lecture Notes")
+    state_path = tmp_path / "publish_state.json"
+    # state written when docs were keyed by recording stem
+    state_path.write_text(json.dumps({"docs": {"week1": {"doc_id": doc_id, "content_hash": None}}}))
+    publisher = GooglePublisher(docs, GoogleSheetsClient(), state_path)
+
+    assert publisher.publish(notes("Linear Algebra"), str(tmp_path / "algebra" / "week1.wav"))["doc_id"] == doc_id
+    assert list(publisher.state["docs"]) == [str(tmp_path / "algebra" / "week1.wav")]
+    assert len(server.documents) == 1
+
+
+def test_configured_tracker_without_the_sheet_gets_it(server, tmp_path):
+    sheets = GoogleSheetsClient()
+    tracker_id = sheets.create_spreadsheet("Course planning")
+    publisher = GooglePublisher(GoogleDocsClient(), sheets, tmp_path / "publish_state.json", tracker_id=tracker_id)
+
+    publisher.queue_assignments([Assignment(title="Problem set 1", due_date="2026-10-20")])
+    assert publisher.flush() == 1
+
+    assert server.spreadsheets[tracker_id]["Assignments"] == [TRACKER_HEADER,
+                                                              ["Problem set 1", "", "2026-10-20"]]
+    # the spreadsheet's own sheets are left alone
+    assert server.spreadsheets[tracker_id]["Sheet1"] == []
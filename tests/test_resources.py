@@ -0,0 +1,25 @@
+from src.core.resources import ResourcePool
+
+
+def test_reuse_is_counted_once_per_recording(tmp_path):
+    pool = ResourcePool(data_dir=tmp_path, whisper_loader=lambda size: object())
+    for recording in ("lecture-01.wav", "lecture-02.wav", "lecture-03.wav"):
+        # a recording reaches for its model many times during one transcription
+        for _ in range(4):
+            pool.get_whisper(recording=recording)
+    pool.get_whisper()
+    pool.load_times["whisper:base"] = 2.0
+
+    assert pool.reuse_counts == {"whisper:base": 2}
+    assert pool.saved_load_seconds() == 4.0
+
+
+def test_cheap_clients_do_not_count_as_reuse(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    pool = ResourcePool(data_dir=tmp_path)
+    for _ in range(5):
+        pool.get_llm_client()
+    pool.get_llm_client().close()
+
+    assert pool.reuse_counts == {}
+    assert pool.saved_load_seconds() == 0.0
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from src.core import transcription_cache
+from src.core.transcript_store import STORE_SUFFIX, open_transcription
+from src.core.transcription_cache import TranscriptionCache
+
+RESULT = {"text": " Today we cover eigenvalues.", "language": "en",
+          "segments": [{"start": 0.0, "end": 2.5, "text": " Today we cover eigenvalues.", "tokens": [1, 2, 3]}]}
+
+
+@pytest.fixture
+def recording(tmp_path):
+    path = tmp_path / "recordings" / "lecture-01.wav"
+    path.parent.mkdir()
+    path.write_bytes(b"RIFF" + bytes(range(256)) * 16)
+    return path
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    path = tmp_path / "transcriptions"
+    path.mkdir()
+    return path
+
+
+def write_legacy(cache_dir, stem: str = "lecture-01"):
+    # how transcriptions were saved before the content-keyed index
+    (cache_dir / f"{stem}.json").write_text(json.dumps(RESULT), encoding="utf-8")
+
+
+def test_legacy_transcription_is_adopted_on_first_use(cache_dir, recording):
+    write_legacy(cache_dir)
+    cache = TranscriptionCache(cache_dir, storage_format="json")
+    assert cache.entries() == {}
+
+    key = cache.key_for(str(recording), "base", "en")
+
+    path = cache.get(key)
+    assert path == str(cache_dir / f"{key}.json")
+    assert open_transcription(path)["text"] == RESULT["text"]
+    assert not (cache_dir / "lecture-01.json").exists()
+    assert cache.entries()[key]["source"] == str(recording.resolve())
+    # the adoption survives a reopen, and is not repeated
+    reopened = TranscriptionCache(cache_dir)
+    assert reopened.get(reopened.key_for(str(recording), "base", "en")) == path
+
+
+def test_legacy_transcription_of_another_recording_is_left_alone(cache_dir, recording):
+    write_legacy(cache_dir, "lecture-02")
+    cache = TranscriptionCache(cache_dir)
+
+    assert cache.get(cache.key_for(str(recording), "base", "en")) is None
+    assert (cache_dir / "lecture-02.json").exists()
+
+
+def test_convert_keeps_legacy_and_indexed_transcriptions_indexed(cache_dir, recording):
+    write_legacy(cache_dir)
+    cache = TranscriptionCache(cache_dir, storage_format="json")
+    # keyed by hash, so the legacy file stays unadopted until its recording is keyed
+    indexed_key = cache.key_for_hash(cache.audio_hash(str(recording)), "small", "en")
+    cache.put(indexed_key, RESULT, str(recording), "small", "en")
+
+    assert cache.convert_to_store() == 2
+
+    assert cache.get(indexed_key) == str(cache_dir / f"{indexed_key}{STORE_SUFFIX}")
+    # the legacy file became a store still waiting for its recording, not an orphan
+    legacy_key = cache.key_for(str(recording), "base", "en")
+    path = cache.get(legacy_key)
+    assert path == str(cache_dir / f"{legacy_key}{STORE_SUFFIX}")
+    assert open_transcription(path).text == RESULT["text"]
+    assert sorted(p.name for p in cache_dir.iterdir()) == sorted(
+        ["index.json", f"{indexed_key}{STORE_SUFFIX}", f"{legacy_key}{STORE_SUFFIX}"])
+
+
+def test_hits_do_not_rewrite_the_index(cache_dir, recording, monkeypatch):
+    cache = TranscriptionCache(cache_dir)
+    key = cache.key_for(str(recording), "base", "en")
+    cache.put(key, RESULT, str(recording), "base", "en")
+    saves = []
+    monkeypatch.setattr(cache, "_save_index", lambda: saves.append(1))
+
+    for _ in range(5):
+        assert cache.get(key)
+    assert saves == []
+    assert cache.stats()["hits"] == 5
+
+    # an entry not used for a while is written once, on its next hit
+    later = cache.entries()[key]["last_access"] + transcription_cache.LAST_ACCESS_RESOLUTION
+    monkeypatch.setattr(transcription_cache.time, "time", lambda: later)
+    cache.get(key)
+    assert saves == [1]
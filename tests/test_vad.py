@@ -0,0 +1,35 @@
+import numpy as np
+
+from src.core.vad import SAMPLE_RATE, transcribe_with_vad
+from src.testing.synthetic_audio import synthesize_speech
+
+
+class RecordingModel:
+    # stands in for a Whisper model and remembers how much audio it was given
+    def __init__(self):
+        self.decoded_seconds = 0.0
+
+    def transcribe(self, audio, **kwargs):
+        self.decoded_seconds += len(audio) / SAMPLE_RATE
+        return {"text": "", "segments": [], "language": "en"}
+
+
+def test_silent_recording_is_decoded_whole_and_claims_no_saving():
+    model = RecordingModel()
+    result = transcribe_with_vad(model, "silence.wav", "en", audio=np.zeros(SAMPLE_RATE * 20, dtype=np.float32))
+
+    assert model.decoded_seconds == 20.0
+    assert result["vad"]["speech_seconds"] == result["vad"]["original_seconds"] == 20.0
+    assert result["vad"]["skipped_fraction"] == 0.0
+    assert result["vad"]["estimated_speedup"] == 1.0
+
+
+def test_recording_below_the_skip_threshold_is_decoded_whole_and_claims_no_saving():
+    model = RecordingModel()
+    audio = synthesize_speech(30, seed=3)
+    # its pauses fall short of the trimming threshold
+    result = transcribe_with_vad(model, "lecture.wav", "en", audio=audio, min_skip_fraction=0.99)
+
+    assert model.decoded_seconds == len(audio) / SAMPLE_RATE
+    assert result["vad"]["skipped_fraction"] == 0.0
+    assert result["vad"]["estimated_speedup"] == 1.0